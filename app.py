@@ -23,6 +23,9 @@ else:
 from flask import Flask, request
 from cloud_sql_config import CloudSQLConfig as Config
 from models import db
+from json_provider import ProveedorJSONRapido
+from invalidation_bus import configurar_bus
+from email_outbox import configurar_correos
 from flask_jwt_extended import JWTManager
 from routes import api, auth
 from flask_cors import CORS
@@ -33,6 +36,9 @@ def create_app():
     # Configuración
     app.config.from_object(Config)
     
+    # JSON con orjson si está instalado (ver json_provider.py)
+    app.json = ProveedorJSONRapido(app)
+    
     # Inicializar extensiones
     db.init_app(app)
     jwt = JWTManager(app)
@@ -59,6 +65,12 @@ def create_app():
     app.register_blueprint(api, url_prefix='/api')
     app.register_blueprint(auth, url_prefix='/api/auth')
     
+    # Avisos de invalidación de cachés entre instancias (ver invalidation_bus.py)
+    configurar_bus(app)
+    
+    # Envío de la bandeja de salida de correos (ver email_outbox.py)
+    configurar_correos(app)
+    
     @app.before_request
     def handle_preflight():
         if request.method == "OPTIONS":
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Simulación de la asignación automática de tickets
+
+Reproduce un flujo de tickets en un departamento sobre una base SQLite en
+memoria: llega un ticket por paso, se asigna a un agente y se cierra después
+de un tiempo aleatorio que depende de la velocidad del agente (algunos
+resuelven más rápido que otros). Compara la asignación anterior
+(random.choice sobre todos los agentes del departamento) con
+ticket_assignment.elegir_agente (menos tickets abiertos, por turnos en
+empate) y muestra la dispersión de la carga: diferencia entre el agente con
+más y con menos tickets abiertos, y el tiempo por asignación.
+
+Uso:
+    python benchmark_asignacion.py [tickets] [agentes] [pasos_para_cerrar]
+"""
+import heapq
+import random
+import statistics
+import sys
+import time
+from datetime import date
+from flask import Flask
+from models import (db, Usuario, Ticket, TicketEstado, TicketPrioridad, Departamento, Sucursal, Categoria,
+                    Rol, Estado, PerfilUsuario, ticket_pivot_departamento_agente)
+from ticket_assignment import elegir_agente
+
+SEMILLA = 7
+ID_DEPARTAMENTO = 1
+ABIERTO, CERRADO = 1, 2
+
+
+def crear_app():
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app)
+    return app
+
+
+def poblar(agentes):
+    db.create_all()
+    db.session.add_all([
+        Rol(id=1, nombre='AGENTE'), Estado(id=1, nombre='ACTIVO'), PerfilUsuario(id=1, nombre='Agente'),
+        TicketEstado(id=ABIERTO, nombre='Abierto'), TicketEstado(id=CERRADO, nombre='Cerrado'),
+        TicketPrioridad(id=1, nombre='Baja'), Sucursal(id=1, nombre='Central'),
+        Departamento(id=ID_DEPARTAMENTO, nombre='Informática'),
+    ])
+    db.session.flush()
+    db.session.add(Categoria(id='general', nombre='General', id_departamento=ID_DEPARTAMENTO))
+    for i in range(agentes):
+        id_agente = f'agente{i:02d}'
+        db.session.add(Usuario(
+            id=id_agente, usuario=id_agente, nombre=f'Agente {i}', apellido_paterno='Prueba', clave='-',
+            fecha_creacion=date.today(), id_estado=1, correo=f'{id_agente}@lahornilla.cl', id_rol=1,
+            id_perfil=1, id_sucursalactiva=1,
+        ))
+        db.session.flush()
+        db.session.execute(ticket_pivot_departamento_agente.insert().values(
+            id_usuario=id_agente, id_departamento=ID_DEPARTAMENTO))
+    db.session.commit()
+
+
+def eleccion_aleatoria(id_departamento):
+    """Asignación anterior de create_ticket"""
+    agentes = Usuario.query.join(ticket_pivot_departamento_agente).filter(
+        ticket_pivot_departamento_agente.c.id_departamento == id_departamento
+    ).all()
+    return str(random.choice(agentes).id) if agentes else None
+
+
+def simular(nombre, elegir, tickets, agentes, pasos_para_cerrar):
+    random.seed(SEMILLA)
+    # Velocidad de cada agente: los más lentos tardan hasta el triple en cerrar
+    velocidades = {f'agente{i:02d}': random.uniform(0.6, 1.8) for i in range(agentes)}
+    app = crear_app()
+    with app.app_context():
+        poblar(agentes)
+        abiertos = {agente: 0 for agente in velocidades}
+        cierres = []  # (paso de cierre, id ticket, agente)
+        diferencias, tiempo_eleccion = [], 0.0
+
+        for paso in range(tickets):
+            while cierres and cierres[0][0] <= paso:
+                _, id_ticket, agente = heapq.heappop(cierres)
+                db.session.get(Ticket, id_ticket).id_estado = CERRADO
+                abiertos[agente] -= 1
+
+            inicio = time.perf_counter()
+            agente = elegir(ID_DEPARTAMENTO)
+            tiempo_eleccion += time.perf_counter() - inicio
+
+            ticket = Ticket(
+                id_usuario=agente, id_agente=agente, id_sucursal=1, id_estado=ABIERTO, id_prioridad=1,
+                id_departamento=ID_DEPARTAMENTO, id_categoria='general', titulo=f'Ticket {paso}', descripcion='-',
+            )
+            db.session.add(ticket)
+            db.session.commit()
+            abiertos[agente] += 1
+            duracion = random.expovariate(1 / pasos_para_cerrar) / velocidades[agente]
+            heapq.heappush(cierres, (paso + duracion, ticket.id, agente))
+
+            # Se mide después del calentamiento (cuando ya hay tickets cerrándose)
+            if paso >= pasos_para_cerrar * 2:
+                diferencias.append(max(abiertos.values()) - min(abiertos.values()))
+
+        finales = sorted(abiertos.values())
+        db.session.remove()
+        db.drop_all()
+
+    print(f"🔹 {nombre}")
+    print(f"   diferencia entre el agente más y menos cargado: promedio {statistics.mean(diferencias):.1f}, "
+          f"máximo {max(diferencias)}")
+    print(f"   tickets abiertos al final por agente: {finales}")
+    print(f"   tiempo por asignación: {tiempo_eleccion / tickets * 1000:.2f} ms")
+    return statistics.mean(diferencias)
+
+
+def ejecutar_benchmark(tickets=3000, agentes=8, pasos_para_cerrar=80):
+    print(f"📊 {tickets} tickets, {agentes} agentes, cierre en ~{pasos_para_cerrar} pasos (según la velocidad del agente)")
+    aleatoria = simular("Aleatoria (random.choice)", eleccion_aleatoria, tickets, agentes, pasos_para_cerrar)
+    por_carga = simular("Por carga (ticket_assignment)", elegir_agente, tickets, agentes, pasos_para_cerrar)
+    print(f"   ➜ diferencia promedio de carga: {aleatoria:.1f} → {por_carga:.1f} tickets abiertos")
+
+
+if __name__ == "__main__":
+    tickets = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    agentes = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    pasos_para_cerrar = float(sys.argv[3]) if len(sys.argv) > 3 else 80
+    ejecutar_benchmark(tickets, agentes, pasos_para_cerrar)
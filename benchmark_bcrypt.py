@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark de logins concurrentes con y sin el pool de bcrypt
+
+Simula un worker de gunicorn con HILOS hilos que recibe una ráfaga de logins
+(LOGINS_POR_SEGUNDO) mientras llegan peticiones livianas cada 10 ms. Mide
+los logins completados por segundo, los rechazados con 503 y la latencia
+p50/p99 de las peticiones livianas (desde que llegan hasta que terminan,
+incluida la espera por un hilo libre).
+
+Sin pool el hash se calcula en el hilo de la petición; con pool, en los
+procesos de password_hashing.py (BCRYPT_PROCESOS, BCRYPT_COLA).
+
+Uso:
+    python benchmark_bcrypt.py [segundos] [logins_por_segundo] [rounds]
+"""
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, jsonify, request
+from password_hashing import generar_hash, verificar_clave, HashSaturado, cerrar_pool
+
+# Igual que el Dockerfile: 1 worker con 4 hilos
+HILOS = 4
+INTERVALO_LIVIANAS = 0.01
+
+
+def crear_app(procesos, cola, rounds):
+    app = Flask(__name__)
+    app.config.update(BCRYPT_PROCESOS=procesos, BCRYPT_COLA=cola, BCRYPT_ROUNDS=rounds)
+    with app.app_context():
+        hash_guardado = generar_hash('clave-de-prueba')
+
+    @app.route('/login', methods=['POST'])
+    def login():
+        try:
+            if not verificar_clave(request.get_json()['clave'], hash_guardado):
+                return jsonify({'message': 'Credenciales inválidas'}), 401
+            return jsonify({'access_token': 'x'}), 200
+        except HashSaturado:
+            return jsonify({'error': 'Servidor ocupado'}), 503, {'Retry-After': '1'}
+
+    @app.route('/tickets', methods=['GET'])
+    def tickets():
+        # Trabajo típico de una petición liviana: serializar un listado pequeño
+        return jsonify([{'id': i, 'titulo': f'Ticket {i}', 'estado': 'Abierto'} for i in range(200)])
+
+    return app
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))] if ordenados else 0
+
+
+def ejecutar_escenario(nombre, procesos, cola, segundos, logins_por_segundo, rounds):
+    cerrar_pool()
+    app = crear_app(procesos, cola, rounds)
+    cliente = app.test_client()
+    if procesos > 0:
+        # Arranca los procesos del pool antes de medir
+        with app.app_context():
+            verificar_clave('x', generar_hash('x'))
+
+    def peticion(metodo, url, llegada, **kwargs):
+        respuesta = getattr(cliente, metodo)(url, **kwargs)
+        return respuesta.status_code, time.perf_counter() - llegada
+
+    logins, livianas = [], []
+    cuerpo = json.dumps({'clave': 'clave-de-prueba'})
+    with ThreadPoolExecutor(max_workers=HILOS) as hilos:
+        inicio = time.perf_counter()
+        siguiente_login = siguiente_liviana = inicio
+        while (ahora := time.perf_counter()) - inicio < segundos:
+            if ahora >= siguiente_login:
+                logins.append(hilos.submit(peticion, 'post', '/login', ahora, data=cuerpo, content_type='application/json'))
+                siguiente_login += 1 / logins_por_segundo
+            if ahora >= siguiente_liviana:
+                livianas.append(hilos.submit(peticion, 'get', '/tickets', ahora))
+                siguiente_liviana += INTERVALO_LIVIANAS
+            time.sleep(0.001)
+        resultados_login = [f.result() for f in logins]
+        resultados_livianas = [f.result() for f in livianas]
+        duracion = time.perf_counter() - inicio
+
+    exitosos = sum(1 for estado, _ in resultados_login if estado == 200)
+    rechazados = sum(1 for estado, _ in resultados_login if estado == 503)
+    latencias = [t * 1000 for _, t in resultados_livianas]
+    print(f"🔹 {nombre}")
+    print(f"   logins exitosos: {exitosos} ({exitosos / duracion:.1f}/s), rechazados con 503: {rechazados}")
+    print(f"   peticiones livianas: {len(latencias)}, p50 {percentil(latencias, 50):.1f} ms, p99 {percentil(latencias, 99):.1f} ms")
+    return latencias
+
+
+def ejecutar_benchmark(segundos=5, logins_por_segundo=10, rounds=12):
+    print(f"📊 {HILOS} hilos, {logins_por_segundo} logins/s durante {segundos} s, bcrypt rounds={rounds}")
+    sin_pool = ejecutar_escenario("Sin pool (bcrypt en el hilo de la petición)", 0, 0, segundos, logins_por_segundo, rounds)
+    con_pool = ejecutar_escenario("Con pool (2 procesos, cola de 1)", 2, 1, segundos, logins_por_segundo, rounds)
+    print(f"   ➜ p99 de peticiones livianas: {percentil(sin_pool, 99):.1f} ms → {percentil(con_pool, 99):.1f} ms")
+    cerrar_pool()
+
+
+if __name__ == "__main__":
+    segundos = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    logins_por_segundo = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 12
+    ejecutar_benchmark(segundos, logins_por_segundo, rounds)
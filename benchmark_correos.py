@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Benchmark del envío de correos: un hilo y una conexión por correo contra la
+bandeja de salida con una conexión reutilizada
+
+Usa el servidor de smtp_local.py con una latencia por conexión que simula
+la conexión, STARTTLS y login de un servidor real, otra por correo y un
+límite de conexiones simultáneas (los proveedores responden 421 al pasarlo).
+- Anterior: enviar_correo_async abría un hilo y una conexión SMTP por
+  destinatario (todas en paralelo); un correo rechazado se perdía.
+- Bandeja: los correos se encolan en ticket_fact_correo (SQLite en un
+  archivo temporal) en transacciones de dos correos, como create_ticket, y
+  EnviadorCorreos los envía por lotes por una sola conexión.
+Muestra el tiempo total, los correos por segundo, las conexiones abiertas y
+los correos perdidos.
+Luego repite la bandeja con rechazos temporales para mostrar los
+reintentos, y simula una ráfaga de novedades (comentarios, cambios de
+estado) sobre pocos tickets durante un incidente: correos enviados sin
+agrupar, agrupados por destinatario y ticket (CORREO_AGRUPACION) y en
+resumen periódico (CORREO_RESUMEN).
+
+Uso:
+    python benchmark_correos.py [correos] [latencia_conexion] [latencia_envio] [max_conexiones]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from flask import Flask
+import email_outbox
+from email_outbox import (ConexionSMTP, EnviadorCorreos, encolar_correo, agrupacion_ticket, PENDIENTE, ENVIADO,
+                          FALLIDO)
+from models import db, CorreoSalida
+from smtp_local import ServidorSMTPLocal
+from utils import construir_mensaje
+
+CUERPO = "<h1>Nuevo Ticket Creado</h1>" + "<p>Detalle del ticket de prueba.</p>" * 20
+
+
+def conexion_local(servidor):
+    return ConexionSMTP('127.0.0.1', servidor.puerto, 'local', 'local', starttls=False)
+
+
+def envio_anterior(correos, latencia_conexion, latencia_envio, max_conexiones):
+    """Un hilo y una conexión por correo, como el enviar_correo_async anterior"""
+    servidor = ServidorSMTPLocal(0, latencia_conexion=latencia_conexion, latencia_envio=latencia_envio,
+                                 max_conexiones=max_conexiones).iniciar()
+
+    def enviar(i):
+        try:
+            conexion = conexion_local(servidor)
+            conexion.enviar(construir_mensaje(f"usuario{i}@lahornilla.cl", f"Ticket {i}", CUERPO))
+            conexion.cerrar()
+        except Exception:
+            pass  # enviar_correo solo lo anotaba en el log
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=enviar, args=(i,), daemon=True) for i in range(correos)]
+    for hilo in hilos:
+        hilo.start()
+    en_peticion = time.perf_counter() - inicio
+    for hilo in hilos:
+        hilo.join()
+    total = time.perf_counter() - inicio
+    contadores = dict(servidor.contadores)
+    servidor.detener()
+    return en_peticion, total, contadores
+
+
+def crear_app(ruta):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f'sqlite:///{ruta}', SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def envio_bandeja(app, correos, latencia_conexion, latencia_envio, max_conexiones, rechazo=0.0):
+    servidor = ServidorSMTPLocal(0, latencia_conexion=latencia_conexion, latencia_envio=latencia_envio,
+                                 rechazo=rechazo, max_conexiones=max_conexiones).iniciar()
+    enviador = EnviadorCorreos(conexion_local(servidor))
+    with app.app_context():
+        db.session.execute(CorreoSalida.__table__.delete())
+        db.session.commit()
+
+        inicio = time.perf_counter()
+        for i in range(0, correos, 2):
+            # Creador y agente de un ticket, en la transacción del ticket
+            encolar_correo(f"usuario{i}@lahornilla.cl", f"Ticket {i}", CUERPO)
+            encolar_correo(f"agente{i}@lahornilla.cl", f"Ticket {i}", CUERPO)
+            db.session.commit()
+        en_peticion = time.perf_counter() - inicio
+
+        while db.session.query(CorreoSalida).filter(CorreoSalida.estado == PENDIENTE).count():
+            if not enviador.procesar_lote(app):
+                # Solo quedan correos esperando su reintento: se adelantan
+                db.session.query(CorreoSalida).filter(CorreoSalida.estado == PENDIENTE).update(
+                    {CorreoSalida.proximo_intento: CorreoSalida.fecha_creacion})
+                db.session.commit()
+        total = time.perf_counter() - inicio
+
+        estados = {estado: db.session.query(CorreoSalida).filter(CorreoSalida.estado == estado).count()
+                   for estado in (ENVIADO, FALLIDO)}
+        reintentos = db.session.query(db.func.sum(CorreoSalida.intentos)).scalar() or 0
+    enviador.conexion.cerrar()
+    contadores = dict(servidor.contadores)
+    servidor.detener()
+    return en_peticion, total, contadores, estados, reintentos
+
+
+def rafaga_de_novedades(app, novedades, tickets, agentes, modo, latencia_conexion, latencia_envio):
+    """Novedades de tickets al azar, cada una al creador y al agente del ticket"""
+    servidor = ServidorSMTPLocal(0, latencia_conexion=latencia_conexion, latencia_envio=latencia_envio).iniciar()
+    enviador = EnviadorCorreos(conexion_local(servidor))
+    app.config['CORREO_RESUMEN'] = 15 if modo == 'resumen' else 0
+    random.seed(3)
+    with app.app_context():
+        db.session.execute(CorreoSalida.__table__.delete())
+        db.session.commit()
+        for i in range(novedades):
+            id_ticket = random.randrange(tickets)
+            agrupacion = agrupacion_ticket(id_ticket) if modo != 'sin agrupar' else None
+            for destinatario in (f"usuario{id_ticket}@lahornilla.cl", f"agente{id_ticket % agentes}@lahornilla.cl"):
+                encolar_correo(destinatario, f"Nuevo Comentario en el Ticket {id_ticket}", CUERPO, agrupacion=agrupacion)
+            db.session.commit()
+
+        inicio = time.perf_counter()
+        while db.session.query(CorreoSalida).filter(CorreoSalida.estado == PENDIENTE).count():
+            if not enviador.procesar_lote(app):
+                # Se adelanta el cierre de la ventana (o la hora del resumen)
+                db.session.query(CorreoSalida).filter(CorreoSalida.estado == PENDIENTE).update(
+                    {CorreoSalida.proximo_intento: CorreoSalida.fecha_creacion})
+                db.session.commit()
+        total = time.perf_counter() - inicio
+    enviador.conexion.cerrar()
+    app.config['CORREO_RESUMEN'] = 0
+    recibidos = servidor.contadores['recibidos']
+    servidor.detener()
+    return recibidos, total
+
+
+def ejecutar_benchmark(correos=400, latencia_conexion=0.3, latencia_envio=0.005, max_conexiones=10):
+    print(f"📊 {correos} correos, {latencia_conexion * 1000:.0f} ms por conexión (TLS y login), "
+          f"{latencia_envio * 1000:.0f} ms por correo, máximo {max_conexiones} conexiones simultáneas")
+
+    en_peticion, total, contadores = envio_anterior(correos, latencia_conexion, latencia_envio, max_conexiones)
+    print("🔹 Anterior (un hilo y una conexión por correo)")
+    print(f"   tiempo en las peticiones: {en_peticion * 1000:.0f} ms, hasta terminar: {total:.2f} s "
+          f"({contadores['recibidos'] / total:.0f} correos entregados/s)")
+    print(f"   conexiones SMTP: {contadores['conexiones']}, recibidos: {contadores['recibidos']}, "
+          f"perdidos: {correos - contadores['recibidos']}")
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        app = crear_app(os.path.join(carpeta, 'correos.db'))
+        en_peticion, total, contadores, estados, _ = envio_bandeja(app, correos, latencia_conexion, latencia_envio,
+                                                           max_conexiones)
+        print("🔹 Bandeja de salida (email_outbox)")
+        print(f"   tiempo en las peticiones: {en_peticion * 1000:.0f} ms, hasta terminar: {total:.2f} s "
+              f"({contadores['recibidos'] / total:.0f} correos entregados/s)")
+        print(f"   conexiones SMTP: {contadores['conexiones']}, recibidos: {contadores['recibidos']}, "
+              f"perdidos: {correos - contadores['recibidos']}")
+
+        email_outbox.RETRASO_BASE = 0
+        _, total, contadores, estados, intentos = envio_bandeja(app, correos, latencia_conexion, latencia_envio,
+                                                                max_conexiones, rechazo=0.2)
+        print("🔹 Bandeja con 20% de rechazos temporales (451)")
+        print(f"   enviados: {estados[ENVIADO]}, fallidos: {estados[FALLIDO]}, reintentos: {intentos}, "
+              f"conexiones SMTP: {contadores['conexiones']}, {total:.2f} s")
+
+        novedades, tickets, agentes = correos, max(correos // 20, 1), 5
+        print(f"🔹 Ráfaga de {novedades} novedades en {tickets} tickets ({agentes} agentes): "
+              f"{novedades * 2} notificaciones")
+        for modo in ('sin agrupar', 'agrupado', 'resumen'):
+            recibidos, total = rafaga_de_novedades(app, novedades, tickets, agentes, modo, latencia_conexion,
+                                                   latencia_envio)
+            print(f"   {modo}: {recibidos} correos enviados en {total:.2f} s")
+
+
+if __name__ == "__main__":
+    correos = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    latencia_conexion = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    latencia_envio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.005
+    max_conexiones = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+    ejecutar_benchmark(correos, latencia_conexion, latencia_envio, max_conexiones)
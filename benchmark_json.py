@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de la codificación JSON del listado de tickets
+
+Compara, sobre un listado sintético de tickets, el camino anterior
+(astimezone + strftime por fecha y proveedor JSON estándar de Flask) con el
+actual (date_formatting.formatear_fecha y ProveedorJSONRapido).
+
+Uso:
+    python benchmark_json.py [cantidad_tickets] [repeticiones]
+"""
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from models import CHILE_TZ, Usuario
+from date_formatting import formatear_fecha
+from json_provider import ProveedorJSONRapido
+
+Fila = namedtuple('Fila', [
+    'id', 'titulo', 'descripcion', 'id_usuario', 'id_agente', 'usuario', 'agente', 'estado',
+    'prioridad', 'departamento', 'id_departamento', 'id_categoria', 'categoria', 'sucursal',
+    'fecha_creacion', 'fecha_cierre', 'adjunto', 'id_prioridad', 'id_estado'
+])
+
+
+def generar_filas(cantidad):
+    """Filas con la forma del listado, con fechas repartidas en ~2 años"""
+    inicio = datetime(2023, 1, 1)
+    filas = []
+    for i in range(cantidad):
+        creacion = inicio + timedelta(minutes=97 * i)
+        filas.append(Fila(
+            id=i + 1,
+            titulo=f'Problema con impresora {i}',
+            descripcion='La impresora de la oficina no imprime. ' * 4,
+            id_usuario=f'usuario-{i % 300}',
+            id_agente=f'agente-{i % 12}' if i % 5 else None,
+            usuario=('María', 'González', 'Pérez'),
+            agente=('Juan', 'Soto', None) if i % 5 else None,
+            estado=['Abierto', 'En Proceso', 'Cerrado'][i % 3],
+            prioridad=['Baja', 'Media', 'Alta'][i % 3],
+            departamento='TI',
+            id_departamento=1 + i % 4,
+            id_categoria=f'categoria-{i % 20}',
+            categoria='Hardware',
+            sucursal='SANTA VICTORIA',
+            fecha_creacion=creacion,
+            fecha_cierre=creacion + timedelta(hours=30) if i % 3 == 2 else None,
+            adjunto=None,
+            id_prioridad=1 + i % 3,
+            id_estado=1 + i % 3,
+        ))
+    return filas
+
+
+def formato_anterior(fecha):
+    return fecha.astimezone(CHILE_TZ).strftime('%Y-%m-%d %H:%M:%S') if fecha else None
+
+
+def serializar(filas, formatear):
+    return [{
+        'id': f.id,
+        'titulo': f.titulo,
+        'descripcion': f.descripcion,
+        'id_usuario': f.id_usuario,
+        'id_agente': f.id_agente,
+        'usuario': Usuario.formatear_nombre(*f.usuario),
+        'agente': Usuario.formatear_nombre(*f.agente) if f.agente else "Sin asignar",
+        'estado': f.estado,
+        'prioridad': f.prioridad,
+        'departamento': f.departamento,
+        'id_departamento': f.id_departamento,
+        'id_categoria': f.id_categoria,
+        'categoria': f.categoria,
+        'sucursal': f.sucursal,
+        'fecha_creacion': formatear(f.fecha_creacion),
+        'fecha_cierre': formatear(f.fecha_cierre),
+        'adjunto': f.adjunto,
+        'id_prioridad': f.id_prioridad,
+        'id_estado': f.id_estado,
+    } for f in filas]
+
+
+def medir(nombre, funcion, repeticiones):
+    """Ejecuta la función varias veces y devuelve el mejor tiempo en ms"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    mejor = min(tiempos)
+    print(f"   {nombre:<38} {mejor:9.1f} ms")
+    return mejor
+
+
+def ejecutar_benchmark(cantidad=10000, repeticiones=5):
+    app = Flask(__name__)
+    estandar = DefaultJSONProvider(app)
+    rapido = ProveedorJSONRapido(app)
+    filas = generar_filas(cantidad)
+
+    print(f"📊 Listado sintético de {cantidad} tickets, mejor de {repeticiones} repeticiones")
+    if not rapido.disponible:
+        print("⚠️  orjson no está instalado: ProveedorJSONRapido usa el codificador estándar")
+
+    # Mismo resultado con ambos caminos
+    assert serializar(filas, formato_anterior) == serializar(filas, formatear_fecha)
+    assert estandar.loads(rapido.dumps(serializar(filas[:100], formatear_fecha))) == serializar(filas[:100], formatear_fecha)
+
+    print("🔹 Formato de fechas")
+    fechas = [f.fecha_creacion for f in filas] + [f.fecha_cierre for f in filas]
+    antes = medir("astimezone + strftime", lambda: [formato_anterior(f) for f in fechas], repeticiones)
+    ahora = medir("formatear_fecha", lambda: [formatear_fecha(f) for f in fechas], repeticiones)
+    print(f"   ➜ {antes / ahora:.1f}x")
+
+    print("🔹 Codificación JSON (listado ya serializado)")
+    datos = serializar(filas, formatear_fecha)
+    antes = medir("DefaultJSONProvider.dumps", lambda: estandar.dumps(datos), repeticiones)
+    ahora = medir("ProveedorJSONRapido.dumps", lambda: rapido.dumps(datos), repeticiones)
+    print(f"   ➜ {antes / ahora:.1f}x")
+
+    print("🔹 Camino completo (filas → cuerpo de la respuesta)")
+    with app.app_context():
+        antes = medir("anterior", lambda: estandar.response(serializar(filas, formato_anterior)).get_data(), repeticiones)
+        ahora = medir("actual", lambda: rapido.response(serializar(filas, formatear_fecha)).get_data(), repeticiones)
+    print(f"   ➜ {antes / ahora:.1f}x")
+
+
+if __name__ == "__main__":
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    ejecutar_benchmark(cantidad, repeticiones)
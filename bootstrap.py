@@ -0,0 +1,95 @@
+"""
+Datos de arranque del frontend en una sola respuesta (/api/bootstrap)
+
+Al cargar, el frontend pedía uno por uno los catálogos (prioridades, estados,
+departamentos, sucursales, roles, estados de usuario), las apps del usuario y
+las categorías de cada departamento. obtener_bootstrap() arma todo eso más el
+perfil y los permisos del usuario, con la misma forma que esas rutas.
+
+El ETag se calcula con los ámbitos de ambitos_bootstrap(): catálogos,
+usuarios (nombres de responsables y el propio perfil) y la autorización del
+usuario. Los datos se leen de la base de datos y no de catalog_cache: el
+caché de otro proceso puede tener hasta CATALOGOS_CACHE_TTL segundos de
+atraso y el cliente quedaría con datos viejos bajo un ETag nuevo.
+"""
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from models import db, TicketPrioridad, TicketEstado, Departamento, Sucursal, Rol, Categoria, App, Usuario
+from change_versions import AMBITO_CATALOGOS, AMBITO_USUARIOS, ambito_autorizacion
+
+# Mismos valores que /usuarios/estados
+ESTADOS_USUARIO = [
+    {"id": 1, "nombre": "ACTIVO"},
+    {"id": 2, "nombre": "INACTIVO"}
+]
+
+
+def ambitos_bootstrap(principal):
+    return [AMBITO_CATALOGOS, AMBITO_USUARIOS, ambito_autorizacion(principal.id)]
+
+
+def _id_nombre(modelo, orden=None):
+    filas = db.session.execute(select(modelo.id, modelo.nombre).order_by(orden or modelo.id))
+    return [{'id': id, 'nombre': nombre} for id, nombre in filas]
+
+
+def _categorias():
+    responsable = aliased(Usuario)
+    filas = db.session.execute(
+        select(Categoria, responsable).outerjoin(responsable, Categoria.id_usuario == responsable.id)
+        .order_by(Categoria.id_departamento, Categoria.nombre)
+    )
+    return [{
+        'id': c.id,
+        'nombre': c.nombre,
+        'id_departamento': c.id_departamento,
+        'id_usuario': c.id_usuario,
+        'usuario_responsable': r.nombre_completo if r else None,
+        'plantilla_descripcion': c.plantilla_descripcion
+    } for c, r in filas]
+
+
+def _apps(ids):
+    if not ids:
+        return []
+    apps = db.session.execute(select(App).where(App.id.in_(ids)).order_by(App.id)).scalars()
+    return [{
+        'id': app.id,
+        'nombre': app.nombre,
+        'descripcion': app.descripcion,
+        'url': app.URL
+    } for app in apps]
+
+
+def obtener_bootstrap(principal):
+    """Catálogos, perfil y permisos del usuario autenticado"""
+    usuario = principal.usuario
+    sucursales = _id_nombre(Sucursal)
+    nombres_sucursal = {s['id']: s['nombre'] for s in sucursales}
+    return {
+        'usuario': {
+            'id': usuario.id,
+            'usuario': usuario.usuario,
+            'nombre': usuario.nombre_completo,
+            'correo': usuario.correo,
+            'rol': principal.rol,
+            'sucursal_activa': {
+                'id': usuario.id_sucursalactiva,
+                'nombre': nombres_sucursal.get(usuario.id_sucursalactiva, "No asignada")
+            },
+        },
+        'permisos': {
+            'rol': principal.rol,
+            'departamentos': list(principal.departamentos),
+            'sucursales': list(principal.sucursales),
+            'apps': sorted(principal.apps),
+        },
+        'apps': _apps(principal.apps),
+        'prioridades': _id_nombre(TicketPrioridad),
+        'estados': _id_nombre(TicketEstado),
+        'departamentos': _id_nombre(Departamento, Departamento.nombre),
+        'sucursales': sucursales,
+        'roles': [{'id': r['id'], 'rol': r['nombre']} for r in _id_nombre(Rol)],
+        'estados_usuario': ESTADOS_USUARIO,
+        'categorias': _categorias(),
+    }
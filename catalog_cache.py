@@ -0,0 +1,147 @@
+"""
+Caché en memoria de los catálogos (estados, prioridades, roles, departamentos,
+sucursales, categorías, apps y estados de usuario)
+
+Estas tablas cambian pocas veces al mes, pero se consultaban en casi cada
+escritura ("Abierto", "Baja", el rol "AGENTE", la sucursal del correo...).
+Cada catálogo se lee completo en una consulta y se guarda como filas
+inmutables por CATALOGOS_CACHE_TTL segundos (300 por defecto). Cada alta,
+cambio o eliminación por el ORM publica un aviso en el canal "catalogos" de
+invalidation_bus.py: todas las instancias descartan ese catálogo después del
+commit. Los cambios hechos fuera de esta API se ven al vencer el TTL.
+
+Las búsquedas por nombre no distinguen mayúsculas, igual que la collation de
+MySQL que usaban las consultas filter_by(nombre=...).
+
+Cada catálogo tiene una generación que invalidar_catalogos incrementa. Al
+empezar una transacción la sesión anota las generaciones de ese momento, y
+una carga solo se guarda si su catálogo no se invalidó desde entonces: la
+lectura puede ver el estado del inicio de la transacción (REPEATABLE READ) o
+terminar después de la invalidación, y en los dos casos se descarta.
+"""
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from models import db, TicketEstado, TicketPrioridad, Rol, Departamento, Sucursal, Categoria, App, Estado
+from invalidation_bus import publicar, suscribir, CLAVE_SESION as CLAVE_AVISOS
+
+CATALOGOS = {
+    'estado': TicketEstado,
+    'prioridad': TicketPrioridad,
+    'rol': Rol,
+    'departamento': Departamento,
+    'sucursal': Sucursal,
+    'categoria': Categoria,
+    'app': App,
+    'estado_usuario': Estado,
+}
+
+TTL_POR_DEFECTO = 300
+
+CANAL = 'catalogos'
+
+CLAVE_SESION = 'generaciones_catalogos'
+
+# catalogo -> (vence, {id: fila}, {nombre normalizado: id})
+_catalogos = {}
+# catalogo -> cantidad de invalidaciones
+_generaciones = dict.fromkeys(CATALOGOS, 0)
+_candado = threading.Lock()
+
+
+def _normalizar(nombre):
+    return nombre.strip().casefold() if isinstance(nombre, str) else nombre
+
+
+@event.listens_for(Session, 'after_begin')
+def _anotar_generaciones(session, transaction, connection):
+    if not transaction.nested:
+        session.info[CLAVE_SESION] = dict(_generaciones)
+
+
+def _cargar(catalogo):
+    ahora = time.monotonic()
+    guardado = _catalogos.get(catalogo)
+    if guardado and guardado[0] > ahora:
+        return guardado
+    tabla = CATALOGOS[catalogo].__table__
+    filas = db.session.execute(select(*tabla.columns)).all()
+    por_id = {fila.id: fila for fila in filas}
+    por_nombre = {}
+    for fila in sorted(filas, key=lambda f: f.id, reverse=True):
+        # Con nombres repetidos gana el de menor id, como el .first() de las consultas anteriores
+        por_nombre[_normalizar(fila.nombre)] = fila.id
+    ttl = current_app.config.get('CATALOGOS_CACHE_TTL', TTL_POR_DEFECTO)
+    guardado = (ahora + ttl, por_id, por_nombre)
+    generaciones = db.session.info.get(CLAVE_SESION, {})
+    # Tampoco se guarda lo que esta misma transacción modificó y aún no confirma
+    propio = (CANAL, catalogo) in db.session.info.get(CLAVE_AVISOS, ())
+    with _candado:
+        if generaciones.get(catalogo) == _generaciones[catalogo] and not propio:
+            _catalogos[catalogo] = guardado
+    return guardado
+
+
+def _clave(catalogo, id):
+    """Convierte el id al tipo de la columna (los ids pueden llegar como texto en el JSON)"""
+    if id is None:
+        return None
+    try:
+        return CATALOGOS[catalogo].__table__.c.id.type.python_type(id)
+    except (TypeError, ValueError):
+        return None
+
+
+def obtener_fila(catalogo, id):
+    """Fila del catálogo (con todas sus columnas como atributos) o None"""
+    return _cargar(catalogo)[1].get(_clave(catalogo, id))
+
+
+def filas(catalogo):
+    """Todas las filas del catálogo, ordenadas por id"""
+    return sorted(_cargar(catalogo)[1].values(), key=lambda f: f.id)
+
+
+def nombre_por_id(catalogo, id, defecto=None):
+    fila = obtener_fila(catalogo, id)
+    return fila.nombre if fila else defecto
+
+
+def id_por_nombre(catalogo, nombre):
+    return _cargar(catalogo)[2].get(_normalizar(nombre))
+
+
+def fila_por_nombre(catalogo, nombre):
+    return obtener_fila(catalogo, id_por_nombre(catalogo, nombre))
+
+
+def invalidar_catalogos(*catalogos):
+    """Descarta los catálogos indicados (todos si no se indica ninguno); se recargan en el próximo uso"""
+    with _candado:
+        for catalogo in catalogos or list(CATALOGOS):
+            _catalogos.pop(catalogo, None)
+            if catalogo in _generaciones:
+                _generaciones[catalogo] += 1
+
+
+# 🔹 Invalidación en todas las instancias al escribir un catálogo
+def _catalogo_modificado(mapper, connection, objeto):
+    publicar(CANAL, _nombres[type(objeto)], object_session(objeto))
+
+
+def _catalogo_actualizado(mapper, connection, objeto):
+    # after_update también se dispara si solo cambió una relación (por ejemplo, los agentes de un departamento)
+    sesion = object_session(objeto)
+    if sesion.is_modified(objeto, include_collections=False):
+        publicar(CANAL, _nombres[type(objeto)], sesion)
+
+
+_nombres = {modelo: catalogo for catalogo, modelo in CATALOGOS.items()}
+for _modelo in CATALOGOS.values():
+    event.listen(_modelo, 'after_insert', _catalogo_modificado)
+    event.listen(_modelo, 'after_update', _catalogo_actualizado)
+    event.listen(_modelo, 'after_delete', _catalogo_modificado)
+
+suscribir(CANAL, invalidar_catalogos)
@@ -0,0 +1,202 @@
+"""
+Versiones de cambios por ámbito y GET condicional (ETag / 304)
+
+Cada escritura de tickets y comentarios incrementa, en la misma transacción,
+la versión de los ámbitos afectados:
+- "departamento:<id>": tickets del departamento (listado de agentes)
+- "usuario:<id>": tickets creados por el usuario (listado de usuarios)
+
+El ámbito "global" (listado de administradores) no tiene fila propia: su
+versión es la suma de las de todos los departamentos, porque cada ticket
+tiene uno. Una fila común para todos los tickets haría que las escrituras
+de toda la empresa esperaran su bloqueo hasta el commit de cada petición.
+
+Los catálogos (prioridades, estados, departamentos, sucursales, categorías,
+roles y apps)
+incrementan "catalogos" y los usuarios "usuarios" (nombres que aparecen en los
+listados). El ETag de una respuesta se calcula con las versiones de sus ámbitos
+y la consulta, sin leer ni serializar los datos: si el cliente envía el mismo
+ETag en If-None-Match se responde 304.
+
+"autorizacion:<id>" versiona los permisos de un usuario (rol, departamentos,
+apps) incluidos en sus tokens; ver principal.py.
+
+Nota: general_dim_usuario es compartida con otras aplicaciones; sus cambios
+hechos fuera de esta API no incrementan "usuarios".
+"""
+import hashlib
+from functools import wraps
+from flask import request, jsonify, Response
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, object_session
+from models import (db, Ticket, TicketComentario, TicketPrioridad, TicketEstado, Departamento,
+                    Sucursal, Categoria, Rol, App, Usuario, VersionAmbito)
+
+AMBITO_GLOBAL = 'global'
+AMBITO_CATALOGOS = 'catalogos'
+AMBITO_USUARIOS = 'usuarios'
+
+CLAVE_SESION = 'ambitos_modificados'
+CLAVE_COMENTARIOS = 'tickets_comentados'
+
+
+def ambito_departamento(id_departamento):
+    return f'departamento:{id_departamento}'
+
+
+def ambito_usuario(id_usuario):
+    return f'usuario:{id_usuario}'
+
+
+def ambito_autorizacion(id_usuario):
+    return f'autorizacion:{id_usuario}'
+
+
+def ambitos_visibilidad(principal):
+    """Ámbitos que cubren los tickets visibles para el usuario (ver criterios_visibilidad)"""
+    if principal.es_administrador:
+        return [AMBITO_GLOBAL]
+    if principal.es_agente:
+        return sorted(ambito_departamento(d) for d in principal.departamentos)
+    return [ambito_usuario(principal.id)]
+
+
+def ambitos_ticket(ticket):
+    """Ámbitos de un ticket, incluidos el departamento o creador anteriores si cambiaron"""
+    estado = inspect(ticket)
+    departamentos = {ticket.id_departamento, *estado.attrs.id_departamento.history.deleted}
+    usuarios = {ticket.id_usuario, *estado.attrs.id_usuario.history.deleted}
+    return (
+        {ambito_departamento(d) for d in departamentos if d is not None}
+        | {ambito_usuario(u) for u in usuarios if u is not None}
+    )
+
+
+# 🔹 Registro de cambios durante el flush
+def _marcar(objeto, *ambitos, clave=CLAVE_SESION):
+    sesion = object_session(objeto)
+    if sesion is not None:
+        sesion.info.setdefault(clave, set()).update(ambitos)
+
+
+def _ticket_modificado(mapper, connection, ticket):
+    _marcar(ticket, *ambitos_ticket(ticket))
+
+
+def _comentario_modificado(mapper, connection, comentario):
+    _marcar(comentario, comentario.id_ticket, clave=CLAVE_COMENTARIOS)
+
+
+def _catalogo_modificado(mapper, connection, objeto):
+    _marcar(objeto, AMBITO_CATALOGOS)
+
+
+def _usuario_modificado(mapper, connection, usuario):
+    _marcar(usuario, AMBITO_USUARIOS)
+
+
+for _evento in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Ticket, _evento, _ticket_modificado)
+    event.listen(TicketComentario, _evento, _comentario_modificado)
+    event.listen(Usuario, _evento, _usuario_modificado)
+    for _modelo in (TicketPrioridad, TicketEstado, Departamento, Sucursal, Categoria, Rol, App):
+        event.listen(_modelo, _evento, _catalogo_modificado)
+
+
+def sentencia_incremento(dialecto, ambitos):
+    """INSERT ... que crea los ámbitos con versión 1 o incrementa los existentes"""
+    tabla = VersionAmbito.__table__
+    valores = [{'ambito': a, 'version': 1} for a in sorted(ambitos)]
+    if dialecto == 'mysql':
+        sentencia = mysql_insert(tabla).values(valores)
+        return sentencia.on_duplicate_key_update(version=tabla.c.version + 1)
+    sentencia = sqlite_insert(tabla).values(valores)
+    return sentencia.on_conflict_do_update(index_elements=[tabla.c.ambito], set_={'version': tabla.c.version + 1})
+
+
+@event.listens_for(Session, 'after_flush')
+def _incrementar_versiones(session, flush_context):
+    ambitos = session.info.pop(CLAVE_SESION, set())
+    tickets_comentados = session.info.pop(CLAVE_COMENTARIOS, set())
+    if not ambitos and not tickets_comentados:
+        return
+
+    conexion = session.connection()
+    if tickets_comentados:
+        filas = conexion.execute(
+            select(Ticket.id_departamento, Ticket.id_usuario).where(Ticket.id.in_(tickets_comentados))
+        )
+        for id_departamento, id_usuario in filas:
+            ambitos.update((ambito_departamento(id_departamento), ambito_usuario(id_usuario)))
+
+    conexion.execute(sentencia_incremento(conexion.dialect.name, ambitos))
+
+
+# 🔹 Lectura de versiones y ETag
+def obtener_versiones(ambitos):
+    """Versión actual de cada ámbito (0 si nunca se modificó)"""
+    filas = db.session.execute(
+        select(VersionAmbito.ambito, VersionAmbito.version).where(VersionAmbito.ambito.in_(ambitos))
+    )
+    versiones = dict(filas.all())
+    if AMBITO_GLOBAL in ambitos:
+        versiones[AMBITO_GLOBAL] = db.session.execute(
+            select(func.coalesce(func.sum(VersionAmbito.version), 0))
+            .where(VersionAmbito.ambito.like(ambito_departamento('%')))
+        ).scalar()
+    return [(a, versiones.get(a, 0)) for a in ambitos]
+
+
+def calcular_etag(ambitos, *partes):
+    """ETag a partir de las versiones de los ámbitos, la ruta, la consulta y otras partes"""
+    consulta = sorted(request.args.items(multi=True))
+    contenido = repr((obtener_versiones(ambitos), request.path, consulta, partes))
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+
+def no_modificado(etag):
+    respuesta = Response(status=304)
+    respuesta.set_etag(etag)
+    return respuesta
+
+
+def respuesta_condicional(ambitos, generar, *partes):
+    """
+    Responde 304 si el cliente ya tiene la versión actual; si no, llama a
+    generar() y devuelve su resultado como JSON (o la respuesta que generar()
+    ya armó, por ejemplo en streaming) con el ETag.
+
+    Las versiones se leen antes que los datos: si una escritura ocurre entre
+    ambas lecturas el cliente recibe datos nuevos con el ETag anterior y los
+    vuelve a pedir en la siguiente consulta, nunca al revés.
+    """
+    etag = calcular_etag(ambitos, *partes)
+    if request.if_none_match.contains(etag):
+        return no_modificado(etag)
+    respuesta = generar()
+    if not isinstance(respuesta, Response):
+        respuesta = jsonify(respuesta)
+    respuesta.set_etag(etag)
+    return respuesta
+
+
+def condicional(*ambitos):
+    """Decorador de GET condicional para rutas que devuelven catálogos"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = calcular_etag(list(ambitos))
+            if request.if_none_match.contains(etag):
+                return no_modificado(etag)
+            respuesta = func(*args, **kwargs)
+            if isinstance(respuesta, tuple):
+                cuerpo, estado = respuesta[0], respuesta[1]
+            else:
+                cuerpo, estado = respuesta, 200
+            if estado == 200:
+                cuerpo.set_etag(etag)
+            return respuesta
+        return wrapper
+    return decorator
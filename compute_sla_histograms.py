@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Script para calcular los histogramas de SLA que sirve /tickets/sla
+
+Pensado para ejecutarse de forma programada (por ejemplo, cada hora con
+Cloud Scheduler o cron). Cada ejecución recalcula los días indicados a
+partir de ticket_fact_registro; es idempotente.
+
+Uso:
+    python compute_sla_histograms.py                  # ayer y hoy
+    python compute_sla_histograms.py 2024-01-01 2024-02-01   # días en [desde, hasta)
+    python compute_sla_histograms.py --backfill       # toda la historia en una pasada
+
+La agrupación por día y cubeta se hace en la base de datos, así que el
+backfill lee cantidades por grupo y no los tickets.
+"""
+import sys
+from datetime import date, datetime, timedelta
+
+
+if __name__ == "__main__":
+    from app import app
+    from models import db, CHILE_TZ
+    from ticket_sla import calcular_histogramas
+
+    argumentos = sys.argv[1:]
+    if argumentos == ['--backfill']:
+        desde = hasta = None
+        print("🚀 Calculando histogramas de SLA de toda la historia...")
+    elif len(argumentos) == 2:
+        desde, hasta = (date.fromisoformat(a) for a in argumentos)
+        print(f"🚀 Calculando histogramas de SLA del {desde} al {hasta} (sin incluir)...")
+    elif not argumentos:
+        hoy = datetime.now(CHILE_TZ).date()
+        desde, hasta = hoy - timedelta(days=1), hoy + timedelta(days=1)
+        print(f"🚀 Calculando histogramas de SLA de ayer y hoy ({desde} y {hoy})...")
+    else:
+        print(__doc__)
+        sys.exit(2)
+
+    with app.app_context():
+        try:
+            filas = calcular_histogramas(desde, hasta)
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error al calcular los histogramas de SLA: {str(e)}")
+            sys.exit(1)
+
+    print(f"✅ Histogramas de SLA actualizados: {filas} filas")
@@ -27,4 +27,30 @@ class Config:
     JWT_TOKEN_LOCATION = ['headers']
     JWT_HEADER_NAME = 'Authorization'
     JWT_HEADER_TYPE = 'Bearer'
+    # Rol, departamentos, sucursales y apps dentro del access token (ver principal.py)
+    JWT_CLAIMS_AUTORIZACION = os.getenv('JWT_CLAIMS_AUTORIZACION', 'false').lower() == 'true'
+    AUTORIZACION_CACHE_TTL = int(os.getenv('AUTORIZACION_CACHE_TTL', '30'))
+    # bcrypt: factor de trabajo de claves nuevas, procesos del pool y cola de espera (ver password_hashing.py)
+    # Procesos + cola debe quedar bajo los hilos de gunicorn para que siempre haya hilos libres
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    BCRYPT_PROCESOS = int(os.getenv('BCRYPT_PROCESOS', '2'))
+    BCRYPT_COLA = int(os.getenv('BCRYPT_COLA', '1'))
+    # Segundos que se guardan en memoria los catálogos (ver catalog_cache.py)
+    CATALOGOS_CACHE_TTL = int(os.getenv('CATALOGOS_CACHE_TTL', '300'))
+    # Avisos de invalidación entre instancias: 'tabla', 'memoria' o '' (ver invalidation_bus.py)
+    INVALIDACION_BUS = os.getenv('INVALIDACION_BUS', 'tabla')
+    INVALIDACION_INTERVALO = float(os.getenv('INVALIDACION_INTERVALO', '1'))
+    INVALIDACION_RETENCION = int(os.getenv('INVALIDACION_RETENCION', '3600'))
+    # Segundos que se guarda la respuesta de cada Idempotency-Key (ver idempotency.py)
+    IDEMPOTENCIA_TTL = int(os.getenv('IDEMPOTENCIA_TTL', '86400'))
+    # Bandeja de salida de correos (ver email_outbox.py); CORREO_ENVIADOR=0 no envía desde esta instancia
+    CORREO_ENVIADOR = os.getenv('CORREO_ENVIADOR', '1') != '0'
+    CORREO_LOTE = int(os.getenv('CORREO_LOTE', '50'))
+    CORREO_INTERVALO = float(os.getenv('CORREO_INTERVALO', '5'))
+    CORREO_MAX_INTENTOS = int(os.getenv('CORREO_MAX_INTENTOS', '8'))
+    CORREO_RETENCION = int(os.getenv('CORREO_RETENCION', '604800'))
+    # Segundos que esperan las novedades de un ticket para salir en un solo correo; con
+    # CORREO_RESUMEN (minutos, 0 = desactivado) se envía un resumen periódico por destinatario
+    CORREO_AGRUPACION = int(os.getenv('CORREO_AGRUPACION', '120'))
+    CORREO_RESUMEN = int(os.getenv('CORREO_RESUMEN', '0'))
 
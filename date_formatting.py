@@ -0,0 +1,56 @@
+"""
+Formato rápido de fechas de tickets y comentarios
+
+formatear_fecha devuelve exactamente lo mismo que
+fecha.astimezone(CHILE_TZ).strftime('%Y-%m-%d %H:%M:%S'), pero sin hacer la
+conversión de pytz en cada fila: la diferencia entre la hora recibida y la
+hora de Chile solo cambia en los cambios de horario (a lo sumo uno por día y
+en una hora exacta), así que se calcula una vez por día y se reutiliza.
+"""
+from models import CHILE_TZ
+
+# Desfase de la fecha (None si no tiene zona) -> {ordinal del día -> desfase, o tupla de 24 desfases}
+_DESFASES_POR_DIA = {}
+
+
+def _desfase_chile(fecha):
+    """Diferencia a sumar a la fecha para obtener la hora de Chile"""
+    # Sin zona, astimezone interpreta la fecha en la zona del sistema, igual que el formato original
+    return fecha.astimezone(CHILE_TZ).replace(tzinfo=None) - fecha.replace(tzinfo=None)
+
+
+def _desfases_del_dia(fecha):
+    """Desfase del día; si hay cambio de horario ese día, uno por cada hora"""
+    dia = fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+    primero = _desfase_chile(dia)
+    if _desfase_chile(dia.replace(hour=23)) == primero:
+        return primero
+    return tuple(_desfase_chile(dia.replace(hour=hora)) for hora in range(24))
+
+
+def formatear_fecha(fecha):
+    """Fecha en hora de Chile como 'YYYY-MM-DD HH:MM:SS' (None si no hay fecha)"""
+    if fecha is None:
+        return None
+    desfase_origen = fecha.utcoffset()
+    dias = _DESFASES_POR_DIA.get(desfase_origen)
+    if dias is None:
+        dias = _DESFASES_POR_DIA[desfase_origen] = {}
+
+    ordinal = fecha.toordinal()
+    desfase = dias.get(ordinal)
+    if desfase is None:
+        desfase = dias[ordinal] = _desfases_del_dia(fecha)
+    if type(desfase) is tuple:
+        desfase = desfase[fecha.hour]
+
+    if desfase_origen is not None:
+        fecha = fecha.replace(tzinfo=None)
+    return (fecha + desfase).isoformat(' ', 'seconds')
+
+
+def formatear_fecha_local(fecha):
+    """Fecha tal como está guardada, como 'YYYY-MM-DD HH:MM:SS' (None si no hay fecha)"""
+    if fecha is None:
+        return None
+    return fecha.replace(tzinfo=None).isoformat(' ', 'seconds')
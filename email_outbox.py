@@ -0,0 +1,430 @@
+"""
+Bandeja de salida de correos con una conexión SMTP reutilizada
+
+Antes cada notificación abría un hilo por destinatario y cada hilo una
+conexión nueva (conexión, STARTTLS y login): crear un ticket costaba dos
+handshakes TLS, y los correos que esperaban en esos hilos se perdían cuando
+gunicorn reciclaba el worker (--max-requests).
+
+Ahora enviar_correo_async (utils.py) llama a encolar_correo, que agrega una
+fila a ticket_fact_correo en la misma transacción del cambio: si la
+transacción se revierte no sale ningún correo, y si el proceso muere los
+correos siguen en la tabla. Un hilo por proceso (EnviadorCorreos) los envía:
+- despierta después de cada commit que encoló correos, o cada
+  CORREO_INTERVALO segundos;
+- reclama hasta CORREO_LOTE filas pendientes marcándolas con un id de lote,
+  así dos instancias no envían el mismo correo;
+- los envía por una ConexionSMTP que se mantiene abierta entre lotes;
+- si un envío falla lo reintenta con espera exponencial (RETRASO_BASE,
+  duplicando hasta RETRASO_MAXIMO); un rechazo permanente del servidor (5xx)
+  o CORREO_MAX_INTENTOS fallos lo dejan en estado "fallido" con el error;
+- borra los enviados de más de CORREO_RETENCION segundos.
+
+Agrupación: las novedades de un ticket (comentarios, cambios de estado,
+reasignaciones y cierre) se encolan con agrupacion='ticket:<id>' y esperan
+CORREO_AGRUPACION segundos. Al enviar, todos los pendientes del mismo
+destinatario y ticket salen en un solo correo, así que durante un incidente
+un agente recibe un correo por ticket y ventana en vez de uno por novedad.
+Con CORREO_RESUMEN (minutos) las novedades esperan hasta el siguiente
+múltiplo de ese periodo y se combinan por destinatario, de todos los
+tickets (resumen periódico). La creación de tickets no se agrupa.
+
+Si un proceso muere con un lote reclamado, esas filas vuelven a quedar
+disponibles después de RECLAMO_SEGUNDOS.
+"""
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+import uuid
+from datetime import timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import and_, delete, event, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+from models import db, CorreoSalida, ahora_utc
+from utils import (construir_mensaje, SMTP_SERVER, SMTP_PORT, SMTP_USUARIO, SMTP_CLAVE, SMTP_STARTTLS)
+
+PENDIENTE = 'pendiente'
+ENVIADO = 'enviado'
+FALLIDO = 'fallido'
+
+LOTE_POR_DEFECTO = 50
+INTERVALO_POR_DEFECTO = 5.0
+MAX_INTENTOS_POR_DEFECTO = 8
+RETENCION_POR_DEFECTO = 7 * 86400
+AGRUPACION_POR_DEFECTO = 120
+
+RETRASO_BASE = 30
+RETRASO_MAXIMO = 3600
+RECLAMO_SEGUNDOS = 300
+
+# Cada cuántos segundos el hilo borra los correos enviados antiguos
+INTERVALO_LIMPIEZA = 600
+
+CLAVE_SESION = 'correos_encolados'
+
+_enviador = None
+
+# Funciones que generan correos antes de cada lote (ver antes_de_enviar)
+_preparadores = []
+
+
+def _configuracion():
+    return current_app.config if has_app_context() else {}
+
+
+def agrupacion_ticket(id_ticket):
+    return f'ticket:{id_ticket}'
+
+
+def _momento_de_envio(ahora):
+    """Cuándo sale un correo agrupable: al cerrar la ventana o en el siguiente resumen"""
+    configuracion = _configuracion()
+    resumen = configuracion.get('CORREO_RESUMEN', 0) * 60
+    if resumen:
+        dia = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
+        transcurrido = (ahora - dia).total_seconds()
+        return dia + timedelta(seconds=(transcurrido // resumen + 1) * resumen)
+    return ahora + timedelta(seconds=configuracion.get('CORREO_AGRUPACION', AGRUPACION_POR_DEFECTO))
+
+
+# 🔹 Encolado dentro de la transacción
+def antes_de_enviar(funcion):
+    """Registra funcion(lote) para que el hilo la llame antes de cada lote; devuelve cuántos procesó"""
+    _preparadores.append(funcion)
+    return funcion
+
+
+def avisar_enviador(sesion):
+    """El hilo despierta después del commit de la sesión"""
+    sesion.info[CLAVE_SESION] = True
+
+
+def encolar_correo(destinatario, asunto, cuerpo, sesion=None, agrupacion=None):
+    """
+    Agrega el correo a la bandeja; se envía después del commit de la sesión.
+    Con agrupacion espera la ventana de agrupación o el resumen (ver arriba).
+    """
+    if not destinatario:
+        return
+    sesion = sesion or db.session()
+    ahora = ahora_utc()
+    sesion.add(CorreoSalida(
+        destinatario=destinatario, asunto=asunto[:255], cuerpo=cuerpo, agrupacion=agrupacion,
+        proximo_intento=_momento_de_envio(ahora) if agrupacion else ahora,
+    ))
+    avisar_enviador(sesion)
+
+
+@event.listens_for(Session, 'after_commit')
+def _despertar_enviador(session):
+    if session.info.pop(CLAVE_SESION, None) and _enviador is not None:
+        _enviador.despertar()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_aviso(session):
+    session.info.pop(CLAVE_SESION, None)
+
+
+# 🔹 Conexión SMTP
+class ConexionSMTP:
+    """
+    Conexión autenticada que se reutiliza entre correos. Se renueva si el
+    servidor la cerró, después de MAX_MENSAJES correos (algunos servidores
+    limitan los mensajes por sesión) o si pasó INACTIVIDAD sin usarla.
+    """
+
+    MAX_MENSAJES = 100
+    INACTIVIDAD = 60
+
+    def __init__(self, servidor=None, puerto=None, usuario=None, clave=None, starttls=None, timeout=60):
+        self.servidor = servidor or SMTP_SERVER
+        self.puerto = puerto or SMTP_PORT
+        self.usuario = usuario if usuario is not None else SMTP_USUARIO
+        self.clave = clave if clave is not None else SMTP_CLAVE
+        self.starttls = SMTP_STARTTLS if starttls is None else starttls
+        self.timeout = timeout
+        self._smtp = None
+        self._enviados = 0
+        self._ultimo_uso = 0.0
+        self.conexiones = 0
+
+    def configurada(self):
+        return all([self.servidor, self.puerto, self.usuario, self.clave])
+
+    def _conectar(self):
+        smtp = smtplib.SMTP(self.servidor, self.puerto, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.starttls:
+                smtp.starttls()
+                smtp.ehlo()
+            smtp.login(self.usuario, self.clave.strip())
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self._enviados = 0
+        self.conexiones += 1
+
+    def _vigente(self):
+        if self._smtp is None or self._enviados >= self.MAX_MENSAJES:
+            return False
+        if time.monotonic() - self._ultimo_uso > self.INACTIVIDAD:
+            try:
+                return self._smtp.noop()[0] == 250
+            except OSError:  # incluye SMTPException
+                return False
+        return True
+
+    def enviar(self, mensaje):
+        if not self._vigente():
+            self.cerrar()
+            self._conectar()
+        try:
+            self._smtp.send_message(mensaje)
+        except smtplib.SMTPServerDisconnected:
+            # El servidor cerró la sesión entre lotes: un reintento con una conexión nueva
+            self.cerrar()
+            self._conectar()
+            self._smtp.send_message(mensaje)
+        self._enviados += 1
+        self._ultimo_uso = time.monotonic()
+
+    def cerrar_si_inactiva(self):
+        if self._smtp is not None and time.monotonic() - self._ultimo_uso > self.INACTIVIDAD:
+            self.cerrar()
+
+    def cerrar(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+
+def _es_permanente(error):
+    """Rechazos 5xx del servidor: reintentar no cambia el resultado"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(codigo >= 500 for codigo, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return error.smtp_code >= 500
+    return False
+
+
+def _falla_de_conexion(error):
+    """Errores de la sesión SMTP (y no de un correo): el resto del lote también fallaría"""
+    if isinstance(error, (smtplib.SMTPConnectError, smtplib.SMTPAuthenticationError, smtplib.SMTPHeloError)):
+        return True
+    return not isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException))
+
+
+def _clave_grupo(correo, resumen):
+    """Correos que salen juntos: mismo destinatario y ticket (o solo destinatario en el resumen)"""
+    if correo.agrupacion is None:
+        return ('', correo.id)
+    return (correo.destinatario, '' if resumen else correo.agrupacion)
+
+
+def combinar(correos, resumen=False):
+    """Asunto y cuerpo de un correo que reúne varios del mismo grupo"""
+    if len(correos) == 1:
+        return correos[0].asunto, correos[0].cuerpo
+    if resumen:
+        asunto = f"Resumen: {len(correos)} novedades en tus tickets"
+    else:
+        asunto = f"{len(correos)} novedades: {correos[-1].asunto}"
+    cuerpo = f"<p>{asunto}</p>\n" + "\n<hr>\n".join(correo.cuerpo for correo in correos)
+    return asunto, cuerpo
+
+
+def retraso(intentos):
+    """Espera exponencial con variación, para no reintentar todos a la vez"""
+    return min(RETRASO_BASE * 2 ** (intentos - 1), RETRASO_MAXIMO) * random.uniform(0.8, 1.2)
+
+
+# 🔹 Envío en segundo plano
+class EnviadorCorreos:
+    """Hilo que vacía la bandeja de salida (uno por proceso)"""
+
+    def __init__(self, conexion=None):
+        self.conexion = conexion or ConexionSMTP()
+        self._pid = None
+        self._detenido = threading.Event()
+        self._pendientes = threading.Event()
+        self._candado = threading.Lock()
+        self._ultima_limpieza = time.monotonic()
+
+    def iniciar(self, app):
+        # Con --preload la app se crea antes del fork: el hilo se inicia en cada worker
+        if self._pid == os.getpid():
+            return
+        with self._candado:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._detenido.clear()
+            threading.Thread(target=self._ejecutar, args=(app,), daemon=True, name='enviador-correos').start()
+
+    def detener(self):
+        self._detenido.set()
+        self._pendientes.set()
+        self._pid = None
+
+    def despertar(self):
+        self._pendientes.set()
+
+    def _ejecutar(self, app):
+        intervalo = app.config.get('CORREO_INTERVALO', INTERVALO_POR_DEFECTO)
+        lote = app.config.get('CORREO_LOTE', LOTE_POR_DEFECTO)
+        if not self.conexion.configurada():
+            logging.error("Faltan variables de entorno necesarias para el envío de correo")
+        while not self._detenido.is_set():
+            self._pendientes.clear()
+            preparados = 0
+            try:
+                with app.app_context():
+                    for preparar in _preparadores:
+                        try:
+                            preparados = max(preparados, preparar(lote))
+                        except Exception as e:
+                            db.session.rollback()
+                            print(f"🔸 Error al preparar correos en {preparar.__name__}: {str(e)}")
+                    enviados = self.procesar_lote(app, lote)
+                    self._limpiar(app)
+                    db.session.remove()
+            except Exception as e:
+                print(f"🔸 Error en el envío de correos: {str(e)}")
+                enviados = 0
+            if enviados < lote and preparados < lote:
+                self.conexion.cerrar_si_inactiva()
+                self._pendientes.wait(intervalo)
+
+    def _reclamar(self, lote, resumen):
+        ahora = ahora_utc()
+        vencidos = db.session.execute(
+            select(CorreoSalida.id, CorreoSalida.destinatario, CorreoSalida.agrupacion)
+            .where(CorreoSalida.estado == PENDIENTE, CorreoSalida.proximo_intento <= ahora)
+            .order_by(CorreoSalida.id).limit(lote)
+        ).all()
+        if not vencidos:
+            return []
+        ids = [correo.id for correo in vencidos]
+
+        # Nunca intentado y sin reclamar (aún espera su ventana), o ya vencido: su reintento llegó o
+        # su reclamo venció porque el proceso que lo tenía murió. Los que fallaron y esperan su
+        # reintento no salen antes con el grupo.
+        disponible = or_(
+            and_(CorreoSalida.intentos == 0, CorreoSalida.reclamado.is_(None)),
+            CorreoSalida.proximo_intento <= ahora,
+        )
+
+        # El resto del grupo (aunque aún espere su ventana) sale con el que venció
+        agrupados = [c for c in vencidos if c.agrupacion is not None]
+        if agrupados:
+            if resumen:
+                mismo_grupo = CorreoSalida.destinatario.in_({c.destinatario for c in agrupados})
+            else:
+                mismo_grupo = tuple_(CorreoSalida.destinatario, CorreoSalida.agrupacion).in_(
+                    {(c.destinatario, c.agrupacion) for c in agrupados})
+            ids = set(ids) | set(db.session.execute(
+                select(CorreoSalida.id).where(
+                    CorreoSalida.estado == PENDIENTE, CorreoSalida.agrupacion.isnot(None), mismo_grupo, disponible,
+                )
+            ).scalars())
+
+        marca = uuid.uuid4().hex
+        # La condición se repite: si otra instancia reclamó alguna fila primero, no se toca
+        db.session.execute(
+            update(CorreoSalida)
+            .where(CorreoSalida.id.in_(ids), CorreoSalida.estado == PENDIENTE, disponible)
+            .values(reclamado=marca, proximo_intento=ahora + timedelta(seconds=RECLAMO_SEGUNDOS))
+        )
+        db.session.commit()
+        return db.session.execute(
+            select(CorreoSalida.id, CorreoSalida.destinatario, CorreoSalida.asunto, CorreoSalida.cuerpo,
+                   CorreoSalida.intentos, CorreoSalida.agrupacion)
+            .where(CorreoSalida.id.in_(ids), CorreoSalida.reclamado == marca)
+            .order_by(CorreoSalida.id)
+        ).all()
+
+    def procesar_lote(self, app=None, lote=LOTE_POR_DEFECTO):
+        """Envía un lote de correos pendientes; devuelve cuántos reclamó"""
+        configuracion = app.config if app else {}
+        maximo = configuracion.get('CORREO_MAX_INTENTOS', MAX_INTENTOS_POR_DEFECTO)
+        resumen = bool(configuracion.get('CORREO_RESUMEN', 0))
+        if not self.conexion.configurada():
+            return 0
+        correos = self._reclamar(lote, resumen)
+        grupos = {}
+        for correo in correos:
+            grupos.setdefault(_clave_grupo(correo, resumen), []).append(correo)
+        grupos = list(grupos.values())
+
+        enviados = []
+        for posicion, grupo in enumerate(grupos):
+            destinatario = grupo[0].destinatario
+            try:
+                asunto, cuerpo = combinar(grupo, resumen)
+                self.conexion.enviar(construir_mensaje(destinatario, asunto, cuerpo))
+                enviados.extend(correo.id for correo in grupo)
+            except Exception as e:
+                logging.error(f"Error al enviar correo {grupo[0].id} a {destinatario}: {str(e)}")
+                for correo in grupo:
+                    intentos = correo.intentos + 1
+                    fallido = _es_permanente(e) or intentos >= maximo
+                    db.session.execute(update(CorreoSalida).where(CorreoSalida.id == correo.id).values(
+                        estado=FALLIDO if fallido else PENDIENTE,
+                        intentos=intentos,
+                        proximo_intento=ahora_utc() + timedelta(seconds=retraso(intentos)),
+                        reclamado=None,
+                        ultimo_error=f"{type(e).__name__}: {str(e)}"[:500],
+                    ))
+                if _falla_de_conexion(e):
+                    # El resto del lote se libera sin contarle un intento
+                    restantes = [c.id for g in grupos[posicion + 1:] for c in g]
+                    if restantes:
+                        db.session.execute(update(CorreoSalida).where(CorreoSalida.id.in_(restantes)).values(
+                            proximo_intento=ahora_utc() + timedelta(seconds=retraso(1)), reclamado=None,
+                        ))
+                    self.conexion.cerrar()
+                    break
+        if enviados:
+            db.session.execute(update(CorreoSalida).where(CorreoSalida.id.in_(enviados)).values(
+                estado=ENVIADO, fecha_envio=ahora_utc(), reclamado=None,
+            ))
+        db.session.commit()
+        return len(correos)
+
+    def _limpiar(self, app):
+        if time.monotonic() - self._ultima_limpieza < INTERVALO_LIMPIEZA:
+            return
+        self._ultima_limpieza = time.monotonic()
+        limite = ahora_utc() - timedelta(seconds=app.config.get('CORREO_RETENCION', RETENCION_POR_DEFECTO))
+        db.session.execute(delete(CorreoSalida).where(CorreoSalida.estado == ENVIADO, CorreoSalida.fecha_envio < limite))
+        db.session.commit()
+
+
+def configurar_correos(app, enviador=None):
+    """Inicia el enviador en cada worker (CORREO_ENVIADOR=0 lo desactiva en esta instancia)"""
+    global _enviador
+    if _enviador is not None:
+        _enviador.detener()
+    if enviador is None and not app.config.get('CORREO_ENVIADOR', True):
+        _enviador = None
+        return None
+    _enviador = enviador or EnviadorCorreos()
+
+    if 'enviador_correos' not in app.extensions:
+        app.extensions['enviador_correos'] = True
+
+        @app.before_request
+        def _iniciar_enviador():
+            if _enviador is not None:
+                _enviador.iniciar(app)
+
+    return _enviador
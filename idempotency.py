@@ -0,0 +1,189 @@
+"""
+Idempotency-Key para las rutas de creación (tickets y comentarios)
+
+Los clientes móviles reintentan los POST cuando la red de la sucursal falla y
+cada reintento creaba otro ticket y otra ronda de correos. Si la petición
+trae el header Idempotency-Key, la primera vez se reserva la clave (por
+usuario) antes de ejecutar la ruta; un reintento con la misma clave recibe la
+respuesta guardada con una consulta por llave primaria, sin volver a
+ejecutar la ruta.
+
+La ruta termina con confirmar(respuesta) en lugar de db.session.commit():
+la respuesta se guarda en la misma transacción que el ticket o comentario,
+así un proceso que muere después del commit no deja la clave sin respuesta.
+Las respuestas que no pasan por confirmar (validaciones 4xx sin cambios) se
+guardan después de la ruta.
+
+- Misma clave con otro cuerpo o en otra ruta: 422.
+- Misma clave mientras la primera petición sigue en curso: 409 con Retry-After.
+- Las respuestas 5xx no se guardan: el cliente puede reintentar.
+
+Las claves duran IDEMPOTENCIA_TTL segundos (24 horas por defecto), también
+las reservas: una reserva nunca vence antes, porque la ruta puede seguir en
+curso. Si el proceso muere antes del commit, esa clave responde 409 hasta
+vencer y el cliente debe usar otra. Cada proceso borra las vencidas en lotes
+de LOTE_LIMPIEZA, como mucho una vez por INTERVALO_LIMPIEZA segundos.
+"""
+import hashlib
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+from flask import current_app, g, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, RespuestaIdempotente, ahora_utc
+
+HEADER = 'Idempotency-Key'
+LARGO_MAXIMO = 100
+
+TTL_POR_DEFECTO = 86400
+
+LOTE_LIMPIEZA = 1000
+INTERVALO_LIMPIEZA = 60
+
+_ultima_limpieza = 0.0
+_candado_limpieza = threading.Lock()
+
+
+def _huella():
+    contenido = hashlib.sha256(f'{request.method} {request.path}\n'.encode('utf-8'))
+    contenido.update(request.get_data())
+    return contenido.hexdigest()
+
+
+def _en_curso():
+    return jsonify({'error': 'La solicitud original aún se está procesando'}), 409, {'Retry-After': '1'}
+
+
+def _repetir(guardada, huella):
+    """Respuesta para una clave ya usada"""
+    if guardada.huella != huella:
+        return jsonify({'error': 'La Idempotency-Key ya se usó con otra solicitud'}), 422
+    if guardada.estado is None:
+        return _en_curso()
+    respuesta = current_app.response_class(guardada.respuesta, status=guardada.estado, mimetype='application/json')
+    respuesta.headers['Idempotent-Replayed'] = 'true'
+    return respuesta
+
+
+def _leer(clave):
+    return db.session.execute(
+        select(RespuestaIdempotente.huella, RespuestaIdempotente.estado, RespuestaIdempotente.respuesta)
+        .where(RespuestaIdempotente.clave == clave, RespuestaIdempotente.fecha_expiracion > ahora_utc())
+    ).first()
+
+
+def _vencimiento():
+    return ahora_utc() + timedelta(seconds=current_app.config.get('IDEMPOTENCIA_TTL', TTL_POR_DEFECTO))
+
+
+def _reservar(clave, huella):
+    """True si esta petición tomó la clave; False si otra la tiene vigente"""
+    tabla = RespuestaIdempotente.__table__
+    try:
+        db.session.execute(delete(tabla).where(tabla.c.clave == clave, tabla.c.fecha_expiracion <= ahora_utc()))
+        db.session.execute(insert(tabla).values(clave=clave, huella=huella, fecha_expiracion=_vencimiento()))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def _guardar(clave, respuesta):
+    """Anota la respuesta en la transacción actual, sin commit"""
+    db.session.execute(update(RespuestaIdempotente).where(RespuestaIdempotente.clave == clave).values(
+        estado=respuesta.status_code,
+        respuesta=respuesta.get_data(as_text=True),
+        fecha_expiracion=_vencimiento(),
+    ))
+
+
+def confirmar(*respuesta):
+    """
+    Hace el commit de la ruta y devuelve su respuesta. Con Idempotency-Key la
+    respuesta se guarda en la misma transacción que los cambios de la ruta.
+    """
+    respuesta = make_response(*respuesta)
+    clave = g.get('clave_idempotencia')
+    if clave is not None:
+        _guardar(clave, respuesta)
+    db.session.commit()
+    if clave is not None:
+        g.respuesta_idempotente_guardada = True
+    return respuesta
+
+
+def _liberar(clave):
+    db.session.execute(delete(RespuestaIdempotente).where(RespuestaIdempotente.clave == clave))
+    db.session.commit()
+
+
+def limpiar_vencidas():
+    """Borra hasta LOTE_LIMPIEZA claves vencidas; devuelve cuántas borró"""
+    claves = db.session.execute(
+        select(RespuestaIdempotente.clave)
+        .where(RespuestaIdempotente.fecha_expiracion <= ahora_utc())
+        .limit(LOTE_LIMPIEZA)
+    ).scalars().all()
+    if claves:
+        db.session.execute(delete(RespuestaIdempotente).where(RespuestaIdempotente.clave.in_(claves)))
+        db.session.commit()
+    return len(claves)
+
+
+def _limpiar_si_corresponde():
+    global _ultima_limpieza
+    ahora = time.monotonic()
+    with _candado_limpieza:
+        if ahora - _ultima_limpieza < INTERVALO_LIMPIEZA:
+            return
+        _ultima_limpieza = ahora
+    try:
+        limpiar_vencidas()
+    except Exception as e:
+        db.session.rollback()
+        print(f"🔸 Error al limpiar claves de idempotencia: {str(e)}")
+
+
+def idempotente(func):
+    """Decorador para rutas POST de creación; va después de jwt_required y los permisos"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        clave_cliente = request.headers.get(HEADER)
+        if not clave_cliente:
+            return func(*args, **kwargs)
+        if len(clave_cliente) > LARGO_MAXIMO:
+            return jsonify({'error': f'{HEADER} admite hasta {LARGO_MAXIMO} caracteres'}), 400
+
+        clave = f'{get_jwt_identity()}:{clave_cliente}'
+        huella = _huella()
+        guardada = _leer(clave)
+        if guardada is not None:
+            return _repetir(guardada, huella)
+        if not _reservar(clave, huella):
+            # La otra petición pudo terminar con 5xx y liberar la clave entre medio: el cliente reintenta
+            guardada = _leer(clave)
+            return _repetir(guardada, huella) if guardada is not None else _en_curso()
+
+        g.clave_idempotencia = clave
+        try:
+            respuesta = make_response(func(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            _liberar(clave)
+            raise
+        finally:
+            g.pop('clave_idempotencia', None)
+        if not g.pop('respuesta_idempotente_guardada', False):
+            if respuesta.status_code >= 500:
+                db.session.rollback()
+                _liberar(clave)
+            else:
+                _guardar(clave, respuesta)
+                db.session.commit()
+        _limpiar_si_corresponde()
+        return respuesta
+    return wrapper
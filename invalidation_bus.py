@@ -0,0 +1,252 @@
+"""
+Bus de invalidación de cachés en memoria entre instancias
+
+catalog_cache.py y principal.py guardan datos en memoria de cada proceso.
+Cuando una escritura los cambia, el proceso que la hizo descarta su copia,
+pero las demás instancias de Cloud Run la seguían usando hasta que vencía el
+TTL. Ahora cada escritura publica un aviso (canal, clave), por ejemplo
+("catalogos", "departamento") o ("autorizacion", "<id de usuario>"), y cada
+instancia llama a las funciones suscritas a ese canal.
+
+publicar() se llama dentro de la transacción de la escritura. Los avisos se
+entregan al propio proceso después del commit y al resto según el backend
+(INVALIDACION_BUS):
+- "tabla" (por defecto): se insertan en ticket_fact_invalidacion en la misma
+  transacción. Un hilo por proceso consulta cada INVALIDACION_INTERVALO
+  segundos las filas con id mayor al último leído (un rango sobre la llave
+  primaria) y borra las de más de INVALIDACION_RETENCION segundos.
+- "memoria": BusMemoria, implementación de BusPubSub que reparte los avisos
+  entre los buses conectados al mismo BrokerMemoria (pruebas, un proceso).
+- "" (vacío): solo el proceso que escribe.
+
+Los TTL de cada caché se mantienen como respaldo si se pierde un aviso.
+"""
+import abc
+import os
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from sqlalchemy import event, func, insert, select, delete
+from sqlalchemy.orm import Session
+from models import db, Invalidacion, ahora_utc
+
+INTERVALO_POR_DEFECTO = 1.0
+RETENCION_POR_DEFECTO = 3600
+
+# Segundos que se vuelve a mirar detrás del último id leído: una transacción
+# que obtuvo su id antes puede hacer commit después que una más nueva
+MARGEN_SEGUNDOS = 5
+
+# Cada cuántos segundos el hilo borra los avisos vencidos
+INTERVALO_LIMPIEZA = 600
+
+CLAVE_SESION = 'invalidaciones'
+
+# canal -> funciones que reciben la clave
+_suscriptores = {}
+_bus = None
+
+
+def suscribir(canal, funcion):
+    """Registra funcion(clave) para los avisos del canal (en este proceso)"""
+    _suscriptores.setdefault(canal, []).append(funcion)
+
+
+def entregar(canal, clave):
+    for funcion in _suscriptores.get(canal, ()):
+        try:
+            funcion(clave)
+        except Exception as e:
+            print(f"🔸 Error al invalidar {canal}:{clave}: {str(e)}")
+
+
+class BusInvalidacion:
+    """Bus que solo entrega los avisos al proceso que escribe"""
+
+    def iniciar(self, app):
+        pass
+
+    def detener(self):
+        pass
+
+    def registrar(self, conexion, mensajes):
+        """Guarda los avisos dentro de la transacción de la escritura"""
+
+    def enviar(self, mensajes):
+        """Envía los avisos a las demás instancias después del commit"""
+
+    def recibir(self, mensajes):
+        for canal, clave in mensajes:
+            entregar(canal, clave)
+
+
+class BusTabla(BusInvalidacion):
+    """Avisos en ticket_fact_invalidacion, leídos por un hilo en cada proceso"""
+
+    def __init__(self):
+        self._pid = None
+        self._detenido = threading.Event()
+        self._candado = threading.Lock()
+
+    def registrar(self, conexion, mensajes):
+        fecha = ahora_utc()
+        conexion.execute(insert(Invalidacion.__table__), [
+            {'canal': canal, 'clave': clave, 'fecha': fecha} for canal, clave in mensajes
+        ])
+
+    def iniciar(self, app):
+        # Con --preload la app se crea antes del fork: el hilo se inicia en cada worker
+        if self._pid == os.getpid():
+            return
+        with self._candado:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._detenido.clear()
+            threading.Thread(target=self._leer_avisos, args=(app,), daemon=True,
+                             name='bus-invalidacion').start()
+
+    def detener(self):
+        self._detenido.set()
+        self._pid = None
+
+    def _leer_avisos(self, app):
+        intervalo = app.config.get('INVALIDACION_INTERVALO', INTERVALO_POR_DEFECTO)
+        retencion = app.config.get('INVALIDACION_RETENCION', RETENCION_POR_DEFECTO)
+        with app.app_context():
+            piso = db.session.execute(select(func.max(Invalidacion.id))).scalar() or 0
+            db.session.remove()
+        maximo = piso
+        vistos = set()
+        historial = deque()  # (momento, mayor id leído hasta ese momento)
+        ultima_limpieza = time.monotonic()
+
+        while not self._detenido.wait(intervalo):
+            try:
+                with app.app_context():
+                    filas = db.session.execute(
+                        select(Invalidacion.id, Invalidacion.canal, Invalidacion.clave)
+                        .where(Invalidacion.id > piso).order_by(Invalidacion.id)
+                    ).all()
+                    if time.monotonic() - ultima_limpieza > INTERVALO_LIMPIEZA:
+                        ultima_limpieza = time.monotonic()
+                        limite = ahora_utc() - timedelta(seconds=retencion)
+                        db.session.execute(delete(Invalidacion).where(Invalidacion.fecha < limite))
+                        db.session.commit()
+                    db.session.remove()
+            except Exception as e:
+                print(f"🔸 Error en el bus de invalidación: {str(e)}")
+                continue
+
+            nuevas = [f for f in filas if f.id not in vistos]
+            if nuevas:
+                vistos.update(f.id for f in nuevas)
+                maximo = max(maximo, nuevas[-1].id)
+                self.recibir([(f.canal, f.clave) for f in nuevas])
+
+            # El piso avanza hasta lo leído hace más de MARGEN_SEGUNDOS
+            ahora = time.monotonic()
+            historial.append((ahora, maximo))
+            while historial and historial[0][0] <= ahora - MARGEN_SEGUNDOS:
+                piso = historial.popleft()[1]
+            vistos = {i for i in vistos if i > piso}
+
+
+class BusPubSub(BusInvalidacion, abc.ABC):
+    """
+    Interfaz para un broker de mensajes (Pub/Sub, Redis...): enviar() publica
+    los avisos después del commit y la suscripción del broker llama a
+    recibir() con los avisos que llegan.
+    """
+
+    @abc.abstractmethod
+    def enviar(self, mensajes):
+        """Publica los avisos en el broker"""
+
+
+class BrokerMemoria:
+    """Broker en memoria: reparte cada aviso a todos los buses conectados"""
+
+    def __init__(self):
+        self.buses = []
+
+    def difundir(self, mensajes):
+        for bus in list(self.buses):
+            bus.recibir(mensajes)
+
+
+class BusMemoria(BusPubSub):
+    def __init__(self, broker=None):
+        self.broker = broker or BrokerMemoria()
+        self.broker.buses.append(self)
+
+    def enviar(self, mensajes):
+        self.broker.difundir(mensajes)
+
+    def detener(self):
+        if self in self.broker.buses:
+            self.broker.buses.remove(self)
+
+
+def crear_bus(nombre):
+    if nombre == 'tabla':
+        return BusTabla()
+    if nombre == 'memoria':
+        return BusMemoria()
+    if not nombre:
+        return BusInvalidacion()
+    raise ValueError(f"INVALIDACION_BUS desconocido: {nombre}")
+
+
+def configurar_bus(app, bus=None):
+    """Activa el bus de la configuración (o el indicado) y lo inicia en cada worker"""
+    global _bus
+    if _bus is not None:
+        _bus.detener()
+    _bus = bus or crear_bus(app.config.get('INVALIDACION_BUS', 'tabla'))
+
+    if 'bus_invalidacion' not in app.extensions:
+        app.extensions['bus_invalidacion'] = True
+
+        @app.before_request
+        def _iniciar_bus():
+            _bus.iniciar(app)
+
+    return _bus
+
+
+# 🔹 Publicación dentro de la transacción
+def publicar(canal, clave, sesion=None):
+    """
+    Avisa que cambió (canal, clave). Se llama antes del commit (también desde
+    eventos del ORM, pasando la sesión del objeto); si la transacción se
+    revierte el aviso se descarta.
+    """
+    sesion = sesion or db.session()
+    mensaje = (canal, str(clave))
+    pendientes = sesion.info.setdefault(CLAVE_SESION, set())
+    if mensaje in pendientes:
+        return
+    pendientes.add(mensaje)
+    if _bus is not None:
+        _bus.registrar(sesion.connection(), [mensaje])
+
+
+@event.listens_for(Session, 'after_commit')
+def _entregar_pendientes(session):
+    mensajes = sorted(session.info.pop(CLAVE_SESION, ()))
+    if not mensajes:
+        return
+    for canal, clave in mensajes:
+        entregar(canal, clave)
+    if _bus is not None:
+        try:
+            _bus.enviar(mensajes)
+        except Exception as e:
+            print(f"🔸 Error al enviar avisos de invalidación: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_pendientes(session):
+    session.info.pop(CLAVE_SESION, None)
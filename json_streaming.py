@@ -0,0 +1,109 @@
+"""
+Respuestas JSON en streaming para listados grandes
+
+En vez de armar toda la lista en memoria y serializarla con jsonify, la
+consulta se recorre en lotes y el arreglo JSON se escribe de a un lote. Los
+objetos ORM de cada lote se expulsan de la sesión al terminar de
+serializarlo, así que la memoria máxima depende del tamaño del lote y no del
+total de filas.
+
+- iterar_en_lotes usa un cursor del lado del servidor (yield_per). Solo sirve
+  para consultas que no ejecutan otras consultas mientras se recorren (el
+  listado de tickets, que selecciona columnas): con PyMySQL el cursor no está
+  en búfer y una consulta más en la conexión descarta el resto del resultado.
+- iterar_por_clave ejecuta una consulta normal por lote, continuando desde la
+  clave de orden de la última fila; la usan los listados de usuarios, cuyas
+  relaciones se cargan con selectinload.
+
+Se activa con ?stream=1 en los listados que lo admiten.
+"""
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import tuple_
+from models import db
+
+# Filas que se leen, serializan y escriben por vez
+TAMANO_LOTE = 500
+
+
+def modo_streaming(args):
+    """True si la petición pide respuesta en streaming (?stream=1)"""
+    return args.get('stream', '').lower() in ('1', 'true')
+
+
+def _expulsar(lote):
+    for elemento in lote:
+        if isinstance(elemento, db.Model):
+            db.session.expunge(elemento)
+
+
+def iterar_en_lotes(consulta, tamano_lote=TAMANO_LOTE):
+    """
+    Recorre una consulta con yield_per, devolviendo sus elementos uno a uno.
+
+    Cada elemento se entrega mientras sigue en la sesión (puede cargar sus
+    relaciones); al pedir el primero del lote siguiente, los objetos ORM del
+    lote anterior ya fueron expulsados de la sesión.
+    """
+    lote = []
+    for elemento in consulta.yield_per(tamano_lote):
+        lote.append(elemento)
+        if len(lote) == tamano_lote:
+            yield from lote
+            _expulsar(lote)
+            lote = []
+    yield from lote
+    _expulsar(lote)
+
+
+def iterar_por_clave(consulta, orden, tamano_lote=TAMANO_LOTE):
+    """
+    Recorre una consulta de objetos ORM en lotes por clave, devolviendo los objetos uno a uno.
+
+    orden son las expresiones del ORDER BY; la última debe ser única y
+    ninguna puede ser NULL. Cada lote se lee completo antes de entregarse,
+    así que las opciones de carga (selectinload) ejecutan sus consultas sin
+    interrumpir la del lote.
+    """
+    ultimo = None
+    while True:
+        consulta_lote = consulta.add_columns(*orden).order_by(*orden)
+        if ultimo is not None:
+            consulta_lote = consulta_lote.filter(tuple_(*orden) > tuple_(*ultimo))
+        filas = consulta_lote.limit(tamano_lote).all()
+        if not filas:
+            return
+        ultimo = tuple(filas[-1])[1:]
+        lote = [fila[0] for fila in filas]
+        yield from lote
+        _expulsar(lote)
+        if len(filas) < tamano_lote:
+            return
+
+
+def respuesta_json_en_streaming(elementos, serializar, tamano_lote=TAMANO_LOTE):
+    """
+    Devuelve una respuesta application/json que escribe el arreglo de forma incremental.
+
+    Args:
+        elementos: Iterable de filas u objetos (normalmente iterar_en_lotes(consulta))
+        serializar: Función que convierte un elemento en un dict serializable
+        tamano_lote: Elementos que se acumulan antes de escribir un fragmento
+    """
+    def generar():
+        yield '['
+        fragmento = []
+        separador = ''
+        try:
+            for elemento in elementos:
+                fragmento.append(separador + current_app.json.dumps(serializar(elemento)))
+                separador = ','
+                if len(fragmento) == tamano_lote:
+                    yield ''.join(fragmento)
+                    fragmento = []
+        except Exception as e:
+            # El estado 200 ya se envió: el arreglo queda sin cerrar y el cliente lo detecta como JSON inválido
+            print(f"🔸 Error en respuesta en streaming: {str(e)}")
+            raise
+        yield ''.join(fragmento) + ']'
+
+    return Response(stream_with_context(generar()), mimetype='application/json')
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Script para llenar ticket_fact_adjunto con los adjuntos que hasta ahora solo
+estaban en Ticket.adjunto (nombres separados por comas)
+
+Crea la tabla si falta (migrate_schema.py) y lee cada archivo una vez, de
+Cloud Storage o de la carpeta uploads, para guardar su tamaño, tipo de
+contenido y SHA-256. Es idempotente: los adjuntos que ya tienen fila se
+saltan, así que puede volver a ejecutarse si se interrumpe. Los archivos que
+no se encuentran quedan con sha256 NULL (no cuentan como duplicados).
+"""
+import sys
+
+
+if __name__ == "__main__":
+    print("🚀 Migrando adjuntos de tickets...")
+
+    from app import app
+    from models import db
+    from migrate_schema import migrar_esquema
+    from ticket_attachments import rellenar_adjuntos
+
+    with app.app_context():
+        try:
+            migrar_esquema(db)
+            creadas, sin_archivo = rellenar_adjuntos()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error al migrar los adjuntos: {str(e)}")
+            sys.exit(1)
+
+    print(f"✅ Adjuntos migrados: {creadas}")
+    if sin_archivo:
+        print(f"⚠️ {sin_archivo} archivos no se encontraron en Cloud Storage ni en uploads (sin SHA-256)")
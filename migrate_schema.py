@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Script para aplicar a una base existente los cambios de esquema de models.py
+
+db.create_all() solo crea las tablas que faltan; este script agrega además
+las columnas e índices nuevos de las tablas que ya existen. Es idempotente:
+puede ejecutarse varias veces sin efecto sobre lo ya aplicado.
+"""
+import sys
+from sqlalchemy import inspect, text
+
+
+def columnas_faltantes(inspector, tabla):
+    """Devuelve las columnas del modelo que no existen en la tabla de la base"""
+    existentes = {c['name'] for c in inspector.get_columns(tabla.name)}
+    return [c for c in tabla.columns if c.name not in existentes]
+
+
+def indices_faltantes(inspector, tabla, conn):
+    """Devuelve los índices del modelo que no existen en la tabla de la base"""
+    existentes = {i['name'] for i in inspector.get_indexes(tabla.name)}
+    return [
+        i for i in tabla.indexes
+        if i.name not in existentes and aplica_al_motor(i, conn.engine)
+    ]
+
+
+def aplica_al_motor(indice, engine):
+    """Los índices FULLTEXT (mysql_prefix='FULLTEXT') solo existen en MySQL"""
+    if indice.dialect_options['mysql']['prefix'] == 'FULLTEXT':
+        return engine.dialect.name == 'mysql'
+    return True
+
+
+def migrar_esquema(db):
+    """Crea tablas, columnas e índices faltantes"""
+    engine = db.engine
+    db.create_all()
+    inspector = inspect(engine)
+    tablas_existentes = set(inspector.get_table_names())
+
+    cambios = 0
+    with engine.begin() as conn:
+        for tabla in db.metadata.sorted_tables:
+            if tabla.name not in tablas_existentes:
+                continue
+
+            for columna in columnas_faltantes(inspector, tabla):
+                tipo = columna.type.compile(dialect=engine.dialect)
+                nulo = '' if columna.nullable else ' NOT NULL'
+                defecto = ''
+                if columna.server_default is not None:
+                    defecto = f" DEFAULT {columna.server_default.arg}"
+                print(f"🔄 Agregando columna {tabla.name}.{columna.name}")
+                conn.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {tipo}{defecto}{nulo}"))
+                cambios += 1
+
+            for indice in indices_faltantes(inspector, tabla, conn):
+                print(f"🔄 Creando índice {indice.name} en {tabla.name}")
+                indice.create(conn)
+                cambios += 1
+
+    return cambios
+
+
+if __name__ == "__main__":
+    print("🚀 Iniciando migración de esquema...")
+
+    from app import app
+    from models import db
+
+    with app.app_context():
+        try:
+            cambios = migrar_esquema(db)
+        except Exception as e:
+            print(f"❌ Error al migrar el esquema: {str(e)}")
+            sys.exit(1)
+
+    if cambios:
+        print(f"✅ Cambios aplicados: {cambios}")
+    else:
+        print("✅ El esquema ya estaba actualizado")
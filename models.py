@@ -8,6 +8,10 @@ db = SQLAlchemy()
 
 CHILE_TZ = pytz.timezone('America/Santiago')  
 
+# ✅ Marcas de modificación en UTC: no se repiten al volver del horario de verano
+def ahora_utc():
+    return datetime.utcnow()
+
 # 🔹 Tabla intermedia para la relación muchos a muchos entre Agentes y Departamentos
 ticket_pivot_departamento_agente = Table(
     'ticket_pivot_departamento_agente',
@@ -101,8 +105,13 @@ class Usuario(db.Model):
     # ✅ Método para obtener nombre completo
     @property
     def nombre_completo(self):
-        apellido_materno = f" {self.apellido_materno}" if self.apellido_materno else ""
-        return f"{self.nombre} {self.apellido_paterno}{apellido_materno}".strip()
+        return Usuario.formatear_nombre(self.nombre, self.apellido_paterno, self.apellido_materno)
+
+    # ✅ Mismo formato que nombre_completo, para filas que no cargan el objeto Usuario
+    @staticmethod
+    def formatear_nombre(nombre, apellido_paterno, apellido_materno=None):
+        apellido_materno = f" {apellido_materno}" if apellido_materno else ""
+        return f"{nombre} {apellido_paterno}{apellido_materno}".strip()
 
 # 🔹 Modelo TicketEstado
 class TicketEstado(db.Model):
@@ -138,6 +147,22 @@ class Categoria(db.Model):
 # 🔹 Modelo Ticket
 class Ticket(db.Model):
     __tablename__ = 'ticket_fact_registro'
+    __table_args__ = (
+        # Paginación por clave del listado (fecha_creacion desc, id desc)
+        db.Index('idx_ticket_fecha_creacion_id', 'fecha_creacion', 'id'),
+        # Filtros del listado por visibilidad y por parámetros de consulta
+        db.Index('idx_ticket_departamento_fecha', 'id_departamento', 'fecha_creacion'),
+        db.Index('idx_ticket_usuario_fecha', 'id_usuario', 'fecha_creacion'),
+        db.Index('idx_ticket_agente_estado', 'id_agente', 'id_estado'),
+        db.Index('idx_ticket_estado_fecha', 'id_estado', 'fecha_creacion'),
+        # Sincronización incremental (/tickets/changes)
+        db.Index('idx_ticket_fecha_modificacion', 'fecha_modificacion', 'id'),
+        # Histogramas de SLA por día de asignación y de cierre (ticket_sla.py)
+        db.Index('idx_ticket_fecha_cierre', 'fecha_cierre'),
+        db.Index('idx_ticket_fecha_primera_asignacion', 'fecha_primera_asignacion'),
+        # Búsqueda de texto completo (en SQLite se usa FTS5, ver ticket_search.py)
+        db.Index('ft_ticket_titulo_descripcion', 'titulo', 'descripcion', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
     id = db.Column(Integer, primary_key=True, autoincrement=True)
     id_usuario = db.Column(String(45), ForeignKey('general_dim_usuario.id'), nullable=False)
     id_agente = db.Column(String(45), ForeignKey('general_dim_usuario.id'), nullable=True)
@@ -151,6 +176,8 @@ class Ticket(db.Model):
     fecha_creacion = db.Column(DateTime, nullable=False, default=lambda: datetime.now(CHILE_TZ))
     fecha_cierre = db.Column(DateTime, nullable=True)
     adjunto = db.Column(String(255), nullable=True)
+    fecha_modificacion = db.Column(DateTime, nullable=True, default=ahora_utc, onupdate=ahora_utc)
+    fecha_primera_asignacion = db.Column(DateTime, nullable=True)
 
     # Relaciones
     usuario = db.relationship('Usuario', foreign_keys=[id_usuario], backref='tickets_creados')
@@ -164,16 +191,42 @@ class Ticket(db.Model):
 # 🔹 Modelo TicketComentario
 class TicketComentario(db.Model):
     __tablename__ = 'ticket_pivot_comentario_registro'
+    __table_args__ = (
+        # Búsqueda de texto completo (en SQLite se usa FTS5, ver ticket_search.py)
+        db.Index('ft_comentario_comentario', 'comentario', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+        # Sincronización incremental (/tickets/changes)
+        db.Index('idx_comentario_fecha_modificacion', 'fecha_modificacion', 'id'),
+        # Páginas de comentarios de un ticket (before_id / after_id)
+        db.Index('idx_comentario_ticket_id', 'id_ticket', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     id_ticket = db.Column(db.Integer, ForeignKey('ticket_fact_registro.id', ondelete='CASCADE'), nullable=False)
     id_usuario = db.Column(String(45), ForeignKey('general_dim_usuario.id'), nullable=False)
     comentario = db.Column(Text, nullable=False)
     timestamp = db.Column(DateTime, default=lambda: datetime.utcnow().replace(tzinfo=pytz.utc).astimezone(CHILE_TZ))
+    fecha_modificacion = db.Column(DateTime, nullable=True, default=ahora_utc, onupdate=ahora_utc)
 
     # Relaciones con Ticket y Usuario
     ticket = db.relationship('Ticket', backref=db.backref('comentarios', cascade='all, delete-orphan', passive_deletes=True))
     usuario = db.relationship('Usuario', backref='comentarios', lazy='joined')
 
+# 🔹 Archivos adjuntos de un ticket (Ticket.adjunto guarda los mismos nombres separados por comas, ver ticket_attachments.py)
+class TicketAdjunto(db.Model):
+    __tablename__ = 'ticket_fact_adjunto'
+    __table_args__ = (
+        # Detección de archivos duplicados en el mismo ticket
+        db.Index('idx_adjunto_ticket_sha256', 'id_ticket', 'sha256'),
+    )
+    id = db.Column(Integer, primary_key=True, autoincrement=True)
+    id_ticket = db.Column(Integer, ForeignKey('ticket_fact_registro.id', ondelete='CASCADE'), nullable=False)
+    nombre = db.Column(String(255), nullable=False, unique=True)   # nombre del objeto en Cloud Storage
+    tamano = db.Column(Integer, nullable=True)                     # bytes
+    tipo_contenido = db.Column(String(100), nullable=True)
+    sha256 = db.Column(String(64), nullable=True)                  # NULL si el archivo no se encontró al migrar
+    fecha_subida = db.Column(DateTime, nullable=False, default=ahora_utc)
+
+    ticket = db.relationship('Ticket', backref=db.backref('adjuntos', cascade='all, delete-orphan', passive_deletes=True))
+
 # 🔹 Modelo Departamento
 class Departamento(db.Model):
     __tablename__ = 'general_dim_departamento'
@@ -200,3 +253,110 @@ class App(db.Model):
     
     # Relación con usuarios a través de la tabla pivot
     usuarios = relationship("Usuario", secondary=usuario_pivot_app_usuario, back_populates="apps")
+
+# 🔹 Versión de cambios por ámbito (validadores ETag de listados y catálogos, ver change_versions.py)
+class VersionAmbito(db.Model):
+    __tablename__ = 'ticket_dim_version_ambito'
+    ambito = db.Column(String(100), primary_key=True)
+    version = db.Column(Integer, nullable=False, default=0)
+
+# 🔹 Avisos de invalidación de cachés entre instancias (ver invalidation_bus.py)
+class Invalidacion(db.Model):
+    __tablename__ = 'ticket_fact_invalidacion'
+    __table_args__ = (
+        db.Index('idx_invalidacion_fecha', 'fecha'),
+    )
+    id = db.Column(Integer, primary_key=True, autoincrement=True)
+    canal = db.Column(String(45), nullable=False)      # 'catalogos' o 'autorizacion'
+    clave = db.Column(String(100), nullable=False)     # catálogo o id de usuario afectado
+    fecha = db.Column(DateTime, nullable=False, default=ahora_utc)
+
+# 🔹 Respuestas guardadas por Idempotency-Key (reintentos de creación, ver idempotency.py)
+class RespuestaIdempotente(db.Model):
+    __tablename__ = 'ticket_fact_idempotencia'
+    __table_args__ = (
+        db.Index('idx_idempotencia_expiracion', 'fecha_expiracion'),
+    )
+    clave = db.Column(String(150), primary_key=True)       # '<id usuario>:<Idempotency-Key>'
+    huella = db.Column(String(64), nullable=False)         # sha256 de método, ruta y cuerpo
+    estado = db.Column(Integer, nullable=True)             # código HTTP (NULL mientras se procesa)
+    respuesta = db.Column(Text, nullable=True)
+    fecha_expiracion = db.Column(DateTime, nullable=False)
+
+# 🔹 Bandeja de salida de correos (se escribe en la transacción del cambio, ver email_outbox.py)
+class CorreoSalida(db.Model):
+    __tablename__ = 'ticket_fact_correo'
+    __table_args__ = (
+        db.Index('idx_correo_pendientes', 'estado', 'proximo_intento'),
+    )
+    id = db.Column(Integer, primary_key=True, autoincrement=True)
+    destinatario = db.Column(String(150), nullable=False)
+    asunto = db.Column(String(255), nullable=False)
+    cuerpo = db.Column(Text(16777215), nullable=False)     # MEDIUMTEXT: los resúmenes de importación son largos
+    estado = db.Column(String(20), nullable=False, default='pendiente')  # pendiente, enviado o fallido
+    intentos = db.Column(Integer, nullable=False, default=0)
+    proximo_intento = db.Column(DateTime, nullable=False, default=ahora_utc)
+    reclamado = db.Column(String(32), nullable=True)       # lote del proceso que lo está enviando
+    agrupacion = db.Column(String(50), nullable=True)      # 'ticket:<id>': se combina con los del mismo destinatario
+    ultimo_error = db.Column(String(500), nullable=True)
+    fecha_creacion = db.Column(DateTime, nullable=False, default=ahora_utc)
+    fecha_envio = db.Column(DateTime, nullable=True)
+
+# 🔹 Eventos de notificación de tickets (se convierten en correos fuera de la petición, ver ticket_notifications.py)
+class EventoNotificacion(db.Model):
+    __tablename__ = 'ticket_fact_evento_notificacion'
+    __table_args__ = (
+        db.Index('idx_evento_pendientes', 'estado', 'proximo_intento'),
+    )
+    id = db.Column(Integer, primary_key=True, autoincrement=True)
+    tipo = db.Column(String(20), nullable=False)           # creacion, cambio_estado, comentario, reasignacion o cierre
+    id_ticket = db.Column(Integer, nullable=False)
+    id_actor = db.Column(String(45), nullable=True)
+    datos = db.Column(String(255), nullable=True)          # JSON con los ids propios del tipo (estado, comentario, agentes)
+    estado = db.Column(String(20), nullable=False, default='pendiente')  # pendiente o fallido
+    intentos = db.Column(Integer, nullable=False, default=0)
+    proximo_intento = db.Column(DateTime, nullable=False, default=ahora_utc)
+    reclamado = db.Column(String(32), nullable=True)       # lote del proceso que lo está procesando
+    ultimo_error = db.Column(String(500), nullable=True)
+    fecha = db.Column(DateTime, nullable=False, default=ahora_utc)
+
+# 🔹 Registro de tickets y comentarios eliminados (tombstones para /tickets/changes, ver ticket_changes.py)
+class RegistroEliminado(db.Model):
+    __tablename__ = 'ticket_fact_eliminacion'
+    __table_args__ = (
+        db.Index('idx_eliminacion_fecha', 'fecha_eliminacion'),
+    )
+    id = db.Column(Integer, primary_key=True, autoincrement=True)
+    tipo = db.Column(String(20), nullable=False)  # 'ticket' o 'comentario'
+    id_registro = db.Column(Integer, nullable=False)
+    id_ticket = db.Column(Integer, nullable=False)
+    # Departamento y creador del ticket al eliminarse, para aplicar la visibilidad
+    id_departamento = db.Column(Integer, nullable=True)
+    id_usuario = db.Column(String(45), nullable=True)
+    fecha_eliminacion = db.Column(DateTime, nullable=False, default=ahora_utc)
+
+# 🔹 Contadores de tickets por ámbito y dimensión (estadísticas, ver ticket_stats.py)
+class ResumenTicket(db.Model):
+    __tablename__ = 'ticket_fact_resumen'
+    ambito = db.Column(String(100), primary_key=True)      # 'departamento:<id>' o 'usuario:<id>'
+    dimension = db.Column(String(20), primary_key=True)    # estado, departamento, agente, sucursal o prioridad
+    valor = db.Column(String(45), primary_key=True)        # id del valor ('' = sin asignar)
+    cantidad = db.Column(Integer, nullable=False, default=0)
+
+# 🔹 Tickets abiertos y asignados por agente en cada departamento (asignación automática, ver ticket_assignment.py)
+class CargaAgente(db.Model):
+    __tablename__ = 'ticket_fact_carga_agente'
+    id_departamento = db.Column(Integer, primary_key=True)
+    id_agente = db.Column(String(45), primary_key=True)
+    abiertos = db.Column(Integer, nullable=False, default=0)   # tickets del agente que no están cerrados
+    ultimo_ticket = db.Column(Integer, nullable=True)          # último ticket asignado (desempate por turnos)
+
+# 🔹 Histogramas diarios de tiempos de asignación y cierre (SLA, ver ticket_sla.py)
+class HistogramaSLA(db.Model):
+    __tablename__ = 'ticket_fact_histograma_sla'
+    fecha = db.Column(Date, primary_key=True)              # día de la asignación o del cierre
+    metrica = db.Column(String(20), primary_key=True)      # 'asignacion' o 'cierre'
+    dimension = db.Column(String(20), primary_key=True)    # departamento, categoria o agente
+    valor = db.Column(String(45), primary_key=True)        # id del valor ('' = sin asignar)
+    cubeta = db.Column(Integer, primary_key=True)          # cubeta logarítmica de la duración
+    cantidad = db.Column(Integer, nullable=False)
@@ -0,0 +1,95 @@
+"""
+Hash y verificación de claves con bcrypt fuera de los hilos de gunicorn
+
+bcrypt tarda cientos de milisegundos por clave a propósito. Calculado dentro
+de la petición, una ráfaga de logins ocupa los pocos hilos del worker y las
+demás peticiones esperan. Aquí el cálculo corre en un pool acotado de
+procesos (BCRYPT_PROCESOS) con una cola de espera limitada (BCRYPT_COLA):
+cuando ambos están llenos se lanza HashSaturado de inmediato y la ruta
+responde 503, así los hilos quedan libres para el resto de las peticiones.
+
+BCRYPT_ROUNDS define el factor de trabajo de las claves nuevas; las claves
+guardadas se verifican con el factor con que se crearon. Con
+BCRYPT_PROCESOS=0 se calcula en el hilo de la petición, sin límite.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from flask import current_app
+
+ROUNDS_POR_DEFECTO = 12
+PROCESOS_POR_DEFECTO = 2
+COLA_POR_DEFECTO = 1
+
+# Espera máxima por un resultado del pool
+TIMEOUT_SEGUNDOS = 30
+
+
+class HashSaturado(Exception):
+    """El pool de bcrypt y su cola están llenos: responder 503"""
+
+
+# 🔹 Trabajo que corre en los procesos del pool (solo depende de bcrypt)
+def _generar(clave, rounds):
+    return bcrypt.hashpw(clave, bcrypt.gensalt(rounds))
+
+
+def _verificar(clave, hash_guardado):
+    return bcrypt.checkpw(clave, hash_guardado)
+
+
+# 🔹 Pool del proceso actual, creado en el primer uso (después del fork de gunicorn)
+_pool = None
+_cupos = None
+_candado = threading.Lock()
+
+
+def _obtener_pool():
+    global _pool, _cupos
+    with _candado:
+        if _pool is None:
+            procesos = current_app.config.get('BCRYPT_PROCESOS', PROCESOS_POR_DEFECTO)
+            cola = current_app.config.get('BCRYPT_COLA', COLA_POR_DEFECTO)
+            # Con fork los hijos heredarían los hilos y candados del worker (SQLAlchemy, el bus de
+            # invalidación, el enviador de correos) en el estado en que estaban; forkserver parte limpio
+            _pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('forkserver'))
+            _cupos = threading.BoundedSemaphore(procesos + cola)
+        return _pool, _cupos
+
+
+def cerrar_pool():
+    """Detiene el pool; el próximo hash crea uno nuevo con la configuración vigente"""
+    global _pool, _cupos
+    with _candado:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = _cupos = None
+
+
+def _ejecutar(funcion, *args):
+    if current_app.config.get('BCRYPT_PROCESOS', PROCESOS_POR_DEFECTO) <= 0:
+        return funcion(*args)
+    pool, cupos = _obtener_pool()
+    if not cupos.acquire(blocking=False):
+        raise HashSaturado()
+    try:
+        return pool.submit(funcion, *args).result(timeout=TIMEOUT_SEGUNDOS)
+    except BrokenProcessPool:
+        # Un proceso del pool murió (por ejemplo, por memoria): se crea otro en el próximo uso
+        cerrar_pool()
+        raise
+    finally:
+        cupos.release()
+
+
+def generar_hash(clave):
+    """Hash bcrypt de la clave con BCRYPT_ROUNDS, como texto"""
+    rounds = current_app.config.get('BCRYPT_ROUNDS', ROUNDS_POR_DEFECTO)
+    return _ejecutar(_generar, clave.encode('utf-8'), rounds).decode('utf-8')
+
+
+def verificar_clave(clave, hash_guardado):
+    """True si la clave corresponde al hash guardado"""
+    return _ejecutar(_verificar, clave.encode('utf-8'), hash_guardado.encode('utf-8'))
@@ -0,0 +1,180 @@
+"""
+Usuario autenticado de la petición (principal)
+
+Se construye una sola vez por petición y queda en flask.g: el usuario con su
+rol y los ids de sus departamentos, sucursales autorizadas y apps. Los
+decoradores de permisos y las rutas lo leen de ahí en vez de volver a
+consultar el usuario y cargar sus relaciones una por una.
+
+Con JWT_CLAIMS_AUTORIZACION activado, login y refresh incluyen esos datos
+en el token (claim "autorizacion") junto con la versión de autorización del
+usuario (ámbito "autorizacion:<id>" de change_versions.py). Mientras esa
+versión no cambie, el principal se arma desde el token sin consultar la base
+de datos; la versión se lee con un caché en memoria de AUTORIZACION_CACHE_TTL
+segundos. Cambiar el rol, los departamentos o las apps de un usuario
+incrementa su versión (invalidar_autorizacion) y sus tokens anteriores
+vuelven a cargar los permisos desde la base de datos hasta que se renueven.
+Además se publica un aviso en el canal "autorizacion" de invalidation_bus.py
+para que las demás instancias descarten la versión guardada sin esperar el TTL.
+"""
+import threading
+import time
+from flask import current_app, g
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy import func, select
+from sqlalchemy.orm import contains_eager
+from models import (db, Usuario, Rol, VersionAmbito, ticket_pivot_departamento_agente,
+                    usuario_pivot_sucursal_usuario, usuario_pivot_app_usuario)
+from change_versions import ambito_autorizacion, sentencia_incremento
+from invalidation_bus import publicar, suscribir
+
+CLAIM_AUTORIZACION = 'autorizacion'
+CANAL_AUTORIZACION = 'autorizacion'
+
+# Segundos que un proceso confía en la versión de autorización leída
+TTL_POR_DEFECTO = 30
+
+
+class Principal:
+    """Usuario autenticado con los datos que usan los permisos y la visibilidad"""
+
+    def __init__(self, id, rol, departamentos, sucursales, apps, usuario=None):
+        self.id = id
+        self.rol = rol
+        self.departamentos = departamentos
+        self.sucursales = sucursales
+        self.apps = apps
+        self._usuario = usuario
+
+    @property
+    def usuario(self):
+        """Modelo Usuario; si el principal viene del token se consulta al usarlo"""
+        if self._usuario is None:
+            self._usuario = Usuario.query.get(self.id)
+        return self._usuario
+
+    def tiene_rol(self, *roles):
+        return self.rol in roles
+
+    @property
+    def es_administrador(self):
+        return self.rol == "ADMINISTRADOR"
+
+    @property
+    def es_agente(self):
+        return self.rol == "AGENTE"
+
+
+def _ids(tabla, columna):
+    """Ids relacionados con el usuario, concatenados en una subconsulta"""
+    return select(func.group_concat(tabla.c[columna])).where(
+        tabla.c.id_usuario == Usuario.id
+    ).scalar_subquery()
+
+
+def _separar(valor):
+    return tuple(sorted({int(v) for v in valor.split(',')})) if valor else ()
+
+
+def cargar_principal(usuario_id):
+    """Usuario, rol, departamentos, sucursales autorizadas y apps en una consulta"""
+    fila = db.session.query(
+        Usuario,
+        _ids(ticket_pivot_departamento_agente, 'id_departamento'),
+        _ids(usuario_pivot_sucursal_usuario, 'id_sucursal'),
+        _ids(usuario_pivot_app_usuario, 'id_app'),
+    ).outerjoin(Rol, Usuario.id_rol == Rol.id).options(
+        contains_eager(Usuario.rol_obj)
+    ).filter(Usuario.id == usuario_id).first()
+    if fila is None:
+        return None
+    usuario, departamentos, sucursales, apps = fila
+    return Principal(
+        usuario.id,
+        usuario.rol_obj.nombre if usuario.rol_obj else None,
+        _separar(departamentos),
+        _separar(sucursales),
+        frozenset(_separar(apps)),
+        usuario=usuario,
+    )
+
+
+# 🔹 Versión de autorización
+_versiones = {}
+_candado_versiones = threading.Lock()
+
+
+def version_autorizacion(usuario_id):
+    """Versión de autorización del usuario, leída a lo más una vez cada TTL por proceso"""
+    ahora = time.monotonic()
+    with _candado_versiones:
+        guardada = _versiones.get(usuario_id)
+    if guardada and guardada[1] > ahora:
+        return guardada[0]
+
+    version = db.session.execute(
+        select(VersionAmbito.version).where(VersionAmbito.ambito == ambito_autorizacion(usuario_id))
+    ).scalar() or 0
+    ttl = current_app.config.get('AUTORIZACION_CACHE_TTL', TTL_POR_DEFECTO)
+    with _candado_versiones:
+        _versiones[usuario_id] = (version, ahora + ttl)
+    return version
+
+
+def invalidar_autorizacion(usuario_id):
+    """
+    Incrementa la versión de autorización del usuario en la transacción actual:
+    los tokens emitidos antes dejan de usarse como fuente de sus permisos.
+    Todos los procesos descartan la versión guardada después del commit.
+    """
+    conexion = db.session.connection()
+    conexion.execute(sentencia_incremento(conexion.dialect.name, [ambito_autorizacion(usuario_id)]))
+    olvidar_version(usuario_id)
+    publicar(CANAL_AUTORIZACION, usuario_id)
+
+
+def olvidar_version(usuario_id):
+    with _candado_versiones:
+        _versiones.pop(usuario_id, None)
+
+
+suscribir(CANAL_AUTORIZACION, olvidar_version)
+
+
+# 🔹 Claims del token
+def claims_autorizacion(usuario_id):
+    """Claims adicionales para create_access_token ({} si la opción está desactivada)"""
+    if not current_app.config.get('JWT_CLAIMS_AUTORIZACION'):
+        return {}
+    principal = cargar_principal(usuario_id)
+    if principal is None:
+        return {}
+    return {CLAIM_AUTORIZACION: {
+        'v': version_autorizacion(principal.id),
+        'rol': principal.rol,
+        'departamentos': list(principal.departamentos),
+        'sucursales': list(principal.sucursales),
+        'apps': sorted(principal.apps),
+    }}
+
+
+def _principal_desde_token(usuario_id):
+    """Principal armado con los claims del token, si su versión sigue vigente"""
+    claims = get_jwt().get(CLAIM_AUTORIZACION)
+    if not claims or claims.get('v') != version_autorizacion(usuario_id):
+        return None
+    return Principal(
+        usuario_id,
+        claims['rol'],
+        tuple(claims['departamentos']),
+        tuple(claims['sucursales']),
+        frozenset(claims['apps']),
+    )
+
+
+def obtener_principal():
+    """Principal de la petición actual (None si el usuario del token no existe)"""
+    if 'principal' not in g:
+        usuario_id = get_jwt_identity()
+        g.principal = _principal_desde_token(usuario_id) or cargar_principal(usuario_id)
+    return g.principal
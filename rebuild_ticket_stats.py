@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Script para recalcular desde cero los contadores de /tickets/stats y las
+cargas de los agentes usadas en la asignación automática
+
+Los contadores de ticket_fact_resumen y ticket_fact_carga_agente se mantienen
+solos al crear, editar o eliminar tickets desde la API. Este script los
+reconstruye a partir de ticket_fact_registro: hay que ejecutarlo una vez al
+desplegar las tablas y cada vez que se modifiquen tickets por fuera de la API. Conviene correrlo
+con poco tráfico: los cambios hechos mientras se ejecuta pueden perderse.
+"""
+import sys
+
+
+if __name__ == "__main__":
+    print("🚀 Reconstruyendo estadísticas de tickets...")
+
+    from app import app
+    from models import db, ResumenTicket, CargaAgente
+    from ticket_stats import reconstruir_resumen
+    from ticket_assignment import reconstruir_cargas
+
+    with app.app_context():
+        try:
+            reconstruir_resumen()
+            reconstruir_cargas()
+            filas = ResumenTicket.query.count()
+            cargas = CargaAgente.query.count()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error al reconstruir las estadísticas: {str(e)}")
+            sys.exit(1)
+
+    print(f"✅ Estadísticas reconstruidas: {filas} contadores, {cargas} cargas de agentes")
@@ -6,6 +6,7 @@ from models import (db, Usuario, Ticket, TicketComentario, TicketEstado,
                    TicketPrioridad, Departamento, Sucursal, Rol, Estado, 
                    PerfilUsuario, ticket_pivot_departamento_agente, 
                    usuario_pivot_sucursal_usuario, Categoria, usuario_pivot_app_usuario)
+from sqlalchemy.orm import joinedload, selectinload
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
@@ -14,21 +15,44 @@ from functools import wraps
 from itertools import chain  # Importar para combinar listas sin duplicados
 import pytz
 from flask import send_from_directory
-import random
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
-from utils import enviar_correo_async, enviar_correo
+from utils import enviar_correo
+from ticket_notifications import registrar_evento, CREACION, CAMBIO_ESTADO, COMENTARIO, REASIGNACION, CIERRE
 from cloud_storage import storage_manager
-import bcrypt
-import hashlib
+from ticket_listing import obtener_listado, transmitir_listado, criterios_visibilidad, ParametroInvalido
+from json_streaming import modo_streaming, iterar_por_clave, respuesta_json_en_streaming
+from password_hashing import generar_hash, verificar_clave, HashSaturado
+from principal import obtener_principal, claims_autorizacion, invalidar_autorizacion
+from ticket_detail import obtener_detalle, listar_comentarios, paginar_comentarios, pide_pagina
+from ticket_search import buscar_tickets
+from ticket_changes import obtener_cambios
+from ticket_stats import obtener_estadisticas
+from ticket_sla import obtener_sla
+from ticket_assignment import elegir_agente
+from ticket_import import leer_filas, importar_tickets
+from idempotency import idempotente, confirmar
+from ticket_attachments import huella, buscar_duplicado, agregar_adjunto, quitar_adjunto, nombres_adjuntos
+from catalog_cache import obtener_fila, nombre_por_id, id_por_nombre, fila_por_nombre
+from bootstrap import obtener_bootstrap, ambitos_bootstrap, ESTADOS_USUARIO
+from change_versions import (ambitos_visibilidad, ambito_departamento, ambito_usuario, respuesta_condicional,
+                             condicional, AMBITO_CATALOGOS, AMBITO_USUARIOS)
 from datetime import datetime
 
 
 api = Blueprint('api', __name__)
 auth = Blueprint('auth', __name__)
 
+
+# 🔹 Pool de bcrypt saturado: 503 para que el cliente reintente
+@api.errorhandler(HashSaturado)
+@auth.errorhandler(HashSaturado)
+def hash_saturado(e):
+    db.session.rollback()
+    return jsonify({'error': 'El servidor está procesando muchas claves, intente nuevamente en unos segundos'}), 503, {'Retry-After': '1'}
+
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
 
@@ -39,207 +63,25 @@ def app_required(app_id):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            current_user_id = get_jwt_identity()
-            if not verificar_acceso_app(current_user_id, app_id):
+            principal = obtener_principal()
+            if not principal or app_id not in principal.apps:
                 return jsonify({'message': f'No tienes acceso a la aplicación requerida'}), 403
             return func(*args, **kwargs)
         return wrapper
     return decorator
 
-# ✅ Función auxiliar para verificar acceso a apps
-def verificar_acceso_app(usuario_id, app_id):
-    """Verifica si un usuario tiene acceso a una app específica"""
-    app_acceso = db.session.query(usuario_pivot_app_usuario).filter(
-        usuario_pivot_app_usuario.c.id_usuario == usuario_id,
-        usuario_pivot_app_usuario.c.id_app == app_id
-    ).first()
-    return app_acceso is not None
-
-# Función de notificación por correo
-def notificar_creacion_ticket(ticket, usuario, agente):
-    try:
-        agente_nombre = agente.nombre_completo if agente else "Sin asignar"
-        usuario_nombre = usuario.nombre_completo
-        sucursal_obj = Sucursal.query.get(ticket.id_sucursal)
-        sucursal_nombre = sucursal_obj.nombre if sucursal_obj else "No asignada"
-        
-        asunto = "Nuevo Ticket Creado"
-        cuerpo = f"""
-        <h1>Nuevo Ticket Creado</h1>
-        <p>Se ha creado un nuevo ticket con los siguientes detalles:</p>
-        <ul>
-            <li><strong>ID:</strong> {ticket.id}</li>
-            <li><strong>Título:</strong> {ticket.titulo}</li>
-            <li><strong>Descripción:</strong> {ticket.descripcion}</li>
-            <li><strong>Creado por:</strong> {usuario_nombre}</li>
-            <li><strong>Sucursal:</strong> {sucursal_nombre}</li>
-            <li><strong>Agente asignado:</strong> {agente_nombre}</li>
-        </ul>
-        <p>Por favor, revisa el sistema de tickets para más detalles.</p>
-        <p>https://tickets.lahornilla.cl/</p>
-        <p>Departamento de TI La Hornilla.</p>
-        """
-
-        # Enviar notificación al creador del ticket
-        enviar_correo_async(usuario.correo, asunto, cuerpo)
-
-        # Enviar notificación al agente asignado (si hay agente)
-        if agente:
-            enviar_correo_async(agente.correo, asunto, cuerpo)
-    except Exception as e:
-        print(f"Error en notificar_creacion_ticket: {str(e)}")
-
-
-# Función para notificar cambio de estado
-def notificar_cambio_estado(ticket, usuario, agente, nuevo_estado):
-    try:
-        agente_nombre = agente.nombre_completo if agente else "Sin asignar"
-        usuario_nombre = usuario.nombre_completo
-        sucursal_obj = Sucursal.query.get(ticket.id_sucursal)
-        sucursal_nombre = sucursal_obj.nombre if sucursal_obj else "No asignada"
-
-        asunto = f"Ticket {ticket.id} Cambió de Estado"
-        cuerpo = f"""
-        <h1>Cambio de Estado del Ticket</h1>
-        <p>El ticket con los siguientes detalles ha cambiado de estado:</p>
-        <ul>
-            <li><strong>ID:</strong> {ticket.id}</li>
-            <li><strong>Título:</strong> {ticket.titulo}</li>
-            <li><strong>Descripción:</strong> {ticket.descripcion}</li>
-            <li><strong>Creado por:</strong> {usuario_nombre}</li>
-            <li><strong>Sucursal:</strong> {sucursal_nombre}</li>
-            <li><strong>Agente asignado:</strong> {agente_nombre}</li>
-            <li><strong>Nuevo Estado:</strong> {nuevo_estado}</li>
-        </ul>
-        <p>Por favor, revisa el sistema para más detalles.</p>
-        <p>https://tickets.lahornilla.cl/</p>
-        <p>Departamento de TI La Hornilla.</p>
-        """
-        enviar_correo_async(usuario.correo, asunto, cuerpo)
-        if agente:
-            enviar_correo_async(agente.correo, asunto, cuerpo)
-    except Exception as e:
-        print(f"Error en notificar_cambio_estado: {str(e)}")
-
-# Función para notificar cierre de ticket
-def notificar_cierre_ticket(ticket, usuario, agente, comentario_cierre=''):
-    try:
-        agente_nombre = agente.nombre_completo if agente else "Sin asignar"
-        usuario_nombre = usuario.nombre_completo
-        sucursal_obj = Sucursal.query.get(ticket.id_sucursal)
-        sucursal_nombre = sucursal_obj.nombre if sucursal_obj else "No asignada"
-
-        asunto = f"Ticket {ticket.id} Cerrado"
-        
-        # Construir el cuerpo del correo
-        cuerpo = f"""
-        <h1>Ticket Cerrado</h1>
-        <p>El ticket con los siguientes detalles ha sido cerrado:</p>
-        <ul>
-            <li><strong>ID:</strong> {ticket.id}</li>
-            <li><strong>Título:</strong> {ticket.titulo}</li>
-            <li><strong>Descripción:</strong> {ticket.descripcion}</li>
-            <li><strong>Creado por:</strong> {usuario_nombre}</li>
-            <li><strong>Sucursal:</strong> {sucursal_nombre}</li>
-            <li><strong>Agente asignado:</strong> {agente_nombre}</li>
-        </ul>"""
-        
-        # Agregar comentario de cierre si existe
-        if comentario_cierre:
-            cuerpo += f"""
-        <h3>Comentario de cierre:</h3>
-        <blockquote>{comentario_cierre}</blockquote>"""
-        
-        cuerpo += f"""
-        <p>Por favor, revisa el sistema para más detalles.</p>
-        <p>https://tickets.lahornilla.cl/</p>
-        <p>Departamento de TI La Hornilla.</p>
-        """
-        
-        enviar_correo_async(usuario.correo, asunto, cuerpo)
-        if agente:
-            enviar_correo_async(agente.correo, asunto, cuerpo)
-    except Exception as e:
-        print(f"Error en notificar_cierre_ticket: {str(e)}")
-
-# Función para notificar nuevo comentario
-def notificar_comentario(ticket, usuario, agente, comentario):
-    try:
-        agente_nombre = agente.nombre_completo if agente else "Sin asignar"
-        usuario_nombre = usuario.nombre_completo
-        sucursal_obj = Sucursal.query.get(ticket.id_sucursal)
-        sucursal_nombre = sucursal_obj.nombre if sucursal_obj else "No asignada"
-
-        asunto = f"Nuevo Comentario en el Ticket {ticket.id}"
-        cuerpo = f"""
-        <h1>Nuevo Comentario en Ticket</h1>
-        <p>Se ha agregado un nuevo comentario al ticket con los siguientes detalles:</p>
-        <ul>
-            <li><strong>ID:</strong> {ticket.id}</li>
-            <li><strong>Título:</strong> {ticket.titulo}</li>
-            <li><strong>Descripción:</strong> {ticket.descripcion}</li>
-            <li><strong>Creado por:</strong> {usuario_nombre}</li>
-            <li><strong>Sucursal:</strong> {sucursal_nombre}</li>
-            <li><strong>Agente asignado:</strong> {agente_nombre}</li>
-        </ul>
-        <h3>Comentario:</h3>
-        <blockquote>{comentario}</blockquote>
-        <p>Por favor, revisa el sistema para más detalles.</p>
-        <p>https://tickets.lahornilla.cl/</p>
-        <p>Departamento de TI La Hornilla.</p>
-        """
-        enviar_correo_async(usuario.correo, asunto, cuerpo)
-        if agente:
-            enviar_correo_async(agente.correo, asunto, cuerpo)
-    except Exception as e:
-        print(f"Error en notificar_comentario: {str(e)}")
-
-# Función para notificar reasignación de ticket
-def notificar_reasignacion_ticket(ticket, usuario, agente_anterior, agente_nuevo):
-    try:
-        agente_anterior_nombre = agente_anterior.nombre_completo if agente_anterior else "Ninguno"
-        agente_nuevo_nombre = agente_nuevo.nombre_completo
-        usuario_nombre = usuario.nombre_completo
-        sucursal_obj = Sucursal.query.get(ticket.id_sucursal)
-        sucursal_nombre = sucursal_obj.nombre if sucursal_obj else "No asignada"
-
-        asunto = f"Ticket {ticket.id} Reasignado"
-        cuerpo = f"""
-        <h1>Ticket Reasignado</h1>
-        <p>El ticket con los siguientes detalles ha sido reasignado:</p>
-        <ul>
-            <li><strong>ID:</strong> {ticket.id}</li>
-            <li><strong>Título:</strong> {ticket.titulo}</li>
-            <li><strong>Descripción:</strong> {ticket.descripcion}</li>
-            <li><strong>Creado por:</strong> {usuario_nombre}</li>
-            <li><strong>Sucursal:</strong> {sucursal_nombre}</li>
-            <li><strong>Agente anterior:</strong> {agente_anterior_nombre}</li>
-            <li><strong>Nuevo agente asignado:</strong> {agente_nuevo_nombre}</li>
-        </ul>
-        <p>Por favor, revisa el sistema para más detalles.</p>
-        <p>https://tickets.lahornilla.cl/</p>
-        <p>Departamento de TI La Hornilla.</p>
-        """
-        enviar_correo_async(usuario.correo, asunto, cuerpo)
-        if agente_anterior:
-            enviar_correo_async(agente_anterior.correo, asunto, cuerpo)
-        enviar_correo_async(agente_nuevo.correo, asunto, cuerpo)
-    except Exception as e:
-        print(f"Error en notificar_reasignacion_ticket: {str(e)}")
-
-
-
 # 🔹 Decorador para proteger rutas según el rol  
 def role_required(roles_permitidos):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             try:
-                current_user_id = get_jwt_identity()  # Obtiene el usuario actual desde JWT
-                usuario = Usuario.query.get(current_user_id)
-                if not usuario or usuario.rol_obj.nombre not in roles_permitidos:
+                principal = obtener_principal()  # Usuario actual del JWT, cargado una vez por petición
+                if not principal or principal.rol not in roles_permitidos:
                     return jsonify({'message': 'No tienes permiso para realizar esta acción'}), 403
                 return func(*args, **kwargs)
+            except HashSaturado:
+                raise
             except Exception as e:
                 print(f"🔸 Error en role_required: {e}")
                 return jsonify({'message': 'Error al verificar permisos'}), 500
@@ -252,9 +94,8 @@ def permiso_requerido(roles_permitidos):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            current_user_id = get_jwt_identity()
-            usuario = Usuario.query.get(current_user_id)
-            if not usuario or usuario.rol_obj.nombre not in roles_permitidos:
+            principal = obtener_principal()
+            if not principal or principal.rol not in roles_permitidos:
                 return jsonify({'message': 'Acceso denegado'}), 403
             return func(*args, **kwargs)
         return wrapper
@@ -266,132 +107,122 @@ def permiso_requerido(roles_permitidos):
 @app_required(1)  # ✅ Requiere acceso a la app con id=1
 def get_tickets():
     try:
-        current_user_id = get_jwt_identity()
-        usuario = Usuario.query.get(current_user_id)
+        principal = obtener_principal()
 
-        if not usuario:
+        if not principal:
             return jsonify({"error": "Usuario no encontrado"}), 404
 
         # Obtener tickets según el rol del usuario
-        if usuario.rol_obj.nombre == "ADMINISTRADOR":
-            # Administradores ven todos los tickets
-            tickets = Ticket.query.order_by(Ticket.fecha_creacion.desc()).all()
-        elif usuario.rol_obj.nombre == "AGENTE":
-            # Obtener los departamentos asignados al agente
-            departamentos_ids = [d.id for d in usuario.departamentos]
-            
-            # Agentes ven tickets de sus departamentos asignados
-            tickets = Ticket.query.filter(
-                Ticket.id_departamento.in_(departamentos_ids)
-            ).order_by(Ticket.fecha_creacion.desc()).all()
-        else:  # Usuario normal
-            # Usuarios normales ven sus propios tickets
-            tickets = Ticket.query.filter_by(id_usuario=current_user_id).order_by(Ticket.fecha_creacion.desc()).all()
-
-        ticket_list = []
-        for ticket in tickets:
-            sucursal_obj = Sucursal.query.get(ticket.id_sucursal)
-            nombre_sucursal = sucursal_obj.nombre if sucursal_obj else "No asignada"
-            ticket_list.append({
-                "id": ticket.id,
-                "titulo": ticket.titulo,
-                "descripcion": ticket.descripcion,
-                "id_usuario": ticket.id_usuario,
-                "id_agente": ticket.id_agente,
-                "usuario": (
-                    ticket.usuario.nombre_completo
-                    if ticket.usuario else "Sin usuario"
-                ),
-                "agente": (
-                    ticket.agente.nombre_completo
-                    if ticket.agente else "Sin asignar"
-                ),
-                "estado": ticket.estado.nombre,
-                "prioridad": ticket.prioridad.nombre,
-                "departamento": ticket.departamento.nombre if ticket.departamento else None,
-                "id_departamento": ticket.id_departamento,
-                "id_categoria": ticket.id_categoria,
-                "categoria": ticket.categoria.nombre if ticket.categoria else None,
-                "sucursal": nombre_sucursal,
-                "fecha_creacion": ticket.fecha_creacion.astimezone(CHILE_TZ).strftime('%Y-%m-%d %H:%M:%S') if ticket.fecha_creacion else None,
-                "fecha_cierre": ticket.fecha_cierre.astimezone(CHILE_TZ).strftime('%Y-%m-%d %H:%M:%S') if ticket.fecha_cierre else None,
-                "adjunto": ticket.adjunto,
-                "id_prioridad": ticket.id_prioridad,
-                "id_estado": ticket.id_estado
-            })
+        criterios = criterios_visibilidad(principal)
+        ambitos = ambitos_visibilidad(principal) + [AMBITO_CATALOGOS, AMBITO_USUARIOS]
 
-        return jsonify(ticket_list), 200
+        # 304 si el cliente ya tiene esta versión del listado (If-None-Match)
+        if modo_streaming(request.args):
+            return respuesta_condicional(ambitos, lambda: transmitir_listado(request.args, *criterios))
+        return respuesta_condicional(ambitos, lambda: obtener_listado(request.args, *criterios))
 
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"🔸 Error en get_tickets: {str(e)}")
         return jsonify({'error': 'Ocurrió un error al obtener los tickets'}), 500
 
+# Ruta de estadísticas de tickets (cantidades por estado, departamento, agente, sucursal y prioridad)
+@api.route('/tickets/stats', methods=['GET'])
+@jwt_required()
+@app_required(1)
+def get_tickets_stats():
+    try:
+        principal = obtener_principal()
+
+        if not principal:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+
+        return jsonify(obtener_estadisticas(principal)), 200
+
+    except Exception as e:
+        print(f"🔸 Error en get_tickets_stats: {str(e)}")
+        return jsonify({'error': 'Ocurrió un error al obtener las estadísticas de tickets'}), 500
+
+# Ruta de métricas de SLA (percentiles de tiempo hasta asignación y cierre)
+@api.route('/tickets/sla', methods=['GET'])
+@jwt_required()
+@role_required(['ADMINISTRADOR'])
+def get_tickets_sla():
+    try:
+        return jsonify(obtener_sla(request.args)), 200
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"🔸 Error en get_tickets_sla: {str(e)}")
+        return jsonify({'error': 'Ocurrió un error al obtener las métricas de SLA'}), 500
+
+# Ruta de sincronización incremental: cambios desde la marca since
+@api.route('/tickets/changes', methods=['GET'])
+@jwt_required()
+@app_required(1)
+def get_tickets_changes():
+    try:
+        principal = obtener_principal()
+
+        if not principal:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+
+        return jsonify(obtener_cambios(request.args, principal)), 200
+
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"🔸 Error en get_tickets_changes: {str(e)}")
+        return jsonify({'error': 'Ocurrió un error al obtener los cambios de tickets'}), 500
+
+# Ruta para buscar tickets por texto (título, descripción y comentarios)
+@api.route('/tickets/search', methods=['GET'])
+@jwt_required()
+@app_required(1)
+def search_tickets():
+    try:
+        principal = obtener_principal()
+
+        if not principal:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+
+        # Mismas reglas de visibilidad que el listado de tickets
+        resultado = buscar_tickets(request.args, *criterios_visibilidad(principal))
+
+        return jsonify(resultado), 200
+
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"🔸 Error en search_tickets: {str(e)}")
+        return jsonify({'error': 'Ocurrió un error al buscar los tickets'}), 500
+
 @api.route('/tickets/<int:id>', methods=['GET'])
 @jwt_required()
 def get_ticket(id):
-    ticket = Ticket.query.get(id)
-    if not ticket:
-        return jsonify({'message': 'Ticket no encontrado'}), 404
+    try:
+        # Ticket con sus nombres en una consulta y sus comentarios (o la página pedida) en otra
+        ticket_data = obtener_detalle(id, request.args)
+        if ticket_data is None:
+            return jsonify({'message': 'Ticket no encontrado'}), 404
+        return jsonify(ticket_data), 200
 
-    # Obtener comentarios del ticket
-    comentarios = TicketComentario.query.filter_by(id_ticket=id).all()
-    comentarios_list = [
-        {
-            'id': c.id,
-            'id_ticket': c.id_ticket,
-            'id_usuario': c.id_usuario,
-            'usuario': (
-                Usuario.query.get(c.id_usuario).nombre_completo
-                if Usuario.query.get(c.id_usuario) else None
-            ),
-            'comentario': c.comentario,
-            'creado': c.timestamp.strftime('%Y-%m-%d %H:%M:%S') if c.timestamp else None
-        }
-        for c in comentarios
-    ]
-
-    sucursal_obj = Sucursal.query.get(ticket.id_sucursal)
-    nombre_sucursal = sucursal_obj.nombre if sucursal_obj else "No asignada"
-    ticket_data = {
-        "id": ticket.id,
-        "titulo": ticket.titulo,
-        "descripcion": ticket.descripcion,
-        "id_usuario": ticket.id_usuario,
-        "id_agente": ticket.id_agente,
-        "usuario": (
-            ticket.usuario.nombre_completo
-            if ticket.usuario else "Sin usuario"
-        ),
-        "agente": (
-            ticket.agente.nombre_completo
-            if ticket.agente else "Sin asignar"
-        ),
-        "estado": ticket.estado.nombre if ticket.estado else None,
-        "prioridad": ticket.prioridad.nombre if ticket.prioridad else None,
-        "departamento": ticket.departamento.nombre if ticket.departamento else None,
-        "id_departamento": ticket.id_departamento,
-        "id_categoria": ticket.id_categoria,
-        "categoria": ticket.categoria.nombre if ticket.categoria else None,
-        "sucursal": nombre_sucursal,
-        "fecha_creacion": ticket.fecha_creacion.astimezone(CHILE_TZ).strftime('%Y-%m-%d %H:%M:%S') if ticket.fecha_creacion else None,
-        "fecha_cierre": ticket.fecha_cierre.astimezone(CHILE_TZ).strftime('%Y-%m-%d %H:%M:%S') if ticket.fecha_cierre else None,
-        "adjunto": ticket.adjunto,
-        "comentarios": comentarios_list,
-        "id_prioridad": ticket.id_prioridad,
-        "id_estado": ticket.id_estado
-    }
-    return jsonify(ticket_data), 200
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
 
 # Ruta para crear un nuevo ticket
 @api.route('/tickets', methods=['POST'])
 @jwt_required()
 @permiso_requerido(['ADMINISTRADOR', 'AGENTE', 'USUARIO'])
 @app_required(1)  # ✅ Requiere acceso a la app con id=1
+@idempotente
 def create_ticket():
     try:
         data = request.get_json()
-        current_user_id = str(get_jwt_identity())
-        current_user = Usuario.query.get(current_user_id)
+        principal = obtener_principal()
+        current_user = principal.usuario
+        current_user_id = principal.id
         id_departamento = data.get('id_departamento')
         id_categoria = data.get('id_categoria')
 
@@ -402,7 +233,7 @@ def create_ticket():
             return jsonify({'error': 'Debe seleccionar una categoría'}), 400
 
         # Verificar que la categoría pertenece al departamento
-        categoria = Categoria.query.get(id_categoria)
+        categoria = obtener_fila('categoria', id_categoria)
         if not categoria or categoria.id_departamento != id_departamento:
             return jsonify({'error': 'La categoría no pertenece al departamento seleccionado'}), 400
 
@@ -411,7 +242,7 @@ def create_ticket():
         if categoria and categoria.id_usuario:
             # Verificar que el agente asignado a la categoría pertenece al departamento
             agente_categoria = Usuario.query.get(categoria.id_usuario)
-            if agente_categoria and agente_categoria.rol_obj.nombre == 'AGENTE':
+            if agente_categoria and nombre_por_id('rol', agente_categoria.id_rol) == 'AGENTE':
                 # Verificar que el agente pertenece al departamento
                 agente_en_departamento = db.session.query(ticket_pivot_departamento_agente).filter(
                     ticket_pivot_departamento_agente.c.id_usuario == categoria.id_usuario,
@@ -421,23 +252,20 @@ def create_ticket():
                 if agente_en_departamento:
                     id_agente = str(categoria.id_usuario)
         
-        # Si no hay agente asignado a la categoría, asignar aleatoriamente
+        # Si no hay agente asignado a la categoría, al agente del departamento con menos tickets abiertos
         if not id_agente:
-            agentes = Usuario.query.join(ticket_pivot_departamento_agente).filter(
-                ticket_pivot_departamento_agente.c.id_departamento == id_departamento
-            ).all()
-            id_agente = str(random.choice(agentes).id) if agentes else None
+            id_agente = elegir_agente(id_departamento)
 
         # Obtener el estado "Abierto" y prioridad "Baja" si no se especifican
-        estado_abierto = TicketEstado.query.filter_by(nombre="Abierto").first()
-        prioridad_baja = TicketPrioridad.query.filter_by(nombre="Baja").first()
+        id_estado_abierto = id_por_nombre('estado', "Abierto")
+        id_prioridad_baja = id_por_nombre('prioridad', "Baja")
 
         nuevo_ticket = Ticket(
             id_usuario=current_user_id,
             id_agente=id_agente,
             id_sucursal=current_user.id_sucursalactiva,  # Usar la sucursal activa del usuario
-            id_estado=data.get('id_estado', estado_abierto.id if estado_abierto else None),
-            id_prioridad=data.get('id_prioridad', prioridad_baja.id if prioridad_baja else None),
+            id_estado=data.get('id_estado', id_estado_abierto),
+            id_prioridad=data.get('id_prioridad', id_prioridad_baja),
             id_departamento=id_departamento,
             id_categoria=id_categoria,
             titulo=data.get('titulo'),
@@ -445,17 +273,40 @@ def create_ticket():
         )
 
         db.session.add(nuevo_ticket)
-        db.session.commit()
+        db.session.flush()
 
-        # Notificar creación del ticket
-        agente = Usuario.query.get(id_agente) if id_agente else None
-        notificar_creacion_ticket(nuevo_ticket, current_user, agente)
+        # Notificar creación del ticket (el correo se arma fuera de la petición)
+        registrar_evento(CREACION, nuevo_ticket.id, current_user.id)
 
-        return jsonify({'message': 'Ticket creado exitosamente', 'ticket_id': nuevo_ticket.id}), 201
+        # El commit guarda también la respuesta de la Idempotency-Key
+        return confirmar(jsonify({'message': 'Ticket creado exitosamente', 'ticket_id': nuevo_ticket.id}), 201)
 
     except Exception as e:
+        db.session.rollback()
+        print(f"🔸 Error en create_ticket: {str(e)}")
         return jsonify({'error': 'Ocurrió un error al crear el ticket'}), 500
 
+# ✅ ADMINISTRADOR: Importar tickets en masa desde un CSV o un arreglo JSON
+@api.route('/admin/tickets/importar', methods=['POST'])
+@jwt_required()
+@role_required(['ADMINISTRADOR'])
+def importar_tickets_masivo():
+    try:
+        filas = leer_filas(request)
+        resultados, tickets = importar_tickets(filas, obtener_principal())
+        return jsonify({
+            'total': len(resultados),
+            'importados': len(tickets),
+            'con_errores': len(resultados) - len(tickets),
+            'filas': resultados
+        }), 200
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"🔸 Error en importar_tickets_masivo: {str(e)}")
+        return jsonify({'error': 'Ocurrió un error al importar los tickets'}), 500
+
 # Extensiones permitidas
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'docx', 'xlsx'}
 
@@ -467,18 +318,19 @@ def allowed_file(filename):
 @api.route('/tickets/<int:id>', methods=['PUT'])
 @jwt_required()
 def update_ticket(id):
-    current_user_id = get_jwt_identity()
-    usuario = Usuario.query.get(current_user_id)
+    principal = obtener_principal()
+    if not principal:
+        return jsonify({'message': 'Usuario no encontrado'}), 404
+    usuario = principal.usuario
     ticket = Ticket.query.get(id)
 
     if not ticket:
         return jsonify({'message': 'Ticket no encontrado'}), 404
 
-    if usuario.rol_obj.nombre == 'ADMINISTRADOR':
+    if principal.es_administrador:
         pass  # Puede editar cualquier ticket
-    elif usuario.rol_obj.nombre == 'AGENTE':
-        departamentos_ids = [d.id for d in usuario.departamentos]
-        if ticket.id_departamento not in departamentos_ids:
+    elif principal.es_agente:
+        if ticket.id_departamento not in principal.departamentos:
             return jsonify({'message': 'No tienes permiso para editar este ticket'}), 403
     else:
         if ticket.id_usuario != usuario.id:
@@ -495,7 +347,7 @@ def update_ticket(id):
 
     # Actualizar categoría si se proporciona
     if 'id_categoria' in data:
-        categoria = Categoria.query.get(data['id_categoria'])
+        categoria = obtener_fila('categoria', data['id_categoria'])
         if not categoria or categoria.id_departamento != ticket.id_departamento:
             return jsonify({'error': 'La categoría no pertenece al departamento del ticket'}), 400
         ticket.id_categoria = data['id_categoria']
@@ -516,26 +368,27 @@ def update_ticket(id):
         file_ext = filename.rsplit('.', 1)[1].lower()
         unique_filename = f"t{id}_{uuid.uuid4().hex}.{file_ext}"
         file_path = os.path.join(upload_folder, unique_filename)
+        file_content = file.read()
+        file.seek(0)
         file.save(file_path)
 
-        ticket.adjunto = unique_filename
+        agregar_adjunto(ticket, unique_filename, file_content, file.content_type, reemplazar=True)
 
     # ✅ Validación de estado, solo si se envía en el payload
     nuevo_estado = None
     if 'id_estado' in data:
-        estado_obj = TicketEstado.query.get(data['id_estado'])
+        estado_obj = obtener_fila('estado', data['id_estado'])
         if not estado_obj:
             return jsonify({'error': 'Estado no válido'}), 400
         ticket.id_estado = data['id_estado']
-        nuevo_estado = estado_obj.nombre
+        nuevo_estado = estado_obj.id
 
     try:
-        db.session.commit()
-
         # Solo si se cambió el estado, disparamos notificación
         if nuevo_estado:
-            agente = Usuario.query.get(ticket.id_agente) if ticket.id_agente else None
-            notificar_cambio_estado(ticket, usuario, agente, nuevo_estado)
+            registrar_evento(CAMBIO_ESTADO, ticket.id, usuario.id, id_estado=nuevo_estado)
+
+        db.session.commit()
 
         return jsonify({'message': 'Ticket actualizado correctamente', 'adjunto': ticket.adjunto}), 200
     except Exception as e:
@@ -550,18 +403,19 @@ def update_ticket(id):
 @api.route('/tickets/<int:id>', methods=['DELETE'])
 @jwt_required()
 def delete_ticket(id):
-    current_user_id = get_jwt_identity()
-    usuario = Usuario.query.get(current_user_id)
+    principal = obtener_principal()
+    if not principal:
+        return jsonify({'message': 'Usuario no encontrado'}), 404
+    usuario = principal.usuario
     ticket = Ticket.query.get(id)
 
     if not ticket:
         return jsonify({'message': 'Ticket no encontrado'}), 404
 
-    if usuario.rol_obj.nombre == 'ADMINISTRADOR':
+    if principal.es_administrador:
         pass  # Puede eliminar cualquier ticket
-    elif usuario.rol_obj.nombre == 'AGENTE':
-        departamentos_ids = [d.id for d in usuario.departamentos]
-        if ticket.id_departamento not in departamentos_ids:
+    elif principal.es_agente:
+        if ticket.id_departamento not in principal.departamentos:
             return jsonify({'message': 'No tienes permiso para eliminar este ticket'}), 403
     else:
         if ticket.id_usuario != usuario.id:
@@ -571,9 +425,28 @@ def delete_ticket(id):
     db.session.commit()
     return jsonify({'message': 'Ticket eliminado correctamente'})
 
+# 🔹 Catálogos, perfil y permisos en una sola respuesta para el arranque del frontend
+@api.route('/bootstrap', methods=['GET'])
+@jwt_required()
+def get_bootstrap():
+    try:
+        principal = obtener_principal()
+        if not principal:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+
+        respuesta = respuesta_condicional(ambitos_bootstrap(principal), lambda: obtener_bootstrap(principal))
+        # Por usuario y siempre revalidado: con el caché caliente basta un 304
+        respuesta.cache_control.private = True
+        respuesta.cache_control.no_cache = True
+        return respuesta
+    except Exception as e:
+        print(f"🔸 Error en get_bootstrap: {str(e)}")
+        return jsonify({'error': 'Ocurrió un error al obtener los datos de inicio'}), 500
+
 # Rutas para obtener prioridades, departamentos y estados
 @api.route('/prioridades', methods=['GET'])
 @jwt_required()
+@condicional(AMBITO_CATALOGOS)
 def get_prioridades():
     try:
         prioridades = TicketPrioridad.query.all()
@@ -584,6 +457,7 @@ def get_prioridades():
 
 @api.route('/departamentos', methods=['GET'])
 @jwt_required()
+@condicional(AMBITO_CATALOGOS)
 def get_departamentos():
     try:
         departamentos = Departamento.query.order_by(Departamento.nombre).all()
@@ -594,6 +468,7 @@ def get_departamentos():
 
 @api.route('/estados', methods=['GET'])
 @jwt_required()
+@condicional(AMBITO_CATALOGOS)
 def get_estados():
     try:
         estados = TicketEstado.query.all()
@@ -631,7 +506,7 @@ def register():
         user_id = str(uuid.uuid4())
 
         # Encriptar la contraseña
-        hashed_password = bcrypt.hashpw(data['clave'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = generar_hash(data['clave'])
 
         # Asegurarse de que la sucursal activa esté en las sucursales autorizadas
         sucursales_autorizadas = set(data['sucursales_autorizadas'])
@@ -672,9 +547,11 @@ def register():
                 'usuario': usuario_creado.usuario,
                 'nombre': usuario_creado.nombre_completo,
                 'correo': usuario_creado.correo,
-                'rol': usuario_creado.rol_obj.nombre
+                'rol': nombre_por_id('rol', usuario_creado.id_rol)
             }
         }), 201
+    except HashSaturado:
+        raise
     except Exception as e:
         print(f"🔸 Error en register: {str(e)}")
         db.session.rollback()
@@ -688,7 +565,7 @@ def login():
         data = request.get_json()
         usuario = Usuario.query.filter_by(correo=data.get('correo')).first()
         
-        if not usuario or not bcrypt.checkpw(data['clave'].encode('utf-8'), usuario.clave.encode('utf-8')):
+        if not usuario or not verificar_clave(data['clave'], usuario.clave):
             return jsonify({'message': 'Credenciales inválidas'}), 401
         
         # ✅ Verificar que el usuario esté activo (id_estado=1)
@@ -704,14 +581,16 @@ def login():
         if not app_acceso:
             return jsonify({'message': 'No tienes acceso a esta aplicación'}), 403
         
-        # Acceder a rol_obj para obtener el rol del usuario
-        rol = usuario.rol_obj.nombre  # Aquí se accede al nombre del rol
+        # Nombre del rol desde el caché de catálogos
+        rol = nombre_por_id('rol', usuario.id_rol)
 
         # Obtener información de la sucursal activa
         sucursal_activa = Sucursal.query.get(usuario.id_sucursalactiva)
 
         # Crear access token y refresh token
-        access_token = create_access_token(identity=str(usuario.id))
+        access_token = create_access_token(
+            identity=str(usuario.id), additional_claims=claims_autorizacion(usuario.id)
+        )
         refresh_token = create_refresh_token(identity=str(usuario.id))
 
         # Obtener las sucursales autorizadas
@@ -740,6 +619,8 @@ def login():
             }
         }
         return jsonify(response_data), 200
+    except HashSaturado:
+        raise
     except Exception as e:
         print(f"🔸 Error en login: {str(e)}")
         return jsonify({'error': 'Ocurrió un error en el inicio de sesión'}), 500
@@ -750,7 +631,10 @@ def login():
 def refresh():
     try:
         current_user_id = get_jwt_identity()
-        new_access_token = create_access_token(identity=current_user_id)
+        # Con JWT_CLAIMS_AUTORIZACION los permisos se vuelven a leer al renovar el token
+        new_access_token = create_access_token(
+            identity=current_user_id, additional_claims=claims_autorizacion(current_user_id)
+        )
         return jsonify({'access_token': new_access_token}), 200
     except Exception as e:
         print(f"🔸 Error en refresh token: {str(e)}")
@@ -761,22 +645,12 @@ def refresh():
 @jwt_required()
 def get_ticket_comentarios(ticket_id):
     try:
-        comentarios = TicketComentario.query.filter_by(id_ticket=ticket_id).all()
-        comentarios_list = [
-            {
-                'id': c.id,
-                'id_ticket': c.id_ticket,
-                'id_usuario': c.id_usuario,
-                'usuario': (
-                    Usuario.query.get(c.id_usuario).nombre_completo
-                    if Usuario.query.get(c.id_usuario) else None
-                ),
-                'comentario': c.comentario,
-                'creado': c.timestamp.strftime('%Y-%m-%d %H:%M:%S') if c.timestamp else None
-            }
-            for c in comentarios
-        ]
-        return jsonify(comentarios_list), 200
+        # Sin before_id / after_id / limit se mantiene la lista completa de siempre
+        if not pide_pagina(request.args):
+            return jsonify(listar_comentarios(ticket_id)), 200
+        return jsonify(paginar_comentarios(ticket_id, request.args)), 200
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"🔸 Error al obtener comentarios: {str(e)}")
         return jsonify({'error': 'Ocurrió un error al obtener los comentarios'}), 500
@@ -786,10 +660,14 @@ def get_ticket_comentarios(ticket_id):
 @api.route('/tickets/<int:ticket_id>/comentarios', methods=['POST'])
 @jwt_required()
 @role_required(['USUARIO', 'AGENTE', 'ADMINISTRADOR'])
+@idempotente
 def add_ticket_comentario(ticket_id):
     try:
         data = request.get_json()
-        current_user = get_jwt_identity()
+        principal = obtener_principal()
+        if not principal:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+        current_user = principal.id
         es_comentario_cierre = data.get('es_comentario_cierre', False)
         
         nuevo_comentario = TicketComentario(
@@ -798,18 +676,16 @@ def add_ticket_comentario(ticket_id):
             comentario=data.get('comentario')
         )
         db.session.add(nuevo_comentario)
-        db.session.commit()
 
         # Solo enviar correo de comentario si NO es comentario de cierre
         if not es_comentario_cierre:
             # Notificar nuevo comentario
-            ticket = Ticket.query.get(ticket_id)
-            usuario = Usuario.query.get(ticket.id_usuario)
-            agente = Usuario.query.get(ticket.id_agente) if ticket.id_agente else None
-            notificar_comentario(ticket, usuario, agente, data.get('comentario'))
-        
-        return jsonify({'message': 'Comentario agregado correctamente'}), 201
+            db.session.flush()
+            registrar_evento(COMENTARIO, ticket_id, current_user, id_comentario=nuevo_comentario.id)
+
+        return confirmar(jsonify({'message': 'Comentario agregado correctamente'}), 201)
     except Exception as e:
+        db.session.rollback()
         print(f"🔸 Error al agregar comentario: {str(e)}")
         return jsonify({'error': 'Ocurrió un error al agregar el comentario'}), 500
 
@@ -820,7 +696,7 @@ def add_ticket_comentario(ticket_id):
 @role_required(['USUARIO', 'AGENTE', 'ADMINISTRADOR'])
 def edit_ticket_comentario(ticket_id, comentario_id):
     try:
-        current_user = get_jwt_identity()
+        principal = obtener_principal()
         data = request.get_json()
         
         # Validar que se proporcione el comentario
@@ -837,12 +713,11 @@ def edit_ticket_comentario(ticket_id, comentario_id):
             return jsonify({'error': 'Comentario no encontrado'}), 404
         
         # Verificar que el usuario sea el autor del comentario o tenga permisos de administrador
-        usuario_actual = Usuario.query.get(current_user)
-        if not usuario_actual:
+        if not principal:
             return jsonify({'error': 'Usuario no encontrado'}), 404
         
         # Solo el autor del comentario o un administrador puede editarlo
-        if comentario.id_usuario != current_user and usuario_actual.id_rol != 1:  # 1 = ADMINISTRADOR
+        if comentario.id_usuario != principal.id and principal.usuario.id_rol != 1:  # 1 = ADMINISTRADOR
             return jsonify({'error': 'No tienes permisos para editar este comentario'}), 403
         
         # Actualizar el comentario
@@ -865,7 +740,7 @@ def edit_ticket_comentario(ticket_id, comentario_id):
 @role_required(['USUARIO', 'AGENTE', 'ADMINISTRADOR'])
 def delete_ticket_comentario(ticket_id, comentario_id):
     try:
-        current_user = get_jwt_identity()
+        principal = obtener_principal()
         
         # Buscar el comentario
         comentario = TicketComentario.query.filter_by(
@@ -877,12 +752,11 @@ def delete_ticket_comentario(ticket_id, comentario_id):
             return jsonify({'error': 'Comentario no encontrado'}), 404
         
         # Verificar que el usuario sea el autor del comentario o tenga permisos de administrador
-        usuario_actual = Usuario.query.get(current_user)
-        if not usuario_actual:
+        if not principal:
             return jsonify({'error': 'Usuario no encontrado'}), 404
         
         # Solo el autor del comentario o un administrador puede eliminarlo
-        if comentario.id_usuario != current_user and usuario_actual.id_rol != 1:  # 1 = ADMINISTRADOR
+        if comentario.id_usuario != principal.id and principal.usuario.id_rol != 1:  # 1 = ADMINISTRADOR
             return jsonify({'error': 'No tienes permisos para eliminar este comentario'}), 403
         
         # Eliminar el comentario
@@ -902,8 +776,7 @@ def delete_ticket_comentario(ticket_id, comentario_id):
 @role_required(['ADMINISTRADOR', 'AGENTE'])  # ✅ Permitir también a Agentes
 def assign_ticket(ticket_id):
     try:
-        current_user_id = get_jwt_identity()
-        usuario_actual = Usuario.query.get(current_user_id)
+        principal = obtener_principal()
         ticket = Ticket.query.get(ticket_id)
 
         if not ticket:
@@ -926,34 +799,29 @@ def assign_ticket(ticket_id):
             rol_es_agente = True
         
         # Verificar por nombre de rol (más flexible)
-        elif nuevo_agente.rol_obj and nuevo_agente.rol_obj.nombre:
-            rol_nombre = nuevo_agente.rol_obj.nombre.upper()
+        elif nombre_por_id('rol', nuevo_agente.id_rol):
+            rol_nombre = nombre_por_id('rol', nuevo_agente.id_rol).upper()
             if 'AGENTE' in rol_nombre:
                 rol_es_agente = True
         
         # Si no es agente, verificar si es administrador (puede reasignar)
-        elif nuevo_agente.id_rol == 1 or (nuevo_agente.rol_obj and 'ADMIN' in nuevo_agente.rol_obj.nombre.upper()):
+        elif nuevo_agente.id_rol == 1 or 'ADMIN' in nombre_por_id('rol', nuevo_agente.id_rol, '').upper():
             rol_es_agente = True
         
         if not rol_es_agente:
             return jsonify({'message': 'El usuario seleccionado no es un Agente'}), 400
 
         # Guardar el agente anterior antes de reasignar
-        agente_anterior = Usuario.query.get(ticket.id_agente) if ticket.id_agente else None
+        id_agente_anterior = ticket.id_agente
 
         # 🔹 Si es Administrador, puede reasignar a cualquier agente
-        if usuario_actual.rol_obj.nombre == "ADMINISTRADOR":
+        if principal.es_administrador:
             ticket.id_agente = nuevo_agente_id
 
         # 🔹 Si es Agente, solo puede reasignar a agentes de su departamento
-        elif usuario_actual.rol_obj.nombre == "AGENTE":
+        elif principal.es_agente:
             # Verificar que el agente actual pertenece al departamento del ticket
-            agente_en_departamento = db.session.query(ticket_pivot_departamento_agente).filter(
-                ticket_pivot_departamento_agente.c.id_usuario == current_user_id,
-                ticket_pivot_departamento_agente.c.id_departamento == ticket.id_departamento
-            ).first()
-            
-            if not agente_en_departamento:
+            if ticket.id_departamento not in principal.departamentos:
                 return jsonify({'message': 'No tienes permiso para reasignar tickets de este departamento'}), 403
             
             # Verificar que el nuevo agente pertenece al mismo departamento
@@ -971,15 +839,15 @@ def assign_ticket(ticket_id):
             return jsonify({'message': 'No tienes permiso para reasignar tickets'}), 403
 
         # 🔹 Cambiar estado a "En Proceso" automáticamente si aún no lo está
-        estado_en_proceso = TicketEstado.query.filter_by(nombre="En Proceso").first()
-        if estado_en_proceso and ticket.id_estado != estado_en_proceso.id:
-            ticket.id_estado = estado_en_proceso.id
-
-        db.session.commit()
+        id_en_proceso = id_por_nombre('estado', "En Proceso")
+        if id_en_proceso and ticket.id_estado != id_en_proceso:
+            ticket.id_estado = id_en_proceso
 
         # Notificar reasignación del ticket
-        usuario = Usuario.query.get(ticket.id_usuario)
-        notificar_reasignacion_ticket(ticket, usuario, agente_anterior, nuevo_agente)
+        registrar_evento(REASIGNACION, ticket.id, principal.id,
+                         id_agente_anterior=id_agente_anterior, id_agente=nuevo_agente.id)
+
+        db.session.commit()
 
         return jsonify({'message': 'Ticket reasignado correctamente'}), 200
     except Exception as e:
@@ -1001,9 +869,9 @@ def debug_usuarios_roles():
                 'id': usuario.id,
                 'nombre': usuario.nombre_completo,
                 'id_rol': usuario.id_rol,
-                'rol_nombre': usuario.rol_obj.nombre if usuario.rol_obj else 'Sin rol',
+                'rol_nombre': nombre_por_id('rol', usuario.id_rol, 'Sin rol'),
                 'correo': usuario.correo,
-                'es_agente': usuario.id_rol == 2 or (usuario.rol_obj and 'AGENTE' in usuario.rol_obj.nombre.upper())
+                'es_agente': usuario.id_rol == 2 or 'AGENTE' in nombre_por_id('rol', usuario.id_rol, '').upper()
             })
         
         return jsonify(usuarios_info), 200
@@ -1016,12 +884,11 @@ def debug_usuarios_roles():
 @role_required(['ADMINISTRADOR', 'AGENTE'])
 def get_agentes():
     try:
-        current_user_id = get_jwt_identity()
-        usuario_actual = Usuario.query.get(current_user_id)
+        principal = obtener_principal()
         
         # Si es administrador, puede ver todos los agentes
-        if usuario_actual.rol_obj.nombre == 'ADMINISTRADOR':
-            agentes = Usuario.query.filter(Usuario.id_rol == Rol.query.filter_by(nombre='AGENTE').first().id).all()
+        if principal.es_administrador:
+            agentes = Usuario.query.filter(Usuario.id_rol == id_por_nombre('rol', 'AGENTE')).all()
             return jsonify([
                 {
                     'id': a.id,
@@ -1031,17 +898,13 @@ def get_agentes():
             ]), 200
         
         # Si es agente, solo puede ver agentes de su departamento
-        elif usuario_actual.rol_obj.nombre == 'AGENTE':
-            # Obtener departamentos del agente actual
-            departamentos_agente = db.session.query(ticket_pivot_departamento_agente.c.id_departamento).filter(
-                ticket_pivot_departamento_agente.c.id_usuario == current_user_id
-            ).all()
-            
-            departamentos_ids = [d[0] for d in departamentos_agente]
+        elif principal.es_agente:
+            # Departamentos del agente actual
+            departamentos_ids = principal.departamentos
             
             # Obtener agentes que pertenecen a los mismos departamentos
             agentes = Usuario.query.join(ticket_pivot_departamento_agente).filter(
-                Usuario.id_rol == Rol.query.filter_by(nombre='AGENTE').first().id,
+                Usuario.id_rol == id_por_nombre('rol', 'AGENTE'),
                 ticket_pivot_departamento_agente.c.id_departamento.in_(departamentos_ids)
             ).distinct().all()
             
@@ -1065,33 +928,27 @@ def get_agentes():
 @role_required(['ADMINISTRADOR', 'AGENTE'])
 def get_agentes_disponibles_para_reasignacion(ticket_id):
     try:
-        current_user_id = get_jwt_identity()
-        usuario_actual = Usuario.query.get(current_user_id)
+        principal = obtener_principal()
         ticket = Ticket.query.get(ticket_id)
         
         if not ticket:
             return jsonify({'error': 'Ticket no encontrado'}), 404
         
         # Si es administrador, puede ver todos los agentes del departamento
-        if usuario_actual.rol_obj.nombre == 'ADMINISTRADOR':
+        if principal.es_administrador:
             agentes = Usuario.query.join(ticket_pivot_departamento_agente).filter(
-                Usuario.id_rol == Rol.query.filter_by(nombre='AGENTE').first().id,
+                Usuario.id_rol == id_por_nombre('rol', 'AGENTE'),
                 ticket_pivot_departamento_agente.c.id_departamento == ticket.id_departamento
             ).all()
         
         # Si es agente, verificar que pertenece al departamento del ticket
-        elif usuario_actual.rol_obj.nombre == 'AGENTE':
-            agente_en_departamento = db.session.query(ticket_pivot_departamento_agente).filter(
-                ticket_pivot_departamento_agente.c.id_usuario == current_user_id,
-                ticket_pivot_departamento_agente.c.id_departamento == ticket.id_departamento
-            ).first()
-            
-            if not agente_en_departamento:
+        elif principal.es_agente:
+            if ticket.id_departamento not in principal.departamentos:
                 return jsonify({'error': 'No tienes permiso para ver agentes de este departamento'}), 403
             
             # Obtener agentes del mismo departamento
             agentes = Usuario.query.join(ticket_pivot_departamento_agente).filter(
-                Usuario.id_rol == Rol.query.filter_by(nombre='AGENTE').first().id,
+                Usuario.id_rol == id_por_nombre('rol', 'AGENTE'),
                 ticket_pivot_departamento_agente.c.id_departamento == ticket.id_departamento
             ).all()
         
@@ -1113,6 +970,7 @@ def get_agentes_disponibles_para_reasignacion(ticket_id):
 # Ruta para obtener sucursales
 @api.route('/sucursales', methods=['GET'])
 @jwt_required()
+@condicional(AMBITO_CATALOGOS)
 def get_sucursales():
     try:
         sucursales = Sucursal.query.all()
@@ -1157,7 +1015,7 @@ def debug_roles():
 def debug_agentes_departamentos():
     try:
         # Obtener todos los usuarios con rol AGENTE
-        rol_agente = Rol.query.filter_by(nombre='AGENTE').first()
+        rol_agente = fila_por_nombre('rol', 'AGENTE')
         if not rol_agente:
             return jsonify({'error': 'Rol AGENTE no encontrado'}), 404
         
@@ -1171,7 +1029,7 @@ def debug_agentes_departamentos():
                 'id': agente.id,
                 'nombre': agente.nombre_completo,
                 'correo': agente.correo,
-                'rol': agente.rol_obj.nombre,
+                'rol': nombre_por_id('rol', agente.id_rol),
                 'departamentos': [{'id': d.id, 'nombre': d.nombre} for d in agente.departamentos]
             })
         
@@ -1239,7 +1097,7 @@ def test_agentes_por_departamento(departamento_id):
         # Log de debug removido
         
         # Obtener el rol AGENTE
-        rol_agente = Rol.query.filter_by(nombre='AGENTE').first()
+        rol_agente = fila_por_nombre('rol', 'AGENTE')
         if not rol_agente:
             return jsonify({'error': 'Rol AGENTE no encontrado'}), 404
         
@@ -1258,7 +1116,7 @@ def test_agentes_por_departamento(departamento_id):
             'id': agente.id,
             'nombre': agente.nombre_completo,
             'correo': agente.correo,
-            'rol': agente.rol_obj.nombre
+            'rol': nombre_por_id('rol', agente.id_rol)
         } for agente in agentes]), 200
     except Exception as e:
         print(f"🔸 Error en test_agentes_por_departamento: {str(e)}")
@@ -1274,7 +1132,7 @@ def debug_departamentos_agentes():
         departamentos = Departamento.query.all()
         
         # Obtener el rol AGENTE
-        rol_agente = Rol.query.filter_by(nombre='AGENTE').first()
+        rol_agente = fila_por_nombre('rol', 'AGENTE')
         if not rol_agente:
             return jsonify({'error': 'Rol AGENTE no encontrado'}), 404
         
@@ -1409,11 +1267,7 @@ def verificar_asignaciones_agentes():
         # Log de debug removido
         
         # Obtener todos los agentes
-        rol_agente = Rol.query.filter_by(nombre='AGENTE').first()
-        if not rol_agente:
-            rol_agente = Rol.query.filter_by(nombre='Agente').first()
-        if not rol_agente:
-            rol_agente = Rol.query.filter_by(nombre='agente').first()
+        rol_agente = fila_por_nombre('rol', 'AGENTE')  # Sin distinguir mayúsculas
         
         if not rol_agente:
             return jsonify({'error': 'Rol AGENTE no encontrado'}), 404
@@ -1470,11 +1324,7 @@ def get_agentes_disponibles_por_departamento(departamento_id):
         print(f"🔍 Departamento: {departamento.nombre}")
         
         # Obtener el ID del rol AGENTE
-        rol_agente = Rol.query.filter_by(nombre='AGENTE').first()
-        if not rol_agente:
-            rol_agente = Rol.query.filter_by(nombre='Agente').first()
-        if not rol_agente:
-            rol_agente = Rol.query.filter_by(nombre='agente').first()
+        rol_agente = fila_por_nombre('rol', 'AGENTE')  # Sin distinguir mayúsculas
         
         if not rol_agente:
             return jsonify({'error': 'Rol AGENTE no encontrado'}), 404
@@ -1500,7 +1350,7 @@ def get_agentes_disponibles_por_departamento(departamento_id):
             'id': agente.id,
             'nombre': agente.nombre_completo,
             'correo': agente.correo,
-            'rol': agente.rol_obj.nombre,
+            'rol': nombre_por_id('rol', agente.id_rol),
             'debug_info': {
                 'departamento_id': departamento_id,
                 'departamento_nombre': departamento.nombre
@@ -1583,7 +1433,7 @@ def corregir_asignaciones_agentes():
         print(f"🔍 ===== CORRIGIENDO ASIGNACIONES DE AGENTES =====")
         
         # Obtener todos los agentes
-        rol_agente = Rol.query.filter_by(nombre='AGENTE').first()
+        rol_agente = fila_por_nombre('rol', 'AGENTE')
         if not rol_agente:
             return jsonify({'error': 'Rol AGENTE no encontrado'}), 404
         
@@ -1623,49 +1473,65 @@ def corregir_asignaciones_agentes():
         print(f"🔸 Error en corregir_asignaciones_agentes: {str(e)}")
         return jsonify({'error': 'Ocurrió un error al corregir las asignaciones'}), 500
 
+# Orden por nombre completo en SQL, usado por los listados de usuarios en streaming
+# (sin NULL, porque iterar_por_clave continúa cada lote desde estos valores)
+ORDEN_NOMBRE_USUARIO = (
+    db.func.lower(Usuario.nombre), db.func.lower(Usuario.apellido_paterno),
+    db.func.lower(db.func.coalesce(Usuario.apellido_materno, '')), Usuario.id
+)
+
+def serializar_usuario(usuario):
+    return {
+        "id": usuario.id,
+        "usuario": usuario.usuario,
+        "nombre": usuario.nombre_completo,
+        "correo": usuario.correo,
+        "rol": nombre_por_id('rol', usuario.id_rol),
+        "sucursal_activa": {
+            "id": usuario.sucursal_obj.id if usuario.sucursal_obj else None,
+            "nombre": usuario.sucursal_obj.nombre if usuario.sucursal_obj else "No asignada"
+        },
+        "sucursales_autorizadas": [
+            {
+                "id": sucursal.id,
+                "nombre": sucursal.nombre
+            } for sucursal in usuario.sucursales_autorizadas
+        ],
+        "estado": nombre_por_id('estado_usuario', usuario.id_estado),
+        "id_departamento": [d.id for d in usuario.departamentos] if usuario.departamentos else None
+    }
+
 # Ruta para filtrar usuarios activos
 @api.route('/usuarios', methods=['GET'])
 @jwt_required()
 def get_usuarios():
     try:
-        current_user_id = get_jwt_identity()
-        current_user = Usuario.query.get(current_user_id)
+        principal = obtener_principal()
         
-        if not current_user:
+        if not principal:
             return jsonify({'error': 'Usuario no encontrado'}), 404
 
         # Si es administrador, puede ver todos los usuarios
-        if current_user.rol_obj.nombre == 'ADMINISTRADOR':
-            usuarios = Usuario.query.all()
+        if principal.es_administrador:
+            consulta = Usuario.query
         # Si es agente, solo ve usuarios de sus sucursales autorizadas
-        elif current_user.rol_obj.nombre == 'AGENTE':
-            sucursales_ids = [s.id for s in current_user.sucursales_autorizadas]
-            usuarios = Usuario.query.filter(
-                Usuario.id_sucursalactiva.in_(sucursales_ids)
-            ).all()
+        elif principal.es_agente:
+            consulta = Usuario.query.filter(
+                Usuario.id_sucursalactiva.in_(principal.sucursales)
+            )
         # Si es usuario normal, solo ve su propia información
         else:
-            usuarios = [current_user]
-
-        usuario_list = [{
-            "id": usuario.id,
-            "usuario": usuario.usuario,
-            "nombre": usuario.nombre_completo,
-            "correo": usuario.correo,
-            "rol": usuario.rol_obj.nombre,
-            "sucursal_activa": {
-                "id": usuario.sucursal_obj.id if usuario.sucursal_obj else None,
-                "nombre": usuario.sucursal_obj.nombre if usuario.sucursal_obj else "No asignada"
-            },
-            "sucursales_autorizadas": [
-                {
-                    "id": sucursal.id,
-                    "nombre": sucursal.nombre
-                } for sucursal in usuario.sucursales_autorizadas
-            ],
-            "estado": usuario.estado_obj.nombre,
-            "id_departamento": [d.id for d in usuario.departamentos] if usuario.departamentos else None
-        } for usuario in usuarios]
+            consulta = None
+
+        # ?stream=1: se lee y escribe por lotes, con las relaciones cargadas por lote
+        if consulta is not None and modo_streaming(request.args):
+            consulta = consulta.options(
+                joinedload(Usuario.sucursal_obj), selectinload(Usuario.sucursales_autorizadas), selectinload(Usuario.departamentos)
+            )
+            return respuesta_json_en_streaming(iterar_por_clave(consulta, ORDEN_NOMBRE_USUARIO), serializar_usuario)
+
+        usuarios = consulta.all() if consulta is not None else [principal.usuario]
+        usuario_list = [serializar_usuario(usuario) for usuario in usuarios]
 
         # Ordenar alfabéticamente por nombre
         usuario_list.sort(key=lambda x: x['nombre'].lower())
@@ -1681,14 +1547,13 @@ def get_usuarios():
 @jwt_required()
 def update_usuario(user_id):
     try:
-        current_user_id = get_jwt_identity()
+        principal = obtener_principal()
         usuario = Usuario.query.get(user_id)
         if not usuario:
             return jsonify({'message': 'Usuario no encontrado'}), 404
 
         # Solo permitir que un usuario edite su propio perfil o que un ADMINISTRADOR edite a cualquiera
-        current_user = Usuario.query.get(current_user_id)
-        if current_user.id != user_id and current_user.rol_obj.nombre != 'ADMINISTRADOR':
+        if principal.id != user_id and not principal.es_administrador:
             return jsonify({'message': 'No tienes permiso para editar este usuario'}), 403
 
         data = request.get_json()
@@ -1705,7 +1570,7 @@ def update_usuario(user_id):
         if 'correo' in data:
             usuario.correo = data['correo']
         if 'clave' in data and data['clave']:
-            usuario.clave = bcrypt.hashpw(data['clave'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            usuario.clave = generar_hash(data['clave'])
         if 'id_rol' in data:
             usuario.id_rol = data['id_rol']
         if 'id_estado' in data:
@@ -1727,6 +1592,10 @@ def update_usuario(user_id):
             # Actualizar la relación
             usuario.sucursales_autorizadas = sucursales
 
+        # Los tokens emitidos antes del cambio de rol, estado o sucursales dejan de valer como permisos
+        if {'id_rol', 'id_estado', 'sucursales_autorizadas'} & set(data):
+            invalidar_autorizacion(usuario.id)
+
         # Commit de los cambios
         db.session.commit()
 
@@ -1739,7 +1608,7 @@ def update_usuario(user_id):
                 'usuario': usuario_actualizado.usuario,
                 'nombre': usuario_actualizado.nombre_completo,
                 'correo': usuario_actualizado.correo,
-                'rol': usuario_actualizado.rol_obj.nombre,
+                'rol': nombre_por_id('rol', usuario_actualizado.id_rol),
                 'sucursal_activa': {
                     'id': usuario_actualizado.sucursal_obj.id,
                     'nombre': usuario_actualizado.sucursal_obj.nombre
@@ -1750,9 +1619,11 @@ def update_usuario(user_id):
                         'nombre': sucursal.nombre
                     } for sucursal in usuario_actualizado.sucursales_autorizadas
                 ],
-                'estado': usuario_actualizado.estado_obj.nombre
+                'estado': nombre_por_id('estado_usuario', usuario_actualizado.id_estado)
             }
         }), 200
+    except HashSaturado:
+        raise
     except Exception as e:
         db.session.rollback()
         print(f"❌ Error al actualizar usuario: {str(e)}")
@@ -1774,6 +1645,7 @@ def delete_usuario(user_id):
         if tickets_asociados > 0:
             return jsonify({'error': 'No se puede eliminar el usuario porque tiene tickets asociados'}), 400
         db.session.delete(usuario)
+        invalidar_autorizacion(user_id)
         db.session.commit()
         return jsonify({'message': 'Usuario eliminado correctamente'}), 200
     except Exception as e:
@@ -1807,29 +1679,12 @@ def upload_file(id):
     if not allowed_file(file.filename):
         return jsonify({'message': 'Tipo de archivo no permitido'}), 400
 
-    # Obtener la lista actual de archivos adjuntos
-    archivos_actuales = ticket.adjunto.split(',') if ticket.adjunto else []
-
-    # Calcular el hash MD5 del archivo subido
+    # Un archivo con el mismo contenido ya adjunto al ticket (una consulta por el índice)
     file_content = file.read()
-    file_hash = hashlib.md5(file_content).hexdigest()
+    file_hash = huella(file_content)
     file.seek(0)  # Volver al inicio para subir después
 
-    # Revisar si ya existe un archivo con el mismo hash en Cloud Storage
-    hashes_existentes = set()
-    for nombre_archivo in archivos_actuales:
-        if storage_manager.file_exists(nombre_archivo):
-            # Descargar temporalmente para calcular hash
-            try:
-                blob = storage_manager.bucket.blob(nombre_archivo)
-                content = blob.download_as_bytes()
-                hash_existente = hashlib.md5(content).hexdigest()
-                hashes_existentes.add(hash_existente)
-            except Exception as e:
-                print(f"⚠️ Error al verificar hash de {nombre_archivo}: {str(e)}")
-                continue
-    
-    if file_hash in hashes_existentes:
+    if buscar_duplicado(id, file_hash):
         return jsonify({'message': 'Archivo duplicado, ya existe en el ticket', 'adjunto': ticket.adjunto}), 200
 
     # Subir archivo a Cloud Storage
@@ -1843,8 +1698,7 @@ def upload_file(id):
 
     # Guardar el nombre del archivo en la base de datos
     try:
-        archivos_actuales.append(filename)
-        ticket.adjunto = ','.join(archivos_actuales)
+        agregar_adjunto(ticket, filename, file_content, file.content_type, sha256=file_hash)
         db.session.commit()
         print(f"Archivo {filename} subido a Cloud Storage y guardado en la BD para el ticket {id}")
         return jsonify({
@@ -1867,10 +1721,7 @@ def eliminar_adjunto(id, nombre_adjunto):
     if not ticket:
         return jsonify({'message': 'Ticket no encontrado'}), 404
 
-    # Lista de adjuntos actual
-    archivos_actuales = ticket.adjunto.split(',') if ticket.adjunto else []
-
-    if nombre_adjunto not in archivos_actuales:
+    if nombre_adjunto not in nombres_adjuntos(ticket):
         return jsonify({'message': 'Adjunto no encontrado en este ticket'}), 404
 
     # Eliminar el archivo de Cloud Storage
@@ -1881,8 +1732,7 @@ def eliminar_adjunto(id, nombre_adjunto):
         # Continuar con la eliminación de la BD aunque falle Cloud Storage
 
     # Quitar el adjunto de la lista y actualizar la base de datos
-    archivos_actuales.remove(nombre_adjunto)
-    ticket.adjunto = ','.join(archivos_actuales)
+    quitar_adjunto(ticket, nombre_adjunto)
     try:
         db.session.commit()
         print(f"Adjunto {nombre_adjunto} eliminado de la BD para el ticket {id}")
@@ -1901,12 +1751,11 @@ def cerrar_ticket(id):
         return jsonify({'message': 'Ticket no encontrado'}), 404
 
     # Verificar si el ticket está en estado "En Proceso"
-    estado_en_proceso = TicketEstado.query.filter_by(nombre="En Proceso").first()
-    if ticket.id_estado != estado_en_proceso.id:
+    if ticket.id_estado != id_por_nombre('estado', "En Proceso"):
         return jsonify({'message': 'El ticket solo puede cerrarse si está en estado "En Proceso"'}), 400
 
-    estado_cerrado = TicketEstado.query.filter_by(nombre="Cerrado").first()
-    if not estado_cerrado:
+    id_cerrado = id_por_nombre('estado', "Cerrado")
+    if not id_cerrado:
         return jsonify({'message': 'No se encontró el estado "Cerrado"'}), 500
 
     # Obtener el comentario de cierre del request
@@ -1914,12 +1763,10 @@ def cerrar_ticket(id):
     comentario_cierre = data.get('comentario_cierre', '')
     current_user = get_jwt_identity()
 
-    ticket.id_estado = estado_cerrado.id
+    ticket.id_estado = id_cerrado
     ticket.fecha_cierre = datetime.now(CHILE_TZ)
 
     try:
-        db.session.commit()
-
         # Agregar comentario de cierre si se proporciona
         if comentario_cierre:
             nuevo_comentario = TicketComentario(
@@ -1928,12 +1775,14 @@ def cerrar_ticket(id):
                 comentario=comentario_cierre
             )
             db.session.add(nuevo_comentario)
-            db.session.commit()
+            db.session.flush()
 
         # Notificar cierre del ticket (incluyendo el comentario si existe)
-        usuario = Usuario.query.get(ticket.id_usuario)
-        agente = Usuario.query.get(ticket.id_agente) if ticket.id_agente else None
-        notificar_cierre_ticket(ticket, usuario, agente, comentario_cierre)
+        registrar_evento(CIERRE, ticket.id, current_user,
+                         id_comentario=nuevo_comentario.id if comentario_cierre else None)
+
+        # Cierre, comentario y correos en una sola transacción
+        db.session.commit()
 
         return jsonify({'message': 'Ticket cerrado correctamente'}), 200
     except Exception as e:
@@ -1955,13 +1804,15 @@ def cambiar_clave(user_id):
         new_password = data.get('new_password')
 
         # Usar bcrypt para verificar la clave actual
-        if not bcrypt.checkpw(old_password.encode('utf-8'), usuario.clave.encode('utf-8')):
+        if not verificar_clave(old_password, usuario.clave):
             return jsonify({'message': 'Clave actual incorrecta'}), 400
 
-        usuario.clave = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        usuario.clave = generar_hash(new_password)
         db.session.commit()
 
         return jsonify({'message': 'Clave actualizada correctamente'}), 200
+    except HashSaturado:
+        raise
     except Exception as e:
         print(f"❌ Error en cambiar_clave: {str(e)}")
         return jsonify({'error': 'Ocurrió un error al cambiar la clave'}), 500
@@ -2011,11 +1862,7 @@ def get_agentes_por_departamento(id_departamento):
 @jwt_required()
 def get_estados_usuarios():
     try:
-        estados = [
-            {"id": 1, "nombre": "ACTIVO"},
-            {"id": 2, "nombre": "INACTIVO"}
-        ]
-        return jsonify(estados), 200
+        return jsonify(ESTADOS_USUARIO), 200
     except Exception as e:
         print(f"🔸 Error en get_estados_usuarios: {str(e)}")
         return jsonify({'error': 'Ocurrió un error al obtener los estados de usuario'}), 500
@@ -2040,6 +1887,7 @@ def asignar_departamentos_a_agente(id_agente):
         # Asignar los departamentos al agente
         departamentos = Departamento.query.filter(Departamento.id.in_(id_departamentos)).all()
         agente.departamentos = departamentos
+        invalidar_autorizacion(agente.id)
 
         db.session.commit()
         return jsonify({'message': 'Departamentos asignados correctamente al agente'}), 200
@@ -2056,7 +1904,7 @@ def asignar_departamentos_a_agente(id_agente):
 def get_agentes_departamentos():
     try:
         agentes = Usuario.query.filter(
-            Usuario.id_rol == Rol.query.filter_by(nombre='Agente').first().id
+            Usuario.id_rol == id_por_nombre('rol', 'Agente')
         ).all()
 
         agentes_list = [
@@ -2096,11 +1944,11 @@ def cambiar_estado_ticket(ticket_id):
         return jsonify({"error": "Ticket no encontrado"}), 404
 
     # Buscar el estado en la base de datos usando mayúsculas
-    estado_obj = TicketEstado.query.filter(db.func.upper(TicketEstado.nombre) == nuevo_estado).first()
-    if not estado_obj:
+    id_estado = id_por_nombre('estado', nuevo_estado)
+    if not id_estado:
         return jsonify({"error": "Estado no encontrado en la base de datos"}), 400
 
-    ticket.id_estado = estado_obj.id
+    ticket.id_estado = id_estado
     db.session.commit()
 
     return jsonify({"mensaje": "Estado actualizado correctamente"}), 200
@@ -2194,7 +2042,7 @@ def editar_departamento(id):
 def get_agentes_agrupados_por_sucursal():
     try:
         # Obtén el id del rol AGENTE
-        id_rol_agente = Rol.query.filter_by(nombre='AGENTE').first().id
+        id_rol_agente = id_por_nombre('rol', 'AGENTE')
         agentes = Usuario.query.filter(Usuario.id_rol == id_rol_agente).all()
         agentes_por_sucursal = {}
 
@@ -2221,6 +2069,7 @@ def get_agentes_agrupados_por_sucursal():
 # Ruta para obtener categorías por departamento
 @api.route('/categorias', methods=['GET'])
 @jwt_required()
+@condicional(AMBITO_CATALOGOS, AMBITO_USUARIOS)
 def get_categorias_por_departamento():
     try:
         departamento_id = request.args.get('departamento_id')
@@ -2429,11 +2278,7 @@ def get_agentes_disponibles_para_categoria(categoria_id):
             return jsonify({'error': 'Categoría no encontrada'}), 404
         
         # Obtener el ID del rol AGENTE
-        rol_agente = Rol.query.filter_by(nombre='AGENTE').first()
-        if not rol_agente:
-            rol_agente = Rol.query.filter_by(nombre='Agente').first()
-        if not rol_agente:
-            rol_agente = Rol.query.filter_by(nombre='agente').first()
+        rol_agente = fila_por_nombre('rol', 'AGENTE')  # Sin distinguir mayúsculas
         
         if not rol_agente:
             return jsonify({'error': 'Rol AGENTE no encontrado'}), 404
@@ -2457,7 +2302,7 @@ def get_agentes_disponibles_para_categoria(categoria_id):
             'id': agente.id,
             'nombre': agente.nombre_completo,
             'correo': agente.correo,
-            'rol': agente.rol_obj.nombre
+            'rol': nombre_por_id('rol', agente.id_rol)
         } for agente in agentes_departamento]), 200
         
     except Exception as e:
@@ -2475,7 +2320,7 @@ def debug_agentes_categoria_completo(categoria_id):
             return jsonify({'error': 'Categoría no encontrada'}), 404
         
         # Obtener el rol AGENTE
-        rol_agente = Rol.query.filter_by(nombre='AGENTE').first()
+        rol_agente = fila_por_nombre('rol', 'AGENTE')
         if not rol_agente:
             return jsonify({'error': 'Rol AGENTE no encontrado'}), 404
         
@@ -2506,7 +2351,7 @@ def debug_agentes_categoria_completo(categoria_id):
                 'id': agente.id,
                 'nombre': agente.nombre_completo,
                 'correo': agente.correo,
-                'rol': agente.rol_obj.nombre
+                'rol': nombre_por_id('rol', agente.id_rol)
             } for agente in agentes]
         }
         
@@ -2537,14 +2382,13 @@ def get_apps():
 @jwt_required()
 def get_usuario_apps():
     try:
-        current_user_id = get_jwt_identity()
-        usuario = Usuario.query.get(current_user_id)
+        principal = obtener_principal()
         
-        if not usuario:
+        if not principal:
             return jsonify({'error': 'Usuario no encontrado'}), 404
         
         # Obtener las apps a las que tiene acceso el usuario
-        apps_usuario = usuario.apps
+        apps_usuario = principal.usuario.apps
         
         return jsonify([{
             'id': app.id,
@@ -2574,34 +2418,35 @@ def get_all_apps():
         print(f"🔸 Error al obtener todas las apps: {str(e)}")
         return jsonify({'error': 'Ocurrió un error al obtener las apps'}), 500
 
+def serializar_usuario_con_apps(usuario):
+    return {
+        'id': usuario.id,
+        'nombre': usuario.nombre_completo,
+        'correo': usuario.correo,
+        'rol': nombre_por_id('rol', usuario.id_rol),
+        'estado': nombre_por_id('estado_usuario', usuario.id_estado),
+        'apps': [{
+            'id': app.id,
+            'nombre': app.nombre,
+            'descripcion': app.descripcion,
+            'url': app.URL
+        } for app in usuario.apps]
+    }
+
 # ✅ ADMINISTRADOR: Obtener usuarios con sus apps asignadas (versión completa)
 @api.route('/admin/usuarios-apps', methods=['GET'])
 @jwt_required()
 @role_required(['ADMINISTRADOR'])
 def get_usuarios_con_apps():
     try:
+        # ?stream=1: se lee y escribe por lotes, con las relaciones cargadas por lote
+        if modo_streaming(request.args):
+            consulta = Usuario.query.options(selectinload(Usuario.apps))
+            return respuesta_json_en_streaming(iterar_por_clave(consulta, ORDEN_NOMBRE_USUARIO),
+                                               serializar_usuario_con_apps)
+
         usuarios = Usuario.query.all()
-        usuarios_apps = []
-        
-        for usuario in usuarios:
-            apps_usuario = [{
-                'id': app.id, 
-                'nombre': app.nombre,
-                'descripcion': app.descripcion,
-                'url': app.URL
-            } for app in usuario.apps]
-            
-            # Obtener el nombre completo para ordenamiento
-            nombre_usuario = usuario.nombre_completo
-            
-            usuarios_apps.append({
-                'id': usuario.id,
-                'nombre': nombre_usuario,
-                'correo': usuario.correo,
-                'rol': usuario.rol_obj.nombre,
-                'estado': usuario.estado_obj.nombre,
-                'apps': apps_usuario
-            })
+        usuarios_apps = [serializar_usuario_con_apps(usuario) for usuario in usuarios]
         
         # Ordenar alfabéticamente por nombre
         usuarios_apps.sort(key=lambda x: x['nombre'].lower())
@@ -2631,8 +2476,8 @@ def get_usuarios_apps_optimizado():
                 'id': usuario.id,
                 'nombre': usuario.nombre_completo,
                 'correo': usuario.correo,
-                'rol': usuario.rol_obj.nombre,
-                'estado': usuario.estado_obj.nombre,
+                'rol': nombre_por_id('rol', usuario.id_rol),
+                'estado': nombre_por_id('estado_usuario', usuario.id_estado),
                 'apps': apps_usuario
             })
         
@@ -2664,9 +2509,10 @@ def asignar_apps_a_usuario(user_id):
         from models import App
         apps = App.query.filter(App.id.in_(app_ids)).all()
         
-        # Limpiar asignaciones existentes
+        # Limpiar asignaciones existentes; el flush las borra antes de insertar las nuevas
+        # y todo se confirma en un solo commit, sin un estado intermedio sin apps
         usuario.apps = []
-        db.session.commit()
+        db.session.flush()
         
         # Asignar las nuevas apps con IDs únicos
         for app in apps:
@@ -2683,6 +2529,8 @@ def asignar_apps_a_usuario(user_id):
                 )
             )
         
+        # Los tokens emitidos antes dejan de usarse como fuente de sus permisos
+        invalidar_autorizacion(usuario.id)
         db.session.commit()
         
         # Obtener las apps actualizadas para la respuesta
@@ -2729,7 +2577,7 @@ def get_apps_de_usuario(user_id):
                 'id': usuario.id,
                 'nombre': usuario.nombre_completo,
                 'correo': usuario.correo,
-                'rol': usuario.rol_obj.nombre
+                'rol': nombre_por_id('rol', usuario.id_rol)
             },
             'apps': apps_usuario
         }), 200
@@ -2857,54 +2705,23 @@ def eliminar_app(app_id):
 def get_tickets_mi_departamento():
     """Endpoint para agentes: ver tickets de su departamento asignado"""
     try:
-        current_user_id = get_jwt_identity()
-        usuario = Usuario.query.get(current_user_id)
+        principal = obtener_principal()
 
-        if not usuario:
+        if not principal:
             return jsonify({"error": "Usuario no encontrado"}), 404
 
         # Obtener los departamentos asignados al agente
-        departamentos_ids = [d.id for d in usuario.departamentos]
+        departamentos_ids = principal.departamentos
         
         # Agentes ven tickets de sus departamentos asignados
-        tickets = Ticket.query.filter(
-            Ticket.id_departamento.in_(departamentos_ids)
-        ).order_by(Ticket.fecha_creacion.desc()).all()
-
-        ticket_list = []
-        for ticket in tickets:
-            sucursal_obj = Sucursal.query.get(ticket.id_sucursal)
-            nombre_sucursal = sucursal_obj.nombre if sucursal_obj else "No asignada"
-            ticket_list.append({
-                "id": ticket.id,
-                "titulo": ticket.titulo,
-                "descripcion": ticket.descripcion,
-                "id_usuario": ticket.id_usuario,
-                "id_agente": ticket.id_agente,
-                "usuario": (
-                    ticket.usuario.nombre_completo
-                    if ticket.usuario else "Sin usuario"
-                ),
-                "agente": (
-                    ticket.agente.nombre_completo
-                    if ticket.agente else "Sin asignar"
-                ),
-                "estado": ticket.estado.nombre,
-                "prioridad": ticket.prioridad.nombre,
-                "departamento": ticket.departamento.nombre if ticket.departamento else None,
-                "id_departamento": ticket.id_departamento,
-                "id_categoria": ticket.id_categoria,
-                "categoria": ticket.categoria.nombre if ticket.categoria else None,
-                "sucursal": nombre_sucursal,
-                "fecha_creacion": ticket.fecha_creacion.astimezone(CHILE_TZ).strftime('%Y-%m-%d %H:%M:%S') if ticket.fecha_creacion else None,
-                "fecha_cierre": ticket.fecha_cierre.astimezone(CHILE_TZ).strftime('%Y-%m-%d %H:%M:%S') if ticket.fecha_cierre else None,
-                "adjunto": ticket.adjunto,
-                "id_prioridad": ticket.id_prioridad,
-                "id_estado": ticket.id_estado
-            })
+        ambitos = [ambito_departamento(d) for d in departamentos_ids] + [AMBITO_CATALOGOS, AMBITO_USUARIOS]
 
-        return jsonify(ticket_list), 200
+        return respuesta_condicional(
+            ambitos, lambda: obtener_listado(request.args, Ticket.id_departamento.in_(departamentos_ids))
+        )
 
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"🔸 Error en get_tickets_mi_departamento: {str(e)}")
         return jsonify({'error': 'Ocurrió un error al obtener los tickets de mi departamento'}), 500
@@ -2916,49 +2733,20 @@ def get_tickets_mi_departamento():
 def get_mis_tickets():
     """Endpoint para agentes: ver tickets que ELLOS crearon (independiente del departamento)"""
     try:
-        current_user_id = get_jwt_identity()
-        usuario = Usuario.query.get(current_user_id)
+        principal = obtener_principal()
 
-        if not usuario:
+        if not principal:
             return jsonify({"error": "Usuario no encontrado"}), 404
 
         # Agentes ven SOLO los tickets que ELLOS crearon
-        tickets = Ticket.query.filter_by(id_usuario=current_user_id).order_by(Ticket.fecha_creacion.desc()).all()
-
-        ticket_list = []
-        for ticket in tickets:
-            sucursal_obj = Sucursal.query.get(ticket.id_sucursal)
-            nombre_sucursal = sucursal_obj.nombre if sucursal_obj else "No asignada"
-            ticket_list.append({
-                "id": ticket.id,
-                "titulo": ticket.titulo,
-                "descripcion": ticket.descripcion,
-                "id_usuario": ticket.id_usuario,
-                "id_agente": ticket.id_agente,
-                "usuario": (
-                    ticket.usuario.nombre_completo
-                    if ticket.usuario else "Sin usuario"
-                ),
-                "agente": (
-                    ticket.agente.nombre_completo
-                    if ticket.agente else "Sin asignar"
-                ),
-                "estado": ticket.estado.nombre,
-                "prioridad": ticket.prioridad.nombre,
-                "departamento": ticket.departamento.nombre if ticket.departamento else None,
-                "id_departamento": ticket.id_departamento,
-                "id_categoria": ticket.id_categoria,
-                "categoria": ticket.categoria.nombre if ticket.categoria else None,
-                "sucursal": nombre_sucursal,
-                "fecha_creacion": ticket.fecha_creacion.astimezone(CHILE_TZ).strftime('%Y-%m-%d %H:%M:%S') if ticket.fecha_creacion else None,
-                "fecha_cierre": ticket.fecha_cierre.astimezone(CHILE_TZ).strftime('%Y-%m-%d %H:%M:%S') if ticket.fecha_cierre else None,
-                "adjunto": ticket.adjunto,
-                "id_prioridad": ticket.id_prioridad,
-                "id_estado": ticket.id_estado
-            })
+        ambitos = [ambito_usuario(principal.id), AMBITO_CATALOGOS, AMBITO_USUARIOS]
 
-        return jsonify(ticket_list), 200
+        return respuesta_condicional(
+            ambitos, lambda: obtener_listado(request.args, Ticket.id_usuario == principal.id)
+        )
 
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"🔸 Error en get_mis_tickets: {str(e)}")
         return jsonify({'error': 'Ocurrió un error al obtener mis tickets'}), 500
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Servidor SMTP local para desarrollo y pruebas
+
+Recibe los correos de la API sin enviarlos a nadie: acepta cualquier usuario
+y clave, y guarda cada mensaje como .eml en una carpeta (o solo los cuenta).
+Puede simular la latencia del servidor real (conexión + STARTTLS + login y
+cada envío), su límite de conexiones simultáneas y rechazos temporales, para
+probar los reintentos de la bandeja de salida (email_outbox.py). No implementa STARTTLS: la API debe usarse con
+SMTP_STARTTLS=0.
+
+Uso:
+    python smtp_local.py [--puerto 1025] [--carpeta correos] [--latencia-conexion 0.3]
+                         [--latencia-envio 0.02] [--rechazo 0.1] [--max-conexiones 10]
+
+    SMTP_SERVER=localhost SMTP_PORT=1025 SMTP_STARTTLS=0 SMTP_USUARIO=local SMTP_CLAVE=local python app.py
+"""
+import argparse
+import os
+import random
+import socketserver
+import threading
+import time
+
+
+class _Sesion(socketserver.StreamRequestHandler):
+    """Una conexión SMTP (RFC 5321, solo lo que usa smtplib)"""
+
+    def _responder(self, linea):
+        self.wfile.write(f"{linea}\r\n".encode('ascii'))
+
+    def handle(self):
+        servidor = self.server
+        servidor.contar('conexiones')
+        if not servidor.abrir_sesion():
+            servidor.contar('rechazados')
+            self._responder("421 Demasiadas conexiones simultaneas")
+            return
+        try:
+            self._atender(servidor)
+        finally:
+            servidor.cerrar_sesion()
+
+    def _atender(self, servidor):
+        self._responder("220 smtp-local ESMTP")
+        remitente, destinatarios = None, []
+        while True:
+            linea = self.rfile.readline()
+            if not linea:
+                return
+            comando = linea.decode('utf-8', 'replace').strip()
+            verbo = comando[:4].upper()
+
+            if verbo in ('EHLO', 'HELO'):
+                self._responder("250-smtp-local")
+                self._responder("250-AUTH PLAIN LOGIN")
+                self._responder("250 8BITMIME")
+            elif verbo == 'AUTH':
+                partes = comando.split()
+                if len(partes) == 2 and partes[1].upper() == 'LOGIN':
+                    self._responder("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self._responder("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                # La latencia de conexión, STARTTLS y login del servidor real
+                time.sleep(servidor.latencia_conexion)
+                self._responder("235 Autenticado")
+            elif verbo == 'MAIL':
+                remitente, destinatarios = comando[10:], []
+                self._responder("250 OK")
+            elif verbo == 'RCPT':
+                destinatarios.append(comando[8:].strip('<> '))
+                self._responder("250 OK")
+            elif verbo == 'DATA':
+                self._responder("354 Fin con <CRLF>.<CRLF>")
+                contenido = []
+                while True:
+                    linea = self.rfile.readline()
+                    if not linea or linea in (b'.\r\n', b'.\n'):
+                        break
+                    contenido.append(linea[1:] if linea.startswith(b'..') else linea)
+                time.sleep(servidor.latencia_envio)
+                if random.random() < servidor.rechazo:
+                    servidor.contar('rechazados')
+                    self._responder("451 Rechazo temporal simulado")
+                else:
+                    servidor.guardar(remitente, destinatarios, b''.join(contenido))
+                    self._responder("250 OK")
+                remitente, destinatarios = None, []
+            elif verbo == 'RSET':
+                remitente, destinatarios = None, []
+                self._responder("250 OK")
+            elif verbo == 'NOOP':
+                self._responder("250 OK")
+            elif verbo == 'QUIT':
+                self._responder("221 Adios")
+                return
+            else:
+                self._responder("502 Comando no implementado")
+
+
+class ServidorSMTPLocal(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256  # las ráfagas de conexiones del envío anterior
+
+    def __init__(self, puerto=1025, carpeta=None, latencia_conexion=0.0, latencia_envio=0.0, rechazo=0.0,
+                 max_conexiones=0):
+        super().__init__(('127.0.0.1', puerto), _Sesion)
+        self.carpeta = carpeta
+        self.latencia_conexion = latencia_conexion
+        self.latencia_envio = latencia_envio
+        self.rechazo = rechazo
+        self.max_conexiones = max_conexiones
+        self._abiertas = 0
+        self.contadores = {'conexiones': 0, 'recibidos': 0, 'rechazados': 0}
+        self._candado = threading.Lock()
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+
+    @property
+    def puerto(self):
+        return self.server_address[1]
+
+    def contar(self, clave):
+        with self._candado:
+            self.contadores[clave] += 1
+            return self.contadores[clave]
+
+    def abrir_sesion(self):
+        """False si se superó max_conexiones (los servidores reales responden 421)"""
+        with self._candado:
+            if self.max_conexiones and self._abiertas >= self.max_conexiones:
+                return False
+            self._abiertas += 1
+            return True
+
+    def cerrar_sesion(self):
+        with self._candado:
+            self._abiertas -= 1
+
+    def guardar(self, remitente, destinatarios, contenido):
+        numero = self.contar('recibidos')
+        if self.carpeta:
+            with open(os.path.join(self.carpeta, f"{numero:06d}.eml"), 'wb') as archivo:
+                archivo.write(contenido)
+
+    def iniciar(self):
+        """Atiende en un hilo; devuelve el servidor"""
+        threading.Thread(target=self.serve_forever, daemon=True, name='smtp-local').start()
+        return self
+
+    def detener(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor SMTP local que guarda los correos sin enviarlos")
+    parser.add_argument('--puerto', type=int, default=1025)
+    parser.add_argument('--carpeta', default='correos_locales')
+    parser.add_argument('--latencia-conexion', type=float, default=0.0, help="segundos por conexión (simula TLS y login)")
+    parser.add_argument('--latencia-envio', type=float, default=0.0, help="segundos por correo")
+    parser.add_argument('--rechazo', type=float, default=0.0, help="fracción de correos rechazados con 451")
+    parser.add_argument('--max-conexiones', type=int, default=0, help="conexiones simultáneas (0: sin límite)")
+    args = parser.parse_args()
+
+    servidor = ServidorSMTPLocal(args.puerto, args.carpeta, args.latencia_conexion, args.latencia_envio, args.rechazo,
+                                 args.max_conexiones)
+    print(f"📧 SMTP local en 127.0.0.1:{servidor.puerto}, correos en {args.carpeta}/")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print(f"✅ {servidor.contadores}")
@@ -0,0 +1,73 @@
+"""
+Fixtures compartidas: la app sobre SQLite en memoria con los catálogos mínimos
+"""
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import event, insert
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import (db, Rol, Estado, PerfilUsuario, Sucursal, Departamento, Categoria, TicketEstado,  # noqa: E402
+                    TicketPrioridad, Usuario, Ticket)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_TRACK_MODIFICATIONS=False, TESTING=True)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Rol(id=1, nombre='ADMINISTRADOR'), Rol(id=2, nombre='AGENTE'), Rol(id=3, nombre='USUARIO'),
+            Estado(id=1, nombre='ACTIVO'), PerfilUsuario(id=1, nombre='General'),
+            Sucursal(id=1, nombre='Casa Matriz'), Departamento(id=1, nombre='TI'),
+            TicketEstado(id=1, nombre='Abierto'), TicketEstado(id=2, nombre='En Proceso'),
+            TicketEstado(id=3, nombre='Cerrado'), TicketPrioridad(id=1, nombre='Baja'),
+        ])
+        db.session.flush()
+        for id_usuario, id_rol in (('usuario', 3), ('agente', 2)):
+            db.session.add(Usuario(id=id_usuario, id_sucursalactiva=1, usuario=id_usuario, nombre=id_usuario.capitalize(),
+                                   apellido_paterno='Prueba', clave='x', fecha_creacion=date.today(),
+                                   correo=f'{id_usuario}@lahornilla.cl', id_rol=id_rol))
+        db.session.add(Categoria(id='cat', nombre='Soporte', id_departamento=1))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def crear_tickets():
+    """crear_tickets(n): inserta n tickets más, sin pasar por los eventos del ORM"""
+    def crear(n):
+        inicio = datetime(2024, 1, 1)
+        db.session.execute(insert(Ticket.__table__), [{
+            'id_usuario': 'usuario', 'id_agente': 'agente' if i % 2 else None, 'id_sucursal': 1,
+            'id_estado': 1 + i % 3, 'id_prioridad': 1, 'id_departamento': 1, 'id_categoria': 'cat',
+            'titulo': f'Ticket {i}', 'descripcion': 'Descripción ' * 20,
+            'fecha_creacion': inicio + timedelta(minutes=i),
+        } for i in range(n)])
+        db.session.commit()
+    return crear
+
+
+@pytest.fixture
+def contar_consultas():
+    """with contar_consultas() as sentencias: lista de las sentencias SQL ejecutadas"""
+    class Contador:
+        def __enter__(self):
+            self.sentencias = []
+            event.listen(db.engine, 'before_cursor_execute', self._anotar)
+            return self.sentencias
+
+        def _anotar(self, conexion, cursor, sentencia, *args):
+            self.sentencias.append(sentencia)
+
+        def __exit__(self, *args):
+            event.remove(db.engine, 'before_cursor_execute', self._anotar)
+    return Contador
@@ -0,0 +1,32 @@
+"""
+Agrupación de la bandeja de salida: qué correos del grupo salen con el que venció
+"""
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from email_outbox import EnviadorCorreos, agrupacion_ticket
+from models import db, CorreoSalida, ahora_utc
+
+
+def _correo(proximo_intento, intentos=0):
+    correo = CorreoSalida(destinatario='agente@lahornilla.cl', asunto='Novedad', cuerpo='<p>Novedad</p>',
+                          agrupacion=agrupacion_ticket(1), intentos=intentos, proximo_intento=proximo_intento)
+    db.session.add(correo)
+    return correo
+
+
+def test_grupo_no_adelanta_los_reintentos_en_espera(app):
+    ahora = ahora_utc()
+    vencido = _correo(ahora - timedelta(seconds=1))
+    en_ventana = _correo(ahora + timedelta(seconds=60))
+    en_espera = _correo(ahora + timedelta(seconds=600), intentos=2)
+    reintento_vencido = _correo(ahora - timedelta(seconds=1), intentos=1)
+    db.session.commit()
+
+    reclamados = {correo.id for correo in EnviadorCorreos(conexion=object())._reclamar(50, resumen=False)}
+
+    assert reclamados == {vencido.id, en_ventana.id, reintento_vencido.id}
+    assert db.session.execute(
+        select(CorreoSalida.reclamado).where(CorreoSalida.id == en_espera.id)
+    ).scalar() is None
@@ -0,0 +1,128 @@
+"""
+Idempotency-Key: repetición, conflicto de cuerpo, carrera perdida y limpieza de claves vencidas
+"""
+from datetime import timedelta
+
+import pytest
+from flask import jsonify, request
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+
+import idempotency
+from idempotency import confirmar, idempotente, limpiar_vencidas
+from models import db, RespuestaIdempotente, Ticket, ahora_utc
+
+
+@pytest.fixture
+def cliente(app):
+    app.config['JWT_SECRET_KEY'] = 'prueba'
+    JWTManager(app)
+
+    @app.route('/tickets', methods=['POST'])
+    @jwt_required()
+    @idempotente
+    def crear_ticket():
+        datos = request.get_json()
+        if not datos.get('titulo'):
+            return jsonify({'error': 'Falta el título'}), 400
+        ticket = Ticket(id_usuario='usuario', id_sucursal=1, id_estado=1, id_prioridad=1, id_departamento=1,
+                        id_categoria='cat', titulo=datos['titulo'], descripcion='Descripción')
+        db.session.add(ticket)
+        db.session.flush()
+        return confirmar(jsonify({'ticket_id': ticket.id}), 201)
+
+    cliente = app.test_client()
+    cliente.headers = {'Authorization': f"Bearer {create_access_token(identity='usuario')}"}
+    return cliente
+
+
+def _crear(cliente, clave, titulo='Impresora'):
+    return cliente.post('/tickets', json={'titulo': titulo},
+                        headers={**cliente.headers, 'Idempotency-Key': clave})
+
+
+def _tickets():
+    return db.session.execute(select(func.count()).select_from(Ticket)).scalar()
+
+
+def test_reintento_recibe_la_respuesta_original(cliente):
+    primera = _crear(cliente, 'k1')
+    repetida = _crear(cliente, 'k1')
+
+    assert primera.status_code == repetida.status_code == 201
+    assert repetida.get_json() == primera.get_json()
+    assert repetida.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in primera.headers
+    assert _tickets() == 1
+
+
+def test_respuesta_guardada_en_la_transaccion_de_la_ruta(cliente):
+    commits = []
+
+    def anotar(sesion):
+        commits.append(sesion)
+
+    event.listen(Session, 'after_commit', anotar)
+    try:
+        _crear(cliente, 'k1')
+    finally:
+        event.remove(Session, 'after_commit', anotar)
+
+    # Uno para la reserva y otro para el ticket junto con su respuesta
+    assert len(commits) == 2
+
+    guardada = db.session.get(RespuestaIdempotente, 'usuario:k1')
+    assert guardada.estado == 201
+    assert guardada.fecha_expiracion > ahora_utc() + timedelta(hours=23)
+
+
+def test_misma_clave_con_otro_cuerpo(cliente):
+    _crear(cliente, 'k1')
+    otra = _crear(cliente, 'k1', titulo='Monitor')
+
+    assert otra.status_code == 422
+    assert _tickets() == 1
+
+
+def test_errores_de_validacion_tambien_se_repiten(cliente):
+    assert _crear(cliente, 'k1', titulo='').status_code == 400
+    repetida = _crear(cliente, 'k1', titulo='')
+
+    assert repetida.status_code == 400
+    assert repetida.headers['Idempotent-Replayed'] == 'true'
+
+
+def test_reserva_en_curso_responde_409(cliente, monkeypatch):
+    monkeypatch.setattr(idempotency, '_huella', lambda: 'huella')
+    db.session.add(RespuestaIdempotente(clave='usuario:k1', huella='huella',
+                                        fecha_expiracion=ahora_utc() + timedelta(hours=1)))
+    db.session.commit()
+    en_curso = _crear(cliente, 'k1')
+
+    assert en_curso.status_code == 409
+    assert en_curso.headers['Retry-After'] == '1'
+    assert _tickets() == 0
+
+
+def test_carrera_perdida_sin_fila_no_ejecuta_la_ruta(cliente, monkeypatch):
+    # La otra petición liberó la clave (respondió 5xx) entre la reserva fallida y la lectura
+    monkeypatch.setattr(idempotency, '_reservar', lambda clave, huella: False)
+    respuesta = _crear(cliente, 'k1')
+
+    assert respuesta.status_code == 409
+    assert respuesta.headers['Retry-After'] == '1'
+    assert _tickets() == 0
+
+
+def test_clave_vencida_se_limpia_y_se_puede_reusar(cliente):
+    _crear(cliente, 'k1')
+    db.session.execute(update(RespuestaIdempotente).values(fecha_expiracion=ahora_utc() - timedelta(seconds=1)))
+    db.session.commit()
+
+    assert limpiar_vencidas() == 1
+    assert db.session.get(RespuestaIdempotente, 'usuario:k1') is None
+    nueva = _crear(cliente, 'k1')
+    assert nueva.status_code == 201
+    assert 'Idempotent-Replayed' not in nueva.headers
+    assert _tickets() == 2
@@ -0,0 +1,61 @@
+"""
+Dos buses en memoria conectados al mismo broker, como dos instancias: los
+avisos de una escritura llegan a la otra después del commit y nunca si se revierte
+"""
+import pytest
+
+import catalog_cache
+import invalidation_bus
+import principal
+from catalog_cache import nombre_por_id
+from invalidation_bus import BrokerMemoria, BusMemoria
+from models import db, Departamento
+from principal import invalidar_autorizacion, version_autorizacion
+
+
+@pytest.fixture
+def recibidos(app, monkeypatch):
+    """Avisos que recibe la otra instancia; esta publica por su propio BusMemoria"""
+    broker = BrokerMemoria()
+    monkeypatch.setattr(invalidation_bus, '_bus', BusMemoria(broker))
+    otra = BusMemoria(broker)
+    mensajes = []
+
+    def recibir(nuevos):
+        mensajes.extend(nuevos)
+        BusMemoria.recibir(otra, nuevos)
+
+    otra.recibir = recibir
+    yield mensajes
+    otra.detener()
+    catalog_cache.invalidar_catalogos()
+
+
+def test_catalogo_se_invalida_en_la_otra_instancia_despues_del_commit(recibidos):
+    assert nombre_por_id('departamento', 1) == 'TI'
+
+    db.session.add(Departamento(id=2, nombre='Bodega'))
+    db.session.rollback()
+    assert recibidos == []
+    assert 'departamento' in catalog_cache._catalogos
+
+    db.session.add(Departamento(id=2, nombre='Bodega'))
+    db.session.commit()
+    assert recibidos == [('catalogos', 'departamento')]
+    assert 'departamento' not in catalog_cache._catalogos
+    assert nombre_por_id('departamento', 2) == 'Bodega'
+
+
+def test_autorizacion_se_invalida_en_la_otra_instancia_despues_del_commit(recibidos):
+    inicial = version_autorizacion('usuario')
+
+    invalidar_autorizacion('usuario')
+    db.session.rollback()
+    assert recibidos == []
+    assert version_autorizacion('usuario') == inicial
+
+    invalidar_autorizacion('usuario')
+    db.session.commit()
+    assert recibidos == [('autorizacion', 'usuario')]
+    assert 'usuario' not in principal._versiones
+    assert version_autorizacion('usuario') == inicial + 1
@@ -0,0 +1,40 @@
+"""
+El listado de tickets hace las mismas consultas con pocos o muchos tickets
+"""
+import pytest
+from ticket_listing import CAMPOS_POR_DEFECTO, listar_tickets, obtener_listado
+
+N = 20
+
+
+def _consultas(contar_consultas, listar):
+    with contar_consultas() as sentencias:
+        resultado = listar()
+    return len(sentencias), resultado
+
+
+@pytest.mark.parametrize('args', [
+    {},
+    {'fields': 'id,titulo,estado'},
+    {'limit': str(10 * N)},
+    {'id_estado': '1', 'sort': 'prioridad'},
+])
+def test_consultas_constantes_con_mas_tickets(app, crear_tickets, contar_consultas, args):
+    crear_tickets(N)
+    pocos, _ = _consultas(contar_consultas, lambda: obtener_listado(args))
+    crear_tickets(9 * N)
+    muchos, resultado = _consultas(contar_consultas, lambda: obtener_listado(args))
+
+    assert pocos == muchos
+    tickets = resultado['tickets'] if isinstance(resultado, dict) else resultado
+    assert len(tickets) > N
+
+
+def test_listado_completo_en_una_consulta(app, crear_tickets, contar_consultas):
+    crear_tickets(10 * N)
+    consultas, tickets = _consultas(contar_consultas, listar_tickets)
+
+    assert consultas == 1
+    assert len(tickets) == 10 * N
+    assert set(tickets[0]) == set(CAMPOS_POR_DEFECTO)
+    assert {t['agente'] for t in tickets} == {'Agente Prueba', 'Sin asignar'}
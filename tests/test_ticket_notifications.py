@@ -0,0 +1,69 @@
+"""
+Un evento de notificación que falla no detiene al resto de su lote
+"""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+import ticket_notifications
+from email_outbox import FALLIDO, PENDIENTE
+from models import db, CorreoSalida, EventoNotificacion, ahora_utc
+from ticket_notifications import CAMBIO_ESTADO, CREACION, registrar_evento, renderizar_eventos
+
+
+@pytest.fixture
+def ticket(app, crear_tickets):
+    app.config['CORREO_MAX_INTENTOS'] = 2
+    crear_tickets(1)
+    return 1
+
+
+def _vencer_reintentos():
+    db.session.execute(update(EventoNotificacion).values(proximo_intento=ahora_utc() - timedelta(seconds=1)))
+    db.session.commit()
+
+
+def _destinatarios():
+    return db.session.execute(select(CorreoSalida.destinatario).order_by(CorreoSalida.id)).scalars().all()
+
+
+def test_evento_con_datos_invalidos_se_reintenta_y_queda_fallido(ticket):
+    registrar_evento(CREACION, ticket, 'usuario')
+    db.session.add(EventoNotificacion(tipo=CAMBIO_ESTADO, id_ticket=ticket, id_actor='agente', datos='{malo'))
+    db.session.commit()
+
+    assert renderizar_eventos() == 2
+    assert _destinatarios() == ['usuario@lahornilla.cl']
+    fallido = db.session.execute(select(EventoNotificacion)).scalar_one()
+    assert (fallido.estado, fallido.intentos, fallido.reclamado) == (PENDIENTE, 1, None)
+    assert fallido.ultimo_error.startswith('JSONDecodeError')
+
+    # Espera su reintento
+    assert renderizar_eventos() == 0
+    _vencer_reintentos()
+    assert renderizar_eventos() == 1
+    assert db.session.execute(select(EventoNotificacion.estado)).scalar_one() == FALLIDO
+
+    # Los fallidos no se vuelven a reclamar
+    _vencer_reintentos()
+    assert renderizar_eventos() == 0
+
+
+def test_correos_del_evento_que_falla_se_revierten(ticket, monkeypatch):
+    encolar = ticket_notifications.encolar_correo
+
+    def encolar_y_fallar(destinatario, asunto, cuerpo, **kwargs):
+        encolar(destinatario, asunto, cuerpo, **kwargs)
+        if 'Cambió de Estado' in asunto:
+            raise RuntimeError('sin conexión')
+
+    monkeypatch.setattr(ticket_notifications, 'encolar_correo', encolar_y_fallar)
+    registrar_evento(CAMBIO_ESTADO, ticket, 'agente', id_estado=2)
+    registrar_evento(CREACION, ticket, 'usuario')
+    db.session.commit()
+
+    assert renderizar_eventos() == 2
+    assert _destinatarios() == ['usuario@lahornilla.cl']
+    evento = db.session.execute(select(EventoNotificacion)).scalar_one()
+    assert (evento.tipo, evento.intentos) == (CAMBIO_ESTADO, 1)
@@ -0,0 +1,211 @@
+"""
+Asignación automática de tickets según la carga de cada agente
+
+Cuando la categoría no tiene un agente responsable, create_ticket asigna el
+ticket al agente del departamento con menos tickets abiertos; en un empate,
+al que lleva más tiempo sin recibir uno (turnos).
+
+CargaAgente guarda por departamento y agente cuántos tickets no cerrados
+tiene y el último ticket que se le asignó. Igual que los resúmenes de
+ticket_stats.py, se ajusta con eventos del ORM en la misma transacción de
+cada alta, asignación, cambio de estado o eliminación, así que elegir agente
+es una consulta que devuelve una fila en vez de cargar a todos los agentes.
+
+reconstruir_cargas() los recalcula desde cero (ver rebuild_ticket_stats.py).
+"""
+from collections import Counter
+from sqlalchemy import and_, case, event, func, inspect, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, object_session
+from models import db, Ticket, CargaAgente, ticket_pivot_departamento_agente
+from catalog_cache import id_por_nombre
+
+ESTADO_CERRADO = "Cerrado"
+
+CLAVE_SESION = 'carga_agentes'
+
+
+# 🔹 Registro de cambios durante el flush
+def _valores(ticket, anteriores=False):
+    """(departamento, agente, estado) actuales o anteriores al flush"""
+    estado = inspect(ticket)
+    valores = []
+    for atributo in ('id_departamento', 'id_agente', 'id_estado'):
+        historial = estado.attrs[atributo].history
+        if anteriores and historial.deleted:
+            valores.append(historial.deleted[0])
+        else:
+            valores.append(getattr(ticket, atributo))
+    return tuple(valores)
+
+
+def _registrar(ticket, valores, signo, asignado=False):
+    """Anota el cambio; el estado cerrado se resuelve en after_flush"""
+    id_departamento, id_agente, id_estado = valores
+    sesion = object_session(ticket)
+    if sesion is None or id_agente is None or id_departamento is None:
+        return
+    sesion.info.setdefault(CLAVE_SESION, []).append(
+        (id_departamento, str(id_agente), id_estado, signo, ticket.id if asignado else None)
+    )
+
+
+@event.listens_for(Ticket, 'after_insert')
+def _ticket_creado(mapper, connection, ticket):
+    _registrar(ticket, _valores(ticket), 1, asignado=True)
+
+
+@event.listens_for(Ticket, 'after_update')
+def _ticket_actualizado(mapper, connection, ticket):
+    anteriores = _valores(ticket, anteriores=True)
+    actuales = _valores(ticket)
+    if anteriores != actuales:
+        reasignado = anteriores[:2] != actuales[:2]
+        _registrar(ticket, anteriores, -1)
+        _registrar(ticket, actuales, 1, asignado=reasignado)
+
+
+@event.listens_for(Ticket, 'after_delete')
+def _ticket_eliminado(mapper, connection, ticket):
+    _registrar(ticket, _valores(ticket, anteriores=True), -1)
+
+
+def sentencia_carga(dialecto, abiertos, ultimos):
+    """INSERT ... que suma los tickets abiertos y guarda el último ticket asignado"""
+    tabla = CargaAgente.__table__
+    valores = [
+        {'id_departamento': d, 'id_agente': a, 'abiertos': abiertos.get((d, a), 0), 'ultimo_ticket': ultimos.get((d, a))}
+        for d, a in sorted(set(abiertos) | set(ultimos))
+    ]
+    if dialecto == 'mysql':
+        sentencia = mysql_insert(tabla).values(valores)
+        return sentencia.on_duplicate_key_update(
+            abiertos=tabla.c.abiertos + sentencia.inserted.abiertos,
+            ultimo_ticket=func.greatest(func.coalesce(tabla.c.ultimo_ticket, 0),
+                                        func.coalesce(sentencia.inserted.ultimo_ticket, 0)),
+        )
+    sentencia = sqlite_insert(tabla).values(valores)
+    return sentencia.on_conflict_do_update(
+        index_elements=[tabla.c.id_departamento, tabla.c.id_agente],
+        set_={
+            'abiertos': tabla.c.abiertos + sentencia.excluded.abiertos,
+            'ultimo_ticket': func.max(func.coalesce(tabla.c.ultimo_ticket, 0),
+                                      func.coalesce(sentencia.excluded.ultimo_ticket, 0)),
+        }
+    )
+
+
+def _ejecutar_cambios(conexion, cambios):
+    id_cerrado = id_por_nombre('estado', ESTADO_CERRADO)
+    abiertos = Counter()
+    ultimos = {}
+    for id_departamento, id_agente, id_estado, signo, ticket_asignado in cambios:
+        clave = (id_departamento, id_agente)
+        if id_estado != id_cerrado:
+            abiertos[clave] += signo
+        if ticket_asignado is not None:
+            ultimos[clave] = max(ultimos.get(clave, 0), ticket_asignado)
+    abiertos = {clave: cantidad for clave, cantidad in abiertos.items() if cantidad}
+    if abiertos or ultimos:
+        conexion.execute(sentencia_carga(conexion.dialect.name, abiertos, ultimos))
+
+
+@event.listens_for(Session, 'after_flush')
+def _aplicar_cambios(session, flush_context):
+    cambios = session.info.pop(CLAVE_SESION, None)
+    if cambios:
+        _ejecutar_cambios(session.connection(), cambios)
+
+
+def sumar_insertados(conexion, filas):
+    """Suma a las cargas tickets insertados sin pasar por el ORM (importación masiva)"""
+    _ejecutar_cambios(conexion, [
+        (f['id_departamento'], str(f['id_agente']), f['id_estado'], 1, f['id'])
+        for f in filas if f['id_agente'] is not None
+    ])
+
+
+# 🔹 Elección del agente
+def elegir_agente(id_departamento):
+    """Id del agente del departamento con menos tickets abiertos (None si no tiene agentes)"""
+    pivote = ticket_pivot_departamento_agente
+    carga = CargaAgente.__table__
+    return db.session.execute(
+        select(pivote.c.id_usuario)
+        .select_from(pivote.outerjoin(carga, and_(
+            carga.c.id_departamento == pivote.c.id_departamento,
+            carga.c.id_agente == pivote.c.id_usuario,
+        )))
+        .where(pivote.c.id_departamento == id_departamento)
+        # Empate: primero quien nunca recibió uno, luego quien lo recibió hace más tiempo
+        .order_by(func.coalesce(carga.c.abiertos, 0), func.coalesce(carga.c.ultimo_ticket, 0), pivote.c.id_usuario)
+        .limit(1)
+    ).scalar()
+
+
+class AsignacionEnLote:
+    """
+    elegir_agente para muchos tickets nuevos: lee las cargas de los
+    departamentos una vez y suma en memoria cada ticket que se asigna
+    """
+
+    def __init__(self, departamentos):
+        pivote = ticket_pivot_departamento_agente
+        carga = CargaAgente.__table__
+        filas = db.session.execute(
+            select(pivote.c.id_departamento, pivote.c.id_usuario,
+                   func.coalesce(carga.c.abiertos, 0), func.coalesce(carga.c.ultimo_ticket, 0))
+            .select_from(pivote.outerjoin(carga, and_(
+                carga.c.id_departamento == pivote.c.id_departamento,
+                carga.c.id_agente == pivote.c.id_usuario,
+            )))
+            .where(pivote.c.id_departamento.in_(set(departamentos)))
+        ).all()
+        self._cargas = {}
+        for id_departamento, id_agente, abiertos, ultimo in filas:
+            self._cargas.setdefault(id_departamento, {})[str(id_agente)] = [abiertos, ultimo]
+        # Turnos en memoria, posteriores a cualquier ticket ya asignado
+        self._turno = max((c[1] for agentes in self._cargas.values() for c in agentes.values()), default=0) + 1
+
+    def pertenece(self, id_agente, id_departamento):
+        return str(id_agente) in self._cargas.get(id_departamento, {})
+
+    def sumar(self, id_agente, id_departamento):
+        carga = self._cargas.get(id_departamento, {}).get(str(id_agente))
+        if carga:
+            carga[0] += 1
+            carga[1] = self._turno
+            self._turno += 1
+
+    def elegir(self, id_departamento):
+        """Mismo criterio que elegir_agente; no suma el ticket (ver sumar)"""
+        agentes = self._cargas.get(id_departamento)
+        if not agentes:
+            return None
+        return min(agentes, key=lambda a: (agentes[a][0], agentes[a][1], a))
+
+
+# 🔹 Reconstrucción
+def reconstruir_cargas():
+    """Recalcula todas las cargas desde ticket_fact_registro"""
+    id_cerrado = id_por_nombre('estado', ESTADO_CERRADO)
+    db.session.execute(CargaAgente.__table__.delete())
+    filas = db.session.execute(
+        select(
+            Ticket.id_departamento,
+            Ticket.id_agente,
+            func.sum(case((Ticket.id_estado == id_cerrado, 0), else_=1)),
+            func.max(Ticket.id),
+        )
+        .where(Ticket.id_agente.isnot(None), Ticket.id_departamento.isnot(None))
+        .group_by(Ticket.id_departamento, Ticket.id_agente)
+    ).all()
+    if filas:
+        db.session.execute(CargaAgente.__table__.insert(), [{
+            'id_departamento': id_departamento,
+            'id_agente': id_agente,
+            'abiertos': abiertos,
+            'ultimo_ticket': ultimo,
+        } for id_departamento, id_agente, abiertos, ultimo in filas])
+    db.session.commit()
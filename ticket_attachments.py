@@ -0,0 +1,134 @@
+"""
+Adjuntos de los tickets y detección de archivos duplicados
+
+upload_file revisaba si el archivo ya estaba en el ticket descargando de
+Cloud Storage cada adjunto listado en Ticket.adjunto para calcular su hash:
+subir el décimo archivo descargaba los otros nueve. Ahora cada adjunto tiene
+una fila en ticket_fact_adjunto con su nombre, tamaño, tipo de contenido,
+SHA-256 y fecha de subida, y buscar un duplicado es una consulta por el
+índice (id_ticket, sha256).
+
+Ticket.adjunto sigue guardando los nombres separados por comas (lo devuelven
+el listado, el detalle y las rutas de adjuntos); agregar_adjunto y
+quitar_adjunto mantienen las dos cosas en la misma transacción.
+
+rellenar_adjuntos() crea las filas de los adjuntos que solo están en
+Ticket.adjunto, leyendo cada archivo una vez de Cloud Storage o de la
+carpeta uploads (ver migrate_attachments.py).
+"""
+import hashlib
+import mimetypes
+import os
+from datetime import datetime
+from sqlalchemy import delete, select
+from models import db, Ticket, TicketAdjunto, ahora_utc
+from cloud_storage import storage_manager
+
+CARPETA_LOCAL = 'uploads'
+LOTE_MIGRACION = 200
+
+
+def huella(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def nombres_adjuntos(ticket):
+    return ticket.adjunto.split(',') if ticket.adjunto else []
+
+
+# 🔹 Rutas de adjuntos
+def buscar_duplicado(id_ticket, sha256):
+    """Nombre del adjunto del ticket con el mismo contenido, o None"""
+    return db.session.execute(
+        select(TicketAdjunto.nombre)
+        .where(TicketAdjunto.id_ticket == id_ticket, TicketAdjunto.sha256 == sha256)
+        .limit(1)
+    ).scalar()
+
+
+def agregar_adjunto(ticket, nombre, contenido, tipo_contenido=None, reemplazar=False, sha256=None):
+    """
+    Registra el archivo en ticket_fact_adjunto y en Ticket.adjunto, sin commit.
+    Con reemplazar=True queda como único adjunto del ticket. sha256 es la
+    huella ya calculada del contenido (si no se pasa, se calcula).
+    """
+    if reemplazar:
+        db.session.execute(delete(TicketAdjunto).where(TicketAdjunto.id_ticket == ticket.id))
+    db.session.add(TicketAdjunto(
+        id_ticket=ticket.id, nombre=nombre, tamano=len(contenido),
+        tipo_contenido=tipo_contenido, sha256=sha256 or huella(contenido),
+    ))
+    ticket.adjunto = ','.join(([] if reemplazar else nombres_adjuntos(ticket)) + [nombre])
+
+
+def quitar_adjunto(ticket, nombre):
+    """Quita el archivo de ticket_fact_adjunto y de Ticket.adjunto, sin commit"""
+    db.session.execute(
+        delete(TicketAdjunto).where(TicketAdjunto.id_ticket == ticket.id, TicketAdjunto.nombre == nombre)
+    )
+    ticket.adjunto = ','.join(n for n in nombres_adjuntos(ticket) if n != nombre)
+
+
+# 🔹 Migración desde Ticket.adjunto
+def _leer_archivo(nombre):
+    """(contenido, tipo de contenido, fecha de subida) desde Cloud Storage o uploads; None si no está"""
+    if storage_manager.bucket is not None:
+        blob = storage_manager.bucket.get_blob(nombre)
+        if blob is not None:
+            fecha = blob.time_created.replace(tzinfo=None) if blob.time_created else None
+            return blob.download_as_bytes(), blob.content_type, fecha
+    ruta = os.path.join(CARPETA_LOCAL, nombre)
+    if os.path.isfile(ruta):
+        with open(ruta, 'rb') as archivo:
+            contenido = archivo.read()
+        return contenido, None, datetime.utcfromtimestamp(os.path.getmtime(ruta))
+    return None
+
+
+def rellenar_adjuntos(lote=LOTE_MIGRACION):
+    """
+    Crea las filas que faltan en ticket_fact_adjunto a partir de Ticket.adjunto.
+    Es idempotente: salta los nombres que ya tienen fila. Devuelve
+    (filas creadas, archivos no encontrados); estos quedan con sha256 NULL.
+    """
+    creadas = sin_archivo = 0
+    ultimo_id = 0
+    while True:
+        tickets = db.session.execute(
+            select(Ticket.id, Ticket.adjunto)
+            .where(Ticket.id > ultimo_id, Ticket.adjunto.isnot(None), Ticket.adjunto != '')
+            .order_by(Ticket.id)
+            .limit(lote)
+        ).all()
+        if not tickets:
+            return creadas, sin_archivo
+        ultimo_id = tickets[-1].id
+
+        existentes = set(db.session.execute(
+            select(TicketAdjunto.nombre).where(TicketAdjunto.id_ticket.in_([t.id for t in tickets]))
+        ).scalars())
+        for ticket in tickets:
+            for nombre in nombres_adjuntos(ticket):
+                nombre = nombre.strip()
+                if not nombre or nombre in existentes:
+                    continue
+                existentes.add(nombre)
+                try:
+                    archivo = _leer_archivo(nombre)
+                except Exception as e:
+                    print(f"⚠️ Error al leer {nombre}: {str(e)}")
+                    archivo = None
+                if archivo is None:
+                    sin_archivo += 1
+                    fila = TicketAdjunto(id_ticket=ticket.id, nombre=nombre, fecha_subida=ahora_utc(),
+                                         tipo_contenido=mimetypes.guess_type(nombre)[0])
+                else:
+                    contenido, tipo_contenido, fecha = archivo
+                    fila = TicketAdjunto(
+                        id_ticket=ticket.id, nombre=nombre, tamano=len(contenido), sha256=huella(contenido),
+                        tipo_contenido=tipo_contenido or mimetypes.guess_type(nombre)[0],
+                        fecha_subida=fecha or ahora_utc(),
+                    )
+                db.session.add(fila)
+                creadas += 1
+        db.session.commit()
@@ -0,0 +1,126 @@
+"""
+Sincronización incremental de tickets: cambios desde una marca (since)
+
+Ticket y TicketComentario guardan fecha_modificacion (UTC) y las
+eliminaciones quedan en RegistroEliminado. GET /tickets/changes devuelve los
+tickets y comentarios creados o modificados y los eliminados desde la marca
+recibida, usando los índices sobre fecha_modificacion y fecha_eliminacion:
+el costo depende de la cantidad de cambios, no del tamaño de las tablas.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert, inspect, select
+from models import db, ahora_utc, Ticket, TicketComentario, RegistroEliminado
+from ticket_listing import (consulta_tickets, serializar_ticket, leer_campos, criterios_visibilidad,
+                            ParametroInvalido)
+from ticket_detail import consulta_comentarios, serializar_comentario
+
+# La marca devuelta retrocede este margen: una transacción que empezó antes
+# pero confirmó después de la consulta queda dentro de la siguiente sincronización.
+# Los cambios dentro del margen pueden llegar dos veces (el cliente los reemplaza).
+MARGEN_SINCRONIZACION = timedelta(seconds=10)
+
+
+def codificar_marca(fecha):
+    return base64.urlsafe_b64encode(json.dumps(['cambios', fecha.isoformat()]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_marca(marca):
+    try:
+        relleno = '=' * (-len(marca) % 4)
+        tipo, fecha = json.loads(base64.urlsafe_b64decode(marca + relleno))
+        if tipo != 'cambios':
+            raise ValueError(marca)
+        return datetime.fromisoformat(fecha)
+    except (ValueError, TypeError):
+        raise ParametroInvalido('Marca de sincronización (since) inválida')
+
+
+def nueva_marca():
+    return codificar_marca(ahora_utc() - MARGEN_SINCRONIZACION)
+
+
+def obtener_cambios(args, principal):
+    """
+    Cambios visibles para el usuario desde la marca args['since'].
+
+    Sin since no se devuelven cambios, solo la marca inicial: el cliente la
+    pide antes de cargar el listado completo y sincroniza desde ahí.
+
+    Returns:
+        dict: {"tickets": [...], "tickets_eliminados": [...], "comentarios": [...],
+               "comentarios_eliminados": [...], "since": nueva marca}
+    """
+    marca = nueva_marca()
+    resultado = {"tickets": [], "tickets_eliminados": [], "comentarios": [], "comentarios_eliminados": [], "since": marca}
+    if not args.get('since'):
+        return resultado
+
+    desde = decodificar_marca(args['since'])
+    campos = leer_campos(args.get('fields'))
+
+    filas = consulta_tickets(campos).filter(
+        Ticket.fecha_modificacion >= desde, *criterios_visibilidad(principal)
+    ).order_by(Ticket.fecha_modificacion, Ticket.id).all()
+    resultado["tickets"] = [serializar_ticket(fila, campos) for fila in filas]
+
+    filas = consulta_comentarios().join(Ticket, TicketComentario.id_ticket == Ticket.id).filter(
+        TicketComentario.fecha_modificacion >= desde, *criterios_visibilidad(principal)
+    ).order_by(TicketComentario.fecha_modificacion, TicketComentario.id).all()
+    resultado["comentarios"] = [serializar_comentario(fila) for fila in filas]
+
+    eliminados = db.session.query(RegistroEliminado.tipo, RegistroEliminado.id_registro).filter(
+        RegistroEliminado.fecha_eliminacion >= desde,
+        *criterios_visibilidad(principal, RegistroEliminado)
+    ).order_by(RegistroEliminado.fecha_eliminacion, RegistroEliminado.id).all()
+    # Un ticket que cambió de departamento deja un registro para quienes dejaron de verlo;
+    # quien todavía lo ve lo recibe en "tickets" y no debe borrarlo
+    vigentes = {t['id'] for t in resultado["tickets"]}
+    for tipo, id_registro in eliminados:
+        if tipo == 'ticket' and id_registro not in vigentes:
+            resultado["tickets_eliminados"].append(id_registro)
+        elif tipo == 'comentario':
+            resultado["comentarios_eliminados"].append(id_registro)
+    return resultado
+
+
+# 🔹 Registros de eliminación mantenidos con eventos del ORM
+def _registrar_eliminacion(connection, fecha=None, **valores):
+    connection.execute(insert(RegistroEliminado.__table__).values(
+        fecha_eliminacion=fecha or ahora_utc(), **valores
+    ))
+
+
+@event.listens_for(Ticket, 'after_delete')
+def _ticket_eliminado(mapper, connection, ticket):
+    _registrar_eliminacion(
+        connection, tipo='ticket', id_registro=ticket.id, id_ticket=ticket.id,
+        id_departamento=ticket.id_departamento, id_usuario=ticket.id_usuario
+    )
+
+
+@event.listens_for(Ticket, 'after_update')
+def _ticket_cambio_visibilidad(mapper, connection, ticket):
+    # Con la misma fecha que la modificación, ambos registros caen siempre en la misma sincronización
+    estado = inspect(ticket)
+    departamentos = estado.attrs.id_departamento.history.deleted
+    usuarios = estado.attrs.id_usuario.history.deleted
+    if departamentos or usuarios:
+        _registrar_eliminacion(
+            connection, fecha=ticket.fecha_modificacion, tipo='ticket', id_registro=ticket.id, id_ticket=ticket.id,
+            id_departamento=departamentos[0] if departamentos else ticket.id_departamento,
+            id_usuario=usuarios[0] if usuarios else ticket.id_usuario
+        )
+
+
+@event.listens_for(TicketComentario, 'after_delete')
+def _comentario_eliminado(mapper, connection, comentario):
+    ticket = connection.execute(
+        select(Ticket.id_departamento, Ticket.id_usuario).where(Ticket.id == comentario.id_ticket)
+    ).first()
+    _registrar_eliminacion(
+        connection, tipo='comentario', id_registro=comentario.id, id_ticket=comentario.id_ticket,
+        id_departamento=ticket.id_departamento if ticket else None,
+        id_usuario=ticket.id_usuario if ticket else None
+    )
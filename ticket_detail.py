@@ -0,0 +1,120 @@
+"""
+Detalle de un ticket y sus comentarios paginados
+
+El ticket se lee con la misma consulta única del listado (nombres de
+usuario, agente, estado, prioridad, departamento, categoría y sucursal
+incluidos) y los comentarios con una consulta que ya trae el nombre del
+autor, así que el detalle cuesta dos consultas sin importar cuántos
+comentarios tenga el ticket.
+
+Sin limit, before_id ni after_id el detalle y GET /tickets/<id>/comentarios
+devuelven todos los comentarios, como siempre. Con alguno de ellos se
+paginan por id:
+- sin cursor: los más recientes
+- before_id: los anteriores a ese id (para ir hacia atrás)
+- after_id: los posteriores a ese id (para traer solo los nuevos)
+Cada página se devuelve en orden cronológico (id ascendente).
+"""
+from models import db, Ticket, TicketComentario, Usuario
+from date_formatting import formatear_fecha_local
+from ticket_listing import consulta_tickets, serializar_ticket, leer_limite, ParametroInvalido
+
+
+def consulta_comentarios():
+    """Comentarios con el nombre de su autor en un único SELECT"""
+    return db.session.query(
+        TicketComentario.id, TicketComentario.id_ticket, TicketComentario.id_usuario,
+        TicketComentario.comentario, TicketComentario.timestamp,
+        Usuario.nombre, Usuario.apellido_paterno, Usuario.apellido_materno
+    ).outerjoin(Usuario, TicketComentario.id_usuario == Usuario.id)
+
+
+def serializar_comentario(fila):
+    """Convierte una fila de consulta_comentarios() al formato JSON de comentarios"""
+    return {
+        'id': fila.id,
+        'id_ticket': fila.id_ticket,
+        'id_usuario': fila.id_usuario,
+        'usuario': Usuario.formatear_nombre(fila.nombre, fila.apellido_paterno, fila.apellido_materno) if fila.nombre else None,
+        'comentario': fila.comentario,
+        'creado': formatear_fecha_local(fila.timestamp)
+    }
+
+
+def _leer_id(args, nombre):
+    valor = args.get(nombre)
+    if valor is None:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise ParametroInvalido(f'El parámetro {nombre} debe ser un número entero')
+
+
+def pide_pagina(args):
+    """True si la consulta trae limit, before_id o after_id"""
+    return any(parametro in args for parametro in ('limit', 'before_id', 'after_id'))
+
+
+def listar_comentarios(ticket_id):
+    """Todos los comentarios del ticket, en orden cronológico"""
+    filas = consulta_comentarios().filter(TicketComentario.id_ticket == ticket_id).order_by(TicketComentario.id).all()
+    return [serializar_comentario(fila) for fila in filas]
+
+
+def paginar_comentarios(ticket_id, args):
+    """
+    Una página de comentarios del ticket según before_id / after_id / limit.
+
+    Returns:
+        dict: {"comentarios": [...], "before_id": id para pedir los anteriores
+               (None si no hay), "after_id": id para pedir los nuevos}
+    """
+    limite = leer_limite(args.get('limit'))
+    antes_de = _leer_id(args, 'before_id')
+    despues_de = _leer_id(args, 'after_id')
+    if antes_de is not None and despues_de is not None:
+        raise ParametroInvalido('Use before_id o after_id, no ambos')
+
+    consulta = consulta_comentarios().filter(TicketComentario.id_ticket == ticket_id)
+    if despues_de is not None:
+        # Hacia adelante: los siguientes en orden ascendente
+        filas = consulta.filter(TicketComentario.id > despues_de).order_by(TicketComentario.id).limit(limite).all()
+        hay_anteriores = None
+    else:
+        # Hacia atrás: los últimos antes del cursor, leídos en orden descendente
+        if antes_de is not None:
+            consulta = consulta.filter(TicketComentario.id < antes_de)
+        filas = consulta.order_by(TicketComentario.id.desc()).limit(limite + 1).all()
+        hay_anteriores = len(filas) > limite
+        filas = list(reversed(filas[:limite]))
+
+    comentarios = [serializar_comentario(fila) for fila in filas]
+    if despues_de is not None:
+        # Al avanzar no se sabe si hay anteriores; el cliente ya los tiene
+        siguiente_anterior = None
+    else:
+        siguiente_anterior = comentarios[0]['id'] if hay_anteriores else None
+    ultimo = comentarios[-1]['id'] if comentarios else despues_de
+    return {"comentarios": comentarios, "before_id": siguiente_anterior, "after_id": ultimo}
+
+
+def obtener_detalle(ticket_id, args):
+    """
+    Ticket con sus nombres y sus comentarios: todos, o la página pedida con
+    limit / before_id / after_id. None si el ticket no existe.
+    """
+    fila = consulta_tickets().filter(Ticket.id == ticket_id).first()
+    if fila is None:
+        return None
+    if pide_pagina(args):
+        pagina = paginar_comentarios(ticket_id, args)
+    else:
+        comentarios = listar_comentarios(ticket_id)
+        ultimo = comentarios[-1]['id'] if comentarios else None
+        pagina = {"comentarios": comentarios, "before_id": None, "after_id": ultimo}
+    ticket = serializar_ticket(fila)
+    ticket['comentarios'] = pagina['comentarios']
+    ticket['comentarios_before_id'] = pagina['before_id']
+    ticket['comentarios_after_id'] = pagina['after_id']
+    return ticket
@@ -0,0 +1,283 @@
+"""
+Importación masiva de tickets (POST /api/admin/tickets/importar)
+
+Las sucursales envían planillas de incidencias que se ingresaban una por una
+con POST /api/tickets (un commit y dos hilos de correo por ticket). Aquí el
+archivo completo (CSV o un arreglo JSON) se procesa en una transacción:
+- cada fila se valida contra los catálogos en memoria (catalog_cache.py),
+  con ids o nombres;
+- los agentes se eligen con AsignacionEnLote (mismo criterio que
+  create_ticket, con las cargas leídas una vez);
+- los tickets se insertan en sentencias de TAMANO_LOTE filas, sin pasar por
+  el ORM, así que los contadores que mantienen los eventos (estadísticas,
+  cargas de agentes, versiones de ámbitos e índice de búsqueda en SQLite) se
+  actualizan aquí con una sentencia por tabla;
+- se encola un solo correo por destinatario con todos sus tickets, en la
+  misma transacción.
+
+Las filas con errores no se insertan y el resto sí; la respuesta informa el
+resultado de cada fila. Si falla la inserción, se revierte la importación
+completa, con sus contadores y correos.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import insert, select
+from models import db, Ticket, Usuario, CHILE_TZ, ahora_utc
+from catalog_cache import obtener_fila, fila_por_nombre, filas as filas_catalogo, id_por_nombre, nombre_por_id
+from change_versions import ambito_departamento, ambito_usuario, sentencia_incremento
+from ticket_assignment import AsignacionEnLote, ESTADO_CERRADO, sumar_insertados as sumar_cargas
+from ticket_stats import sumar_insertados as sumar_estadisticas
+from ticket_search import indexar_insertados
+from ticket_listing import ParametroInvalido
+from ticket_notifications import PLANTILLA_IMPORTACION
+from utils import enviar_correo_async
+
+MAX_FILAS = 20000
+TAMANO_LOTE = 500
+
+# Largos de las columnas: con STRICT_TRANS_TABLES un valor más largo haría fallar todo el lote
+LARGO_TITULO = Ticket.__table__.c.titulo.type.length
+BYTES_DESCRIPCION = 65535  # TEXT en MySQL
+
+SEPARADORES_CSV = ',;\t'
+
+
+# 🔹 Lectura del archivo
+def _normalizar_fila(fila):
+    normalizada = {}
+    for clave, valor in fila.items():
+        if clave is None:
+            continue
+        if isinstance(valor, str):
+            valor = valor.strip() or None
+        normalizada[str(clave).strip().lower()] = valor
+    return normalizada
+
+
+def _leer_csv(contenido):
+    try:
+        texto = contenido.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # Excel en español guarda los CSV en Windows-1252
+        texto = contenido.decode('cp1252')
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=SEPARADORES_CSV)
+    except csv.Error:
+        dialecto = csv.excel
+    return list(csv.DictReader(io.StringIO(texto), dialect=dialecto))
+
+
+def leer_filas(request):
+    """Filas del archivo 'archivo' (CSV o JSON) o del cuerpo de la petición"""
+    archivo = request.files.get('archivo')
+    if archivo:
+        contenido = archivo.read()
+        if (archivo.filename or '').lower().endswith('.json'):
+            try:
+                datos = json.loads(contenido)
+            except ValueError:
+                raise ParametroInvalido('El archivo JSON no es válido')
+        else:
+            datos = _leer_csv(contenido)
+    elif request.is_json:
+        datos = request.get_json(silent=True)
+    elif request.mimetype in ('text/csv', 'application/csv', 'text/plain'):
+        datos = _leer_csv(request.get_data())
+    else:
+        raise ParametroInvalido('Envíe un archivo CSV o JSON en el campo "archivo", o un arreglo JSON de tickets')
+
+    if isinstance(datos, dict):
+        datos = datos.get('tickets')
+    if not isinstance(datos, list) or not all(isinstance(fila, dict) for fila in datos):
+        raise ParametroInvalido('Se esperaba una lista de tickets')
+    if not datos:
+        raise ParametroInvalido('El archivo no tiene tickets')
+    if len(datos) > MAX_FILAS:
+        raise ParametroInvalido(f'El archivo tiene {len(datos)} tickets; el máximo es {MAX_FILAS}')
+    return [_normalizar_fila(fila) for fila in datos]
+
+
+# 🔹 Validación
+def _catalogo(fila, catalogo, campo):
+    """Fila del catálogo indicada por id_<campo> o por <campo> (nombre)"""
+    if fila.get(f'id_{campo}') is not None:
+        return obtener_fila(catalogo, fila[f'id_{campo}'])
+    if fila.get(campo) is not None:
+        return fila_por_nombre(catalogo, str(fila[campo]))
+    return None
+
+
+def _indice_categorias():
+    """(departamento, nombre normalizado) -> categoría; los nombres solo son únicos por departamento"""
+    indice = {}
+    for categoria in sorted(filas_catalogo('categoria'), key=lambda c: c.id, reverse=True):
+        indice[(categoria.id_departamento, categoria.nombre.strip().casefold())] = categoria
+    return indice
+
+
+def _validar(fila, categorias, id_abierto, id_baja):
+    """Valores de la fila resueltos con los catálogos, y la lista de errores"""
+    errores = []
+    valores = {}
+
+    for campo in ('titulo', 'descripcion'):
+        if fila.get(campo) is None:
+            errores.append(f'Falta {campo}')
+        valores[campo] = str(fila.get(campo) or '')
+    if len(valores['titulo']) > LARGO_TITULO:
+        errores.append(f'El título supera los {LARGO_TITULO} caracteres')
+    if len(valores['descripcion'].encode('utf-8')) > BYTES_DESCRIPCION:
+        errores.append('La descripción es demasiado larga')
+
+    departamento = _catalogo(fila, 'departamento', 'departamento')
+    if departamento is None:
+        errores.append('Departamento inexistente' if fila.get('id_departamento') or fila.get('departamento')
+                       else 'Falta departamento')
+    valores['id_departamento'] = departamento.id if departamento else None
+
+    if fila.get('id_categoria') is not None:
+        categoria = obtener_fila('categoria', fila['id_categoria'])
+    elif fila.get('categoria') is not None and departamento:
+        categoria = categorias.get((departamento.id, str(fila['categoria']).casefold()))
+    else:
+        categoria = None
+    if categoria is None:
+        errores.append('Categoría inexistente' if fila.get('id_categoria') or fila.get('categoria')
+                       else 'Falta categoría')
+    elif departamento and categoria.id_departamento != departamento.id:
+        errores.append('La categoría no pertenece al departamento')
+    valores['categoria'] = categoria
+
+    for catalogo, campo, defecto in (('prioridad', 'prioridad', id_baja), ('estado', 'estado', id_abierto),
+                                     ('sucursal', 'sucursal', None)):
+        indicado = fila.get(f'id_{campo}') is not None or fila.get(campo) is not None
+        encontrado = _catalogo(fila, catalogo, campo)
+        if indicado and encontrado is None:
+            errores.append(f'{campo.capitalize()} inexistente')
+        valores[f'id_{campo}'] = encontrado.id if encontrado else defecto
+
+    valores['id_usuario'] = str(fila['id_usuario']) if fila.get('id_usuario') is not None else None
+    valores['id_agente'] = str(fila['id_agente']) if fila.get('id_agente') is not None else None
+    return valores, errores
+
+
+# 🔹 Inserción
+def _insertar(conexion, filas):
+    """Inserta un lote en una sentencia y completa el id de cada fila"""
+    # Los ids de un INSERT de varias filas son consecutivos: InnoDB los reserva juntos
+    # cuando la cantidad de filas se conoce de antemano y SQLite tiene un solo escritor.
+    # lastrowid es el id de la primera fila en MySQL y el de la última en SQLite.
+    resultado = conexion.execute(insert(Ticket.__table__).values(filas))
+    primero = resultado.lastrowid - len(filas) + 1 if conexion.dialect.name == 'sqlite' else resultado.lastrowid
+    for fila, id in zip(filas, range(primero, primero + len(filas))):
+        fila['id'] = id
+
+
+def importar_tickets(filas, principal):
+    """Valida, asigna e inserta los tickets; devuelve el resultado por fila y los tickets creados"""
+    categorias = _indice_categorias()
+    id_abierto = id_por_nombre('estado', "Abierto")
+    id_baja = id_por_nombre('prioridad', "Baja")
+    id_cerrado = id_por_nombre('estado', ESTADO_CERRADO)
+
+    validadas = [_validar(fila, categorias, id_abierto, id_baja) for fila in filas]
+
+    # Creadores y agentes indicados, en una consulta
+    ids_usuarios = {principal.id}
+    for valores, _ in validadas:
+        ids_usuarios.update(i for i in (valores['id_usuario'], valores['id_agente']) if i)
+    ids_usuarios.update(v['categoria'].id_usuario for v, _ in validadas if v['categoria'] and v['categoria'].id_usuario)
+    usuarios = {u.id: u for u in db.session.execute(select(Usuario).where(Usuario.id.in_(ids_usuarios))).scalars()}
+
+    lote = AsignacionEnLote({v['id_departamento'] for v, errores in validadas if not errores})
+    ahora, ahora_modificacion = datetime.now(CHILE_TZ), ahora_utc()
+    resultados, insertar = [], []
+
+    for numero, (valores, errores) in enumerate(validadas, start=1):
+        id_departamento = valores['id_departamento']
+        creador = usuarios.get(valores['id_usuario'] or principal.id)
+        if creador is None:
+            errores.append('Usuario creador inexistente')
+
+        id_agente = valores['id_agente']
+        if id_agente and not lote.pertenece(id_agente, id_departamento) and not errores:
+            errores.append('El agente no pertenece al departamento')
+        if errores:
+            resultados.append({'fila': numero, 'errores': errores})
+            continue
+
+        # Igual que create_ticket: responsable de la categoría o agente con menos tickets abiertos
+        categoria = valores['categoria']
+        if not id_agente and categoria.id_usuario:
+            responsable = usuarios.get(categoria.id_usuario)
+            if (responsable and nombre_por_id('rol', responsable.id_rol) == 'AGENTE'
+                    and lote.pertenece(responsable.id, id_departamento)):
+                id_agente = responsable.id
+        if not id_agente:
+            id_agente = lote.elegir(id_departamento)
+        if id_agente and valores['id_estado'] != id_cerrado:
+            lote.sumar(id_agente, id_departamento)
+
+        resultado = {'fila': numero}
+        resultados.append(resultado)
+        insertar.append((resultado, {
+            'id_usuario': creador.id,
+            'id_agente': id_agente,
+            'id_sucursal': valores['id_sucursal'] or creador.id_sucursalactiva,
+            'id_estado': valores['id_estado'],
+            'id_prioridad': valores['id_prioridad'],
+            'id_departamento': id_departamento,
+            'id_categoria': categoria.id,
+            'titulo': valores['titulo'],
+            'descripcion': valores['descripcion'],
+            'fecha_creacion': ahora,
+            'fecha_modificacion': ahora_modificacion,
+            'fecha_primera_asignacion': ahora if id_agente else None,
+        }))
+
+    tickets = [ticket for _, ticket in insertar]
+    if tickets:
+        conexion = db.session.connection()
+        for inicio in range(0, len(tickets), TAMANO_LOTE):
+            _insertar(conexion, tickets[inicio:inicio + TAMANO_LOTE])
+
+        # Lo que los eventos del ORM harían ticket por ticket
+        sumar_estadisticas(conexion, tickets)
+        sumar_cargas(conexion, tickets)
+        indexar_insertados(conexion, tickets)
+        ambitos = set()
+        for ticket in tickets:
+            ambitos.update((ambito_departamento(ticket['id_departamento']), ambito_usuario(ticket['id_usuario'])))
+        conexion.execute(sentencia_incremento(conexion.dialect.name, ambitos))
+        notificar_importacion(tickets)
+    db.session.commit()
+
+    for resultado, ticket in insertar:
+        resultado['ticket_id'] = ticket['id']
+    return resultados, tickets
+
+
+# 🔹 Notificaciones agrupadas
+def notificar_importacion(tickets):
+    """Un correo por destinatario (creador o agente) con todos sus tickets importados"""
+    por_destinatario = {}
+    for ticket in tickets:
+        for id_usuario in {ticket['id_usuario'], ticket['id_agente']} - {None}:
+            por_destinatario.setdefault(id_usuario, []).append(ticket)
+    if not por_destinatario:
+        return
+
+    correos = dict(db.session.execute(
+        select(Usuario.id, Usuario.correo).where(Usuario.id.in_(por_destinatario))
+    ).all())
+    for id_usuario, suyos in por_destinatario.items():
+        if not correos.get(id_usuario):
+            continue
+        cuerpo = PLANTILLA_IMPORTACION.render(tickets=[
+            {'id': t['id'], 'titulo': t['titulo'],
+             'sucursal': nombre_por_id('sucursal', t['id_sucursal'], 'No asignada')}
+            for t in suyos
+        ])
+        enviar_correo_async(correos[id_usuario], f"{len(suyos)} Tickets Importados", cuerpo)
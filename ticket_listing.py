@@ -0,0 +1,371 @@
+"""
+Consulta y serialización compartidas por los listados de tickets
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import aliased
+from models import (db, Usuario, Ticket, TicketEstado, TicketPrioridad,
+                    Departamento, Sucursal, Categoria)
+from date_formatting import formatear_fecha
+from json_streaming import iterar_en_lotes, respuesta_json_en_streaming
+
+# Tamaño de página para los listados paginados
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 200
+
+# Largo del extracto descripcion_corta (calculado en SQL)
+LARGO_DESCRIPCION_CORTA = 160
+
+# Alias de Usuario: un ticket se une dos veces a la tabla de usuarios
+UsuarioCreador = aliased(Usuario, name='usuario_creador')
+UsuarioAgente = aliased(Usuario, name='usuario_agente')
+
+# Uniones opcionales del listado: solo se agregan si algún campo pedido las necesita
+UNIONES = {
+    'usuario': (UsuarioCreador, Ticket.id_usuario == UsuarioCreador.id),
+    'agente': (UsuarioAgente, Ticket.id_agente == UsuarioAgente.id),
+    'estado': (TicketEstado, Ticket.id_estado == TicketEstado.id),
+    'prioridad': (TicketPrioridad, Ticket.id_prioridad == TicketPrioridad.id),
+    'departamento': (Departamento, Ticket.id_departamento == Departamento.id),
+    'categoria': (Categoria, Ticket.id_categoria == Categoria.id),
+    'sucursal': (Sucursal, Ticket.id_sucursal == Sucursal.id),
+}
+
+
+def _nombre_usuario(fila):
+    if fila.usuario_nombre is None:
+        return "Sin usuario"
+    return Usuario.formatear_nombre(fila.usuario_nombre, fila.usuario_apellido_paterno, fila.usuario_apellido_materno)
+
+
+def _nombre_agente(fila):
+    if fila.agente_nombre is None:
+        return "Sin asignar"
+    return Usuario.formatear_nombre(fila.agente_nombre, fila.agente_apellido_paterno, fila.agente_apellido_materno)
+
+
+def _descripcion_corta(fila):
+    extracto = fila.descripcion_corta
+    if extracto and len(extracto) > LARGO_DESCRIPCION_CORTA:
+        return extracto[:LARGO_DESCRIPCION_CORTA].rstrip() + '…'
+    return extracto
+
+
+# Campos que puede devolver el listado: nombre -> (columnas SQL, unión necesaria, serializador)
+CAMPOS = {
+    'id': ([Ticket.id], None, lambda f: f.id),
+    'titulo': ([Ticket.titulo], None, lambda f: f.titulo),
+    'descripcion': ([Ticket.descripcion], None, lambda f: f.descripcion),
+    # Se pide un carácter extra para saber si el extracto quedó truncado
+    'descripcion_corta': (
+        [func.substr(Ticket.descripcion, 1, LARGO_DESCRIPCION_CORTA + 1).label('descripcion_corta')],
+        None, _descripcion_corta
+    ),
+    'id_usuario': ([Ticket.id_usuario], None, lambda f: f.id_usuario),
+    'id_agente': ([Ticket.id_agente], None, lambda f: f.id_agente),
+    'usuario': ([
+        UsuarioCreador.nombre.label('usuario_nombre'),
+        UsuarioCreador.apellido_paterno.label('usuario_apellido_paterno'),
+        UsuarioCreador.apellido_materno.label('usuario_apellido_materno'),
+    ], 'usuario', _nombre_usuario),
+    'agente': ([
+        UsuarioAgente.nombre.label('agente_nombre'),
+        UsuarioAgente.apellido_paterno.label('agente_apellido_paterno'),
+        UsuarioAgente.apellido_materno.label('agente_apellido_materno'),
+    ], 'agente', _nombre_agente),
+    'estado': ([TicketEstado.nombre.label('estado')], 'estado', lambda f: f.estado),
+    'prioridad': ([TicketPrioridad.nombre.label('prioridad')], 'prioridad', lambda f: f.prioridad),
+    'departamento': ([Departamento.nombre.label('departamento')], 'departamento', lambda f: f.departamento),
+    'id_departamento': ([Ticket.id_departamento], None, lambda f: f.id_departamento),
+    'id_categoria': ([Ticket.id_categoria], None, lambda f: f.id_categoria),
+    'categoria': ([Categoria.nombre.label('categoria')], 'categoria', lambda f: f.categoria),
+    'sucursal': (
+        [Sucursal.nombre.label('sucursal')], 'sucursal',
+        lambda f: f.sucursal if f.sucursal is not None else "No asignada"
+    ),
+    'fecha_creacion': ([Ticket.fecha_creacion], None, lambda f: formatear_fecha(f.fecha_creacion)),
+    'fecha_cierre': ([Ticket.fecha_cierre], None, lambda f: formatear_fecha(f.fecha_cierre)),
+    'adjunto': ([Ticket.adjunto], None, lambda f: f.adjunto),
+    'id_prioridad': ([Ticket.id_prioridad], None, lambda f: f.id_prioridad),
+    'id_estado': ([Ticket.id_estado], None, lambda f: f.id_estado),
+}
+
+# Campos del listado cuando no se envía el parámetro fields
+CAMPOS_POR_DEFECTO = (
+    'id', 'titulo', 'descripcion', 'id_usuario', 'id_agente', 'usuario', 'agente',
+    'estado', 'prioridad', 'departamento', 'id_departamento', 'id_categoria', 'categoria',
+    'sucursal', 'fecha_creacion', 'fecha_cierre', 'adjunto', 'id_prioridad', 'id_estado'
+)
+
+
+def consulta_tickets(campos=CAMPOS_POR_DEFECTO, columnas_extra=()):
+    """
+    Construye la consulta del listado de tickets para los campos pedidos.
+
+    Trae en un único SELECT solo las columnas que esos campos necesitan y
+    solo las uniones con usuario, agente, estado, prioridad, departamento,
+    categoría y sucursal que se usan, de modo que el número de consultas no
+    crece con la cantidad de tickets.
+
+    Args:
+        campos: Nombres de CAMPOS a devolver
+        columnas_extra: Columnas que se necesitan aunque no se devuelvan (orden, cursor)
+    """
+    columnas = {Ticket.id.key: Ticket.id}
+    uniones = []
+    for campo in campos:
+        columnas_campo, union, _ = CAMPOS[campo]
+        for columna in columnas_campo:
+            columnas.setdefault(columna.key, columna)
+        if union and union not in uniones:
+            uniones.append(union)
+    for columna in columnas_extra:
+        columnas.setdefault(columna.key, columna)
+
+    consulta = db.session.query(*columnas.values()).select_from(Ticket)
+    for union in uniones:
+        consulta = consulta.outerjoin(*UNIONES[union])
+    return consulta
+
+
+def serializar_ticket(fila, campos=CAMPOS_POR_DEFECTO):
+    """Convierte una fila de consulta_tickets() al formato JSON del listado"""
+    return {campo: CAMPOS[campo][2](fila) for campo in campos}
+
+
+def leer_campos(valor):
+    """Valida el parámetro fields contra la lista de campos disponibles"""
+    if not valor:
+        return CAMPOS_POR_DEFECTO
+    campos = []
+    for campo in valor.split(','):
+        campo = campo.strip()
+        if not campo:
+            continue
+        if campo not in CAMPOS:
+            raise ParametroInvalido(f"Campo no disponible: {campo}. Opciones: {', '.join(sorted(CAMPOS))}")
+        if campo not in campos:
+            campos.append(campo)
+    return tuple(campos) or CAMPOS_POR_DEFECTO
+
+
+# Filtros admitidos como parámetros de consulta: nombre -> (columna, conversión)
+FILTROS = {
+    'id_estado': (Ticket.id_estado, int),
+    'id_prioridad': (Ticket.id_prioridad, int),
+    'id_departamento': (Ticket.id_departamento, int),
+    'id_categoria': (Ticket.id_categoria, str),
+    'id_agente': (Ticket.id_agente, str),
+    'id_sucursal': (Ticket.id_sucursal, int),
+}
+
+# Órdenes admitidos en el parámetro sort; el prefijo "-" indica descendente
+COLUMNAS_ORDEN = {
+    'fecha_creacion': Ticket.fecha_creacion,
+    'prioridad': Ticket.id_prioridad,
+    'estado': Ticket.id_estado,
+    'id': Ticket.id,
+}
+ORDEN_POR_DEFECTO = '-fecha_creacion'
+
+
+class ParametroInvalido(ValueError):
+    """Parámetro de listado (limit, cursor, sort, filtros) mal formado"""
+
+
+def criterios_visibilidad(principal, entidad=Ticket):
+    """
+    Criterios de los tickets que un usuario (principal.Principal) puede ver según su rol.
+
+    Administradores ven todos los tickets, agentes los de sus departamentos
+    asignados y los demás usuarios solo los tickets que crearon. entidad es
+    cualquier modelo con id_departamento e id_usuario del ticket (por defecto
+    Ticket; también RegistroEliminado).
+    """
+    if principal.es_administrador:
+        return []
+    if principal.es_agente:
+        return [entidad.id_departamento.in_(principal.departamentos)]
+    return [entidad.id_usuario == principal.id]
+
+
+def leer_fecha(valor):
+    """Interpreta una fecha YYYY-MM-DD o una fecha y hora ISO"""
+    try:
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        raise ParametroInvalido(f'Fecha inválida: {valor}')
+
+
+def leer_filtros(args):
+    """
+    Convierte los parámetros de filtro de la petición en criterios SQL.
+
+    Cada filtro acepta uno o varios valores separados por coma; el rango de
+    fechas se expresa con desde/hasta sobre fecha_creacion (hasta inclusive).
+    """
+    criterios = []
+    for nombre, (columna, conversion) in FILTROS.items():
+        valor = args.get(nombre)
+        if not valor:
+            continue
+        try:
+            valores = [conversion(v.strip()) for v in valor.split(',') if v.strip()]
+        except ValueError:
+            raise ParametroInvalido(f'Valor inválido para {nombre}: {valor}')
+        if len(valores) == 1:
+            criterios.append(columna == valores[0])
+        elif valores:
+            criterios.append(columna.in_(valores))
+
+    if args.get('desde'):
+        criterios.append(Ticket.fecha_creacion >= leer_fecha(args['desde']))
+    if args.get('hasta'):
+        hasta = args['hasta']
+        if len(hasta) == 10:
+            # Una fecha sin hora incluye el día completo
+            criterios.append(Ticket.fecha_creacion < leer_fecha(hasta) + timedelta(days=1))
+        else:
+            criterios.append(Ticket.fecha_creacion <= leer_fecha(hasta))
+    return criterios
+
+
+def leer_orden(valor):
+    """Valida el parámetro sort contra la lista de órdenes admitidos"""
+    orden = valor or ORDEN_POR_DEFECTO
+    if orden.lstrip('-') not in COLUMNAS_ORDEN:
+        raise ParametroInvalido(f"Orden no admitido: {orden}. Opciones: {', '.join(sorted(COLUMNAS_ORDEN))}")
+    return orden
+
+
+def clausula_orden(orden):
+    """Columnas ORDER BY para el orden dado, con el id como desempate"""
+    columna = COLUMNAS_ORDEN[orden.lstrip('-')]
+    columnas = [columna] if columna is Ticket.id else [columna, Ticket.id]
+    if orden.startswith('-'):
+        return [c.desc() for c in columnas]
+    return [c.asc() for c in columnas]
+
+
+def listar_tickets(*criterios, orden=ORDEN_POR_DEFECTO, campos=CAMPOS_POR_DEFECTO):
+    """
+    Devuelve los tickets que cumplen los criterios, ya serializados.
+
+    Args:
+        *criterios: Expresiones de filtro de SQLAlchemy sobre Ticket
+        orden: Uno de los órdenes de COLUMNAS_ORDEN (por defecto fecha de creación descendente)
+        campos: Campos a devolver de cada ticket
+
+    Returns:
+        list: Tickets serializados
+    """
+    filas = consulta_tickets(campos).filter(*criterios).order_by(*clausula_orden(orden)).all()
+    return [serializar_ticket(fila, campos) for fila in filas]
+
+
+def codificar_cursor(orden, valor, ticket_id):
+    """Genera el cursor opaco que apunta a la posición (valor de orden, id)"""
+    if isinstance(valor, datetime):
+        valor = valor.isoformat()
+    posicion = [orden, valor, ticket_id]
+    return base64.urlsafe_b64encode(json.dumps(posicion).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor, orden):
+    """Recupera (valor de orden, id) desde un cursor generado por codificar_cursor"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        orden_cursor, valor, ticket_id = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if orden.lstrip('-') == 'fecha_creacion':
+            valor = datetime.fromisoformat(valor)
+        else:
+            valor = int(valor)
+        ticket_id = int(ticket_id)
+    except (ValueError, TypeError):
+        raise ParametroInvalido('Cursor inválido')
+
+    if orden_cursor != orden:
+        raise ParametroInvalido('El cursor pertenece a otro orden (sort)')
+    return valor, ticket_id
+
+
+def leer_limite(valor):
+    """Valida el parámetro limit y lo acota a LIMITE_MAXIMO"""
+    if valor is None:
+        return LIMITE_POR_DEFECTO
+    try:
+        limite = int(valor)
+    except ValueError:
+        raise ParametroInvalido('El parámetro limit debe ser un número entero')
+    if limite < 1:
+        raise ParametroInvalido('El parámetro limit debe ser mayor que cero')
+    return min(limite, LIMITE_MAXIMO)
+
+
+def paginar_tickets(criterios, limite, cursor=None, orden=ORDEN_POR_DEFECTO, campos=CAMPOS_POR_DEFECTO):
+    """
+    Devuelve una página de tickets usando paginación por clave (keyset).
+
+    La página continúa estrictamente después de la posición del cursor en el
+    orden (columna de orden, id), por lo que su costo no depende de cuán
+    profunda sea la página.
+
+    Returns:
+        tuple: (tickets serializados, cursor de la siguiente página o None)
+    """
+    columna = COLUMNAS_ORDEN[orden.lstrip('-')]
+    consulta = consulta_tickets(campos, columnas_extra=[columna]).filter(*criterios)
+    if cursor:
+        valor, ticket_id = decodificar_cursor(cursor, orden)
+        if orden.startswith('-'):
+            consulta = consulta.filter(or_(columna < valor, and_(columna == valor, Ticket.id < ticket_id)))
+        else:
+            consulta = consulta.filter(or_(columna > valor, and_(columna == valor, Ticket.id > ticket_id)))
+
+    # Se pide una fila extra para saber si existe una página siguiente
+    filas = consulta.order_by(*clausula_orden(orden)).limit(limite + 1).all()
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente = codificar_cursor(orden, getattr(ultima, columna.key), ultima.id)
+    return [serializar_ticket(fila, campos) for fila in filas], siguiente
+
+
+def obtener_listado(args, *criterios):
+    """
+    Resuelve un listado de tickets a partir de los parámetros de la petición.
+
+    Los criterios recibidos (visibilidad según el rol) se combinan con los
+    filtros y el orden de la petición, evaluados en SQL; fields limita las
+    columnas que se leen y devuelven. Sin limit ni cursor responde la lista
+    completa, como siempre. Con cualquiera de los dos responde una página:
+    {"tickets": [...], "next_cursor": ...}
+    """
+    criterios = list(criterios) + leer_filtros(args)
+    orden = leer_orden(args.get('sort'))
+    campos = leer_campos(args.get('fields'))
+
+    if 'limit' not in args and 'cursor' not in args:
+        return listar_tickets(*criterios, orden=orden, campos=campos)
+
+    limite = leer_limite(args.get('limit'))
+    tickets, siguiente = paginar_tickets(criterios, limite, args.get('cursor'), orden, campos)
+    return {"tickets": tickets, "next_cursor": siguiente}
+
+
+def transmitir_listado(args, *criterios):
+    """
+    Listado completo como respuesta JSON en streaming (?stream=1).
+
+    Acepta los mismos filtros, orden y campos que obtener_listado; los
+    parámetros se validan antes de empezar a responder.
+    """
+    criterios = list(criterios) + leer_filtros(args)
+    orden = leer_orden(args.get('sort'))
+    campos = leer_campos(args.get('fields'))
+
+    consulta = consulta_tickets(campos).filter(*criterios).order_by(*clausula_orden(orden))
+    return respuesta_json_en_streaming(iterar_en_lotes(consulta), lambda fila: serializar_ticket(fila, campos))
@@ -0,0 +1,269 @@
+"""
+Notificaciones por correo de los cambios en tickets
+
+Antes cada ruta armaba el correo en el hilo de la petición: consultaba la
+sucursal, el creador y el agente, y construía el HTML con f-strings antes de
+responder. Ahora la ruta solo registra un evento (tipo, ticket, actor y los
+ids propios del tipo) en ticket_fact_evento_notificacion, en la misma
+transacción del cambio.
+
+El hilo de email_outbox.py llama a renderizar_eventos antes de cada lote:
+- reclama hasta un lote de eventos (con la misma marca que los correos, así
+  dos instancias no procesan el mismo evento);
+- carga los tickets, usuarios y comentarios de todos los eventos del lote en
+  tres consultas (los catálogos salen de catalog_cache.py);
+- arma cada correo con las plantillas Jinja de PLANTILLAS, compiladas una vez
+  al importar el módulo (el texto de los usuarios se escapa);
+- los deja en la bandeja de salida con la agrupación por ticket (salvo la
+  creación) y borra cada evento en el mismo savepoint que sus correos.
+
+Si un evento falla (datos inválidos, un error al encolar) se revierte solo
+su savepoint y se reintenta con la misma espera exponencial que los
+correos; después de CORREO_MAX_INTENTOS fallos queda en estado "fallido"
+con el error, sin detener a los demás eventos del lote.
+"""
+import json
+import uuid
+from datetime import timedelta
+from flask import current_app
+from jinja2 import DictLoader, Environment
+from sqlalchemy import delete, select, update
+from models import db, EventoNotificacion, Ticket, TicketComentario, Usuario, ahora_utc
+from catalog_cache import nombre_por_id
+from email_outbox import (agrupacion_ticket, antes_de_enviar, avisar_enviador, encolar_correo, retraso,
+                          PENDIENTE, FALLIDO, MAX_INTENTOS_POR_DEFECTO, RECLAMO_SEGUNDOS)
+
+CREACION = 'creacion'
+CAMBIO_ESTADO = 'cambio_estado'
+COMENTARIO = 'comentario'
+REASIGNACION = 'reasignacion'
+CIERRE = 'cierre'
+
+ASUNTOS = {
+    CREACION: "Nuevo Ticket Creado",
+    CAMBIO_ESTADO: "Ticket {id} Cambió de Estado",
+    COMENTARIO: "Nuevo Comentario en el Ticket {id}",
+    REASIGNACION: "Ticket {id} Reasignado",
+    CIERRE: "Ticket {id} Cerrado",
+}
+
+_FUENTES = {
+    'base.html': """
+        <h1>{% block titulo %}{% endblock %}</h1>
+        <p>{% block introduccion %}{% endblock %}</p>
+        <ul>
+            <li><strong>ID:</strong> {{ ticket.id }}</li>
+            <li><strong>Título:</strong> {{ ticket.titulo }}</li>
+            <li><strong>Descripción:</strong> {{ ticket.descripcion }}</li>
+            <li><strong>Creado por:</strong> {{ usuario_nombre }}</li>
+            <li><strong>Sucursal:</strong> {{ sucursal_nombre }}</li>
+            {%- block agentes %}
+            <li><strong>Agente asignado:</strong> {{ agente_nombre }}</li>
+            {%- endblock %}
+        </ul>
+        {%- block detalle %}{% endblock %}
+        <p>Por favor, revisa el sistema{% block sistema %}{% endblock %} para más detalles.</p>
+        <p>https://tickets.lahornilla.cl/</p>
+        <p>Departamento de TI La Hornilla.</p>
+        """,
+    'creacion.html': """{% extends "base.html" %}
+        {%- block titulo %}Nuevo Ticket Creado{% endblock %}
+        {%- block introduccion %}Se ha creado un nuevo ticket con los siguientes detalles:{% endblock %}
+        {%- block sistema %} de tickets{% endblock %}""",
+    'cambio_estado.html': """{% extends "base.html" %}
+        {%- block titulo %}Cambio de Estado del Ticket{% endblock %}
+        {%- block introduccion %}El ticket con los siguientes detalles ha cambiado de estado:{% endblock %}
+        {%- block agentes %}{{ super() }}
+            <li><strong>Nuevo Estado:</strong> {{ nuevo_estado }}</li>
+        {%- endblock %}""",
+    'comentario.html': """{% extends "base.html" %}
+        {%- block titulo %}Nuevo Comentario en Ticket{% endblock %}
+        {%- block introduccion %}Se ha agregado un nuevo comentario al ticket con los siguientes detalles:{% endblock %}
+        {%- block detalle %}
+        <h3>Comentario:</h3>
+        <blockquote>{{ comentario }}</blockquote>
+        {%- endblock %}""",
+    'reasignacion.html': """{% extends "base.html" %}
+        {%- block titulo %}Ticket Reasignado{% endblock %}
+        {%- block introduccion %}El ticket con los siguientes detalles ha sido reasignado:{% endblock %}
+        {%- block agentes %}
+            <li><strong>Agente anterior:</strong> {{ agente_anterior_nombre }}</li>
+            <li><strong>Nuevo agente asignado:</strong> {{ agente_nombre }}</li>
+        {%- endblock %}""",
+    'cierre.html': """{% extends "base.html" %}
+        {%- block titulo %}Ticket Cerrado{% endblock %}
+        {%- block introduccion %}El ticket con los siguientes detalles ha sido cerrado:{% endblock %}
+        {%- block detalle %}{% if comentario %}
+        <h3>Comentario de cierre:</h3>
+        <blockquote>{{ comentario }}</blockquote>
+        {%- endif %}{% endblock %}""",
+    # Correo agrupado de la importación masiva (ver ticket_import.notificar_importacion)
+    'importacion.html': """
+        <h1>Tickets Importados</h1>
+        <p>Se importaron {{ tickets|length }} tickets en los que participas:</p>
+        <ul>
+            {%- for ticket in tickets %}
+            <li><strong>#{{ ticket.id }}</strong> {{ ticket.titulo }} ({{ ticket.sucursal }})</li>
+            {%- endfor %}
+        </ul>
+        <p>Por favor, revisa el sistema de tickets para más detalles.</p>
+        <p>https://tickets.lahornilla.cl/</p>
+        <p>Departamento de TI La Hornilla.</p>
+        """,
+}
+
+_entorno = Environment(loader=DictLoader(_FUENTES), autoescape=True)
+PLANTILLAS = {tipo: _entorno.get_template(f'{tipo}.html') for tipo in ASUNTOS}
+PLANTILLA_IMPORTACION = _entorno.get_template('importacion.html')
+
+
+# 🔹 Registro en la petición
+def registrar_evento(tipo, id_ticket, id_actor=None, sesion=None, **datos):
+    """
+    Anota la notificación en la transacción actual; datos son ids propios del
+    tipo (id_estado, id_comentario, id_agente_anterior, id_agente)
+    """
+    sesion = sesion or db.session()
+    sesion.add(EventoNotificacion(
+        tipo=tipo, id_ticket=id_ticket, id_actor=id_actor,
+        datos=json.dumps(datos, separators=(',', ':')) if datos else None,
+    ))
+    avisar_enviador(sesion)
+
+
+# 🔹 Conversión en correos (hilo de email_outbox.py)
+def _reclamar(lote):
+    ahora = ahora_utc()
+    # Pendientes cuyo reintento ya llegó, o reclamados por un proceso que murió
+    disponible = (EventoNotificacion.estado == PENDIENTE, EventoNotificacion.proximo_intento <= ahora)
+    ids = db.session.execute(
+        select(EventoNotificacion.id).where(*disponible).order_by(EventoNotificacion.id).limit(lote)
+    ).scalars().all()
+    if not ids:
+        return []
+    marca = uuid.uuid4().hex
+    db.session.execute(
+        update(EventoNotificacion).where(EventoNotificacion.id.in_(ids), *disponible)
+        .values(reclamado=marca, proximo_intento=ahora + timedelta(seconds=RECLAMO_SEGUNDOS))
+    )
+    db.session.commit()
+    return db.session.execute(
+        select(EventoNotificacion.id, EventoNotificacion.tipo, EventoNotificacion.id_ticket,
+               EventoNotificacion.id_actor, EventoNotificacion.datos, EventoNotificacion.intentos)
+        .where(EventoNotificacion.reclamado == marca).order_by(EventoNotificacion.id)
+    ).all()
+
+
+def _leer_datos(evento):
+    return dict(json.loads(evento.datos)) if evento.datos else {}
+
+
+def _nombre(usuario, defecto=""):
+    if usuario is None:
+        return defecto
+    return Usuario.formatear_nombre(usuario.nombre, usuario.apellido_paterno, usuario.apellido_materno)
+
+
+def _destinatarios_y_contexto(evento, datos, ticket, usuarios, comentarios):
+    """Usuarios que reciben el correo y variables de la plantilla, como las funciones notificar_* anteriores"""
+    creador = usuarios.get(ticket.id_usuario)
+    agente = usuarios.get(datos.get('id_agente', ticket.id_agente))
+    # El cambio de estado se informaba a quien lo hizo, no al creador
+    usuario = usuarios.get(evento.id_actor) if evento.tipo == CAMBIO_ESTADO else creador
+    contexto = {
+        'ticket': ticket,
+        'usuario_nombre': _nombre(usuario),
+        'sucursal_nombre': nombre_por_id('sucursal', ticket.id_sucursal, "No asignada"),
+        'agente_nombre': _nombre(agente, "Sin asignar"),
+    }
+    destinatarios = [usuario, agente]
+
+    if evento.tipo == CAMBIO_ESTADO:
+        contexto['nuevo_estado'] = nombre_por_id('estado', datos.get('id_estado'), "")
+    elif evento.tipo in (COMENTARIO, CIERRE):
+        contexto['comentario'] = comentarios.get(datos.get('id_comentario'), "")
+    elif evento.tipo == REASIGNACION:
+        anterior = usuarios.get(datos.get('id_agente_anterior'))
+        contexto['agente_anterior_nombre'] = _nombre(anterior, "Ninguno")
+        destinatarios.insert(1, anterior)
+    return destinatarios, contexto
+
+
+def _armar_correos(evento, datos, ticket, usuarios, comentarios):
+    """Destinatarios, asunto, cuerpo y agrupación del evento; [] si el ticket se eliminó antes de notificar"""
+    if ticket is None:
+        return [], None, None, None
+    destinatarios, contexto = _destinatarios_y_contexto(evento, datos, ticket, usuarios, comentarios)
+    asunto = ASUNTOS[evento.tipo].format(id=ticket.id)
+    cuerpo = PLANTILLAS[evento.tipo].render(contexto)
+    agrupacion = None if evento.tipo == CREACION else agrupacion_ticket(ticket.id)
+    correos = []
+    for destinatario in destinatarios:
+        if destinatario and destinatario.correo and destinatario.correo not in correos:
+            correos.append(destinatario.correo)
+    return correos, asunto, cuerpo, agrupacion
+
+
+def _registrar_fallo(evento, error, maximo):
+    """Reintenta el evento más tarde, o lo deja en estado "fallido" con el error"""
+    intentos = evento.intentos + 1
+    print(f"🔸 Error al preparar la notificación {evento.id} ({evento.tipo}): {str(error)}")
+    db.session.execute(update(EventoNotificacion).where(EventoNotificacion.id == evento.id).values(
+        estado=FALLIDO if intentos >= maximo else PENDIENTE,
+        intentos=intentos,
+        proximo_intento=ahora_utc() + timedelta(seconds=retraso(intentos)),
+        reclamado=None,
+        ultimo_error=f"{type(error).__name__}: {str(error)}"[:500],
+    ))
+
+
+@antes_de_enviar
+def renderizar_eventos(lote=100):
+    """Convierte los eventos pendientes en correos de la bandeja; devuelve cuántos procesó"""
+    eventos = _reclamar(lote)
+    if not eventos:
+        return 0
+    datos, errores = {}, {}
+    for evento in eventos:
+        try:
+            datos[evento.id] = _leer_datos(evento)
+        except (TypeError, ValueError) as e:
+            errores[evento.id] = e
+
+    # Una consulta por tabla para todo el lote
+    tickets = {t.id: t for t in db.session.execute(
+        select(Ticket.id, Ticket.titulo, Ticket.descripcion, Ticket.id_usuario, Ticket.id_agente, Ticket.id_sucursal)
+        .where(Ticket.id.in_({evento.id_ticket for evento in eventos}))
+    ).all()}
+    ids_usuarios = {evento.id_actor for evento in eventos}
+    for ticket in tickets.values():
+        ids_usuarios.update((ticket.id_usuario, ticket.id_agente))
+    for valores in datos.values():
+        ids_usuarios.update((valores.get('id_agente'), valores.get('id_agente_anterior')))
+    ids_usuarios.discard(None)
+    usuarios = {u.id: u for u in db.session.execute(
+        select(Usuario.id, Usuario.nombre, Usuario.apellido_paterno, Usuario.apellido_materno, Usuario.correo)
+        .where(Usuario.id.in_(ids_usuarios))
+    ).all()} if ids_usuarios else {}
+    ids_comentarios = {v['id_comentario'] for v in datos.values() if v.get('id_comentario')}
+    comentarios = dict(db.session.execute(
+        select(TicketComentario.id, TicketComentario.comentario).where(TicketComentario.id.in_(ids_comentarios))
+    ).all()) if ids_comentarios else {}
+
+    # Cada evento en su savepoint (sus correos y el borrado del evento): uno que falla no revierte a los demás
+    maximo = current_app.config.get('CORREO_MAX_INTENTOS', MAX_INTENTOS_POR_DEFECTO)
+    for evento in eventos:
+        if evento.id in errores:
+            _registrar_fallo(evento, errores[evento.id], maximo)
+            continue
+        try:
+            correos, asunto, cuerpo, agrupacion = _armar_correos(
+                evento, datos[evento.id], tickets.get(evento.id_ticket), usuarios, comentarios)
+            with db.session.begin_nested():
+                for correo in correos:
+                    encolar_correo(correo, asunto, cuerpo, agrupacion=agrupacion)
+                db.session.execute(delete(EventoNotificacion).where(EventoNotificacion.id == evento.id))
+        except Exception as e:
+            _registrar_fallo(evento, e, maximo)
+    db.session.commit()
+    return len(eventos)
@@ -0,0 +1,221 @@
+"""
+Búsqueda de texto completo sobre tickets y sus comentarios
+
+Hay dos backends según el motor de la base de datos:
+- MySQL: índices FULLTEXT sobre ticket_fact_registro(titulo, descripcion) y
+  ticket_pivot_comentario_registro(comentario). MySQL los mantiene al día
+  en cada INSERT, UPDATE y DELETE.
+- SQLite (desarrollo local y pruebas): tablas virtuales FTS5 que se
+  actualizan de forma incremental con eventos del ORM al crear, editar o
+  eliminar tickets y comentarios. create_all las crea si faltan y en ese
+  momento las llena con los tickets y comentarios que ya existen.
+"""
+import base64
+import json
+import re
+from sqlalchemy import Float, Integer, event, func, inspect, select, text, union_all
+from sqlalchemy.dialects.mysql import match
+from models import db, Ticket, TicketComentario
+from ticket_listing import consulta_tickets, serializar_ticket, leer_limite, leer_campos, ParametroInvalido
+
+# Peso del título frente a la descripción en el ranking de SQLite (bm25)
+PESO_TITULO = 5.0
+
+# 🔹 Tablas FTS5 para SQLite: el rowid es el id del ticket o del comentario
+TABLAS_FTS = {
+    'ticket_busqueda_ticket': (
+        "CREATE VIRTUAL TABLE ticket_busqueda_ticket "
+        "USING fts5(titulo, descripcion, tokenize='unicode61 remove_diacritics 2')",
+        "INSERT INTO ticket_busqueda_ticket (rowid, titulo, descripcion) "
+        "SELECT id, coalesce(titulo, ''), coalesce(descripcion, '') FROM ticket_fact_registro",
+    ),
+    'ticket_busqueda_comentario': (
+        "CREATE VIRTUAL TABLE ticket_busqueda_comentario "
+        "USING fts5(comentario, id_ticket UNINDEXED, tokenize='unicode61 remove_diacritics 2')",
+        "INSERT INTO ticket_busqueda_comentario (rowid, comentario, id_ticket) "
+        "SELECT id, coalesce(comentario, ''), id_ticket FROM ticket_pivot_comentario_registro",
+    ),
+}
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _crear_tablas_fts(metadata, conexion, **kwargs):
+    """Crea las tablas FTS5 que faltan y las llena con lo ya guardado (bases anteriores a la búsqueda)"""
+    if conexion.dialect.name != 'sqlite':
+        return
+    existentes = set(inspect(conexion).get_table_names())
+    for tabla, (crear, llenar) in TABLAS_FTS.items():
+        if tabla not in existentes:
+            conexion.execute(text(crear))
+            conexion.execute(text(llenar))
+
+
+class BusquedaMySQL:
+    """Búsqueda con MATCH ... AGAINST sobre los índices FULLTEXT"""
+
+    def subconsulta_puntajes(self, texto):
+        """Subconsulta (id_ticket, puntaje) con la relevancia sumada de ticket y comentarios"""
+        puntaje_ticket = match(Ticket.titulo, Ticket.descripcion, against=texto)
+        puntaje_comentario = match(TicketComentario.comentario, against=texto)
+        coincidencias = union_all(
+            select(Ticket.id.label('id_ticket'), puntaje_ticket.label('puntaje')).where(puntaje_ticket),
+            select(TicketComentario.id_ticket.label('id_ticket'), puntaje_comentario.label('puntaje')).where(puntaje_comentario)
+        ).subquery('coincidencias')
+        return select(
+            coincidencias.c.id_ticket,
+            func.sum(coincidencias.c.puntaje).label('puntaje')
+        ).group_by(coincidencias.c.id_ticket).subquery('busqueda')
+
+
+class BusquedaSQLite:
+    """Búsqueda con FTS5; rank (bm25) es negativo: más bajo es más relevante"""
+
+    @staticmethod
+    def _expresion_fts(texto):
+        # Cada palabra entre comillas: evita que el texto del usuario se lea como sintaxis FTS5
+        return ' '.join(f'"{palabra}"' for palabra in re.findall(r'\w+', texto))
+
+    def subconsulta_puntajes(self, texto):
+        """Subconsulta (id_ticket, puntaje) con la relevancia sumada de ticket y comentarios"""
+        return text(f"""
+            SELECT id_ticket, -SUM(puntaje) AS puntaje FROM (
+                SELECT rowid AS id_ticket, bm25(ticket_busqueda_ticket, {PESO_TITULO}, 1.0) AS puntaje
+                FROM ticket_busqueda_ticket WHERE ticket_busqueda_ticket MATCH :expresion
+                UNION ALL
+                SELECT id_ticket, bm25(ticket_busqueda_comentario) AS puntaje
+                FROM ticket_busqueda_comentario WHERE ticket_busqueda_comentario MATCH :expresion
+            ) GROUP BY id_ticket
+        """).bindparams(expresion=self._expresion_fts(texto)).columns(
+            id_ticket=Integer, puntaje=Float
+        ).subquery('busqueda')
+
+
+def backend_busqueda():
+    """Devuelve el backend de búsqueda que corresponde al motor de la base"""
+    if db.engine.dialect.name == 'sqlite':
+        return BusquedaSQLite()
+    return BusquedaMySQL()
+
+
+def leer_cursor_busqueda(cursor):
+    """Los resultados se ordenan por relevancia, así que el cursor guarda la posición"""
+    if not cursor:
+        return 0
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        tipo, posicion = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if tipo != 'busqueda' or int(posicion) < 0:
+            raise ValueError(cursor)
+        return int(posicion)
+    except (ValueError, TypeError):
+        raise ParametroInvalido('Cursor inválido')
+
+
+def codificar_cursor_busqueda(posicion):
+    return base64.urlsafe_b64encode(json.dumps(['busqueda', posicion]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def buscar_tickets(args, *criterios):
+    """
+    Busca tickets por texto en título, descripción y comentarios.
+
+    Los criterios recibidos son los de visibilidad del usuario, igual que en
+    el listado. Devuelve {"tickets": [...], "next_cursor": ...} ordenado por
+    relevancia; cada ticket incluye su "relevancia".
+    """
+    texto = (args.get('q') or '').strip()
+    if not re.search(r'\w', texto):
+        raise ParametroInvalido('El parámetro q es requerido')
+
+    limite = leer_limite(args.get('limit'))
+    campos = leer_campos(args.get('fields'))
+    posicion = leer_cursor_busqueda(args.get('cursor'))
+
+    puntajes = backend_busqueda().subconsulta_puntajes(texto)
+    filas = consulta_tickets(campos, columnas_extra=[puntajes.c.puntaje]).join(
+        puntajes, puntajes.c.id_ticket == Ticket.id
+    ).filter(*criterios).order_by(
+        puntajes.c.puntaje.desc(), Ticket.id.desc()
+    ).offset(posicion).limit(limite + 1).all()
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor_busqueda(posicion + limite)
+
+    tickets = []
+    for fila in filas:
+        ticket = serializar_ticket(fila, campos)
+        ticket['relevancia'] = round(fila.puntaje or 0, 6)
+        tickets.append(ticket)
+    return {"tickets": tickets, "next_cursor": siguiente}
+
+
+# 🔹 Mantenimiento incremental del índice FTS5 (solo SQLite)
+def _es_sqlite(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+def _indexar_ticket(connection, ticket):
+    connection.execute(text(
+        "INSERT OR REPLACE INTO ticket_busqueda_ticket (rowid, titulo, descripcion) "
+        "VALUES (:id, :titulo, :descripcion)"
+    ), {'id': ticket.id, 'titulo': ticket.titulo or '', 'descripcion': ticket.descripcion or ''})
+
+
+def _indexar_comentario(connection, comentario):
+    connection.execute(text(
+        "INSERT OR REPLACE INTO ticket_busqueda_comentario (rowid, comentario, id_ticket) "
+        "VALUES (:id, :comentario, :id_ticket)"
+    ), {'id': comentario.id, 'comentario': comentario.comentario or '', 'id_ticket': comentario.id_ticket})
+
+
+def _texto_modificado(objeto, *atributos):
+    estado = inspect(objeto)
+    return any(estado.attrs[atributo].history.has_changes() for atributo in atributos)
+
+
+def indexar_insertados(conexion, filas):
+    """Agrega al índice tickets insertados sin pasar por el ORM (importación masiva)"""
+    if _es_sqlite(conexion) and filas:
+        conexion.execute(text(
+            "INSERT OR REPLACE INTO ticket_busqueda_ticket (rowid, titulo, descripcion) "
+            "VALUES (:id, :titulo, :descripcion)"
+        ), [{'id': f['id'], 'titulo': f['titulo'] or '', 'descripcion': f['descripcion'] or ''} for f in filas])
+
+
+@event.listens_for(Ticket, 'after_insert')
+def _agregar_ticket_al_indice(mapper, connection, ticket):
+    if _es_sqlite(connection):
+        _indexar_ticket(connection, ticket)
+
+
+@event.listens_for(Ticket, 'after_update')
+def _actualizar_ticket_en_indice(mapper, connection, ticket):
+    if _es_sqlite(connection) and _texto_modificado(ticket, 'titulo', 'descripcion'):
+        _indexar_ticket(connection, ticket)
+
+
+@event.listens_for(Ticket, 'after_delete')
+def _quitar_ticket_del_indice(mapper, connection, ticket):
+    if _es_sqlite(connection):
+        connection.execute(text("DELETE FROM ticket_busqueda_ticket WHERE rowid = :id"), {'id': ticket.id})
+        connection.execute(text("DELETE FROM ticket_busqueda_comentario WHERE id_ticket = :id"), {'id': ticket.id})
+
+
+@event.listens_for(TicketComentario, 'after_insert')
+def _agregar_comentario_al_indice(mapper, connection, comentario):
+    if _es_sqlite(connection):
+        _indexar_comentario(connection, comentario)
+
+
+@event.listens_for(TicketComentario, 'after_update')
+def _actualizar_comentario_en_indice(mapper, connection, comentario):
+    if _es_sqlite(connection) and _texto_modificado(comentario, 'comentario'):
+        _indexar_comentario(connection, comentario)
+
+
+@event.listens_for(TicketComentario, 'after_delete')
+def _quitar_comentario_del_indice(mapper, connection, comentario):
+    if _es_sqlite(connection):
+        connection.execute(text("DELETE FROM ticket_busqueda_comentario WHERE rowid = :id"), {'id': comentario.id})
@@ -0,0 +1,194 @@
+"""
+Métricas de SLA: tiempo hasta la primera asignación y hasta el cierre
+
+Los tiempos se guardan como histogramas diarios en HistogramaSLA (día del
+evento, métrica, dimensión, valor, cubeta logarítmica -> cantidad). Un
+proceso programado (compute_sla_histograms.py) los calcula a partir de
+ticket_fact_registro; /tickets/sla suma las cubetas del rango pedido y
+calcula los percentiles sin leer los tickets.
+
+Las cubetas crecen un FACTOR_CUBETA por vez, así que el percentil devuelto
+tiene un error relativo menor a ese factor (≈10 %).
+
+La base de datos agrupa los tickets por día, valor y cubeta (GROUP BY sobre
+la expresión de la cubeta), así que el cálculo de años de historia lee las
+cantidades por grupo y no las filas de los tickets.
+"""
+import math
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, func, inspect, select, text
+from models import db, CHILE_TZ, Ticket, HistogramaSLA
+from ticket_listing import leer_fecha, ParametroInvalido
+from ticket_stats import nombres_dimension, NOMBRES
+
+# Cada cubeta cubre duraciones (en minutos) entre FACTOR_CUBETA**k - 1 y FACTOR_CUBETA**(k+1) - 1
+FACTOR_CUBETA = 1.1
+LOG_FACTOR = math.log(FACTOR_CUBETA)
+
+# Métrica -> columna con la fecha del evento
+METRICAS = {
+    'asignacion': 'fecha_primera_asignacion',
+    'cierre': 'fecha_cierre',
+}
+
+# Dimensión -> atributo de Ticket
+DIMENSIONES = {
+    'departamento': 'id_departamento',
+    'categoria': 'id_categoria',
+    'agente': 'id_agente',
+}
+
+PERCENTILES = (50, 90, 99)
+
+# Rango de /tickets/sla cuando no se envía desde
+DIAS_POR_DEFECTO = 30
+
+# Valor guardado para las dimensiones vacías (ticket sin agente)
+SIN_VALOR = ''
+
+
+# 🔹 Registro de la primera asignación
+@event.listens_for(Ticket, 'before_insert')
+def _asignado_al_crear(mapper, connection, ticket):
+    if ticket.id_agente and ticket.fecha_primera_asignacion is None:
+        ticket.fecha_primera_asignacion = datetime.now(CHILE_TZ)
+
+
+@event.listens_for(Ticket, 'before_update')
+def _asignado_al_actualizar(mapper, connection, ticket):
+    # Solo si antes no tenía agente: los tickets anteriores a esta columna no tienen
+    # fecha de primera asignación y una reasignación no debe inventarla
+    historial = inspect(ticket).attrs.id_agente.history
+    if ticket.id_agente and ticket.fecha_primera_asignacion is None and historial.has_changes() and not any(historial.deleted):
+        ticket.fecha_primera_asignacion = datetime.now(CHILE_TZ)
+
+
+# 🔹 Cubetas
+def cubeta(minutos):
+    return int(math.log1p(minutos) / LOG_FACTOR)
+
+
+def valor_cubeta(indice):
+    """Duración representativa (en minutos) de la cubeta: el punto medio de sus límites"""
+    return (FACTOR_CUBETA ** indice + FACTOR_CUBETA ** (indice + 1)) / 2 - 1
+
+
+def _valor(valor):
+    return SIN_VALOR if valor is None else str(valor)
+
+
+# 🔹 Agregación de tickets en histogramas
+def _minutos(dialecto, inicio, fin):
+    if dialecto == 'sqlite':
+        return (func.julianday(fin) - func.julianday(inicio)) * 1440.0
+    return func.timestampdiff(text('SECOND'), inicio, fin) / 60.0
+
+
+def contar_eventos(metrica, dimension, desde=None, hasta=None):
+    """Filas (día, valor, cubeta, cantidad) de los eventos de la métrica con día en [desde, hasta)"""
+    evento = getattr(Ticket, METRICAS[metrica])
+    valor = getattr(Ticket, DIMENSIONES[dimension])
+    minutos = _minutos(db.session.get_bind().dialect.name, Ticket.fecha_creacion, evento)
+    dia = func.date(evento)
+    indice = func.floor(func.ln(1 + minutos) / LOG_FACTOR)
+
+    condiciones = [evento.isnot(None), Ticket.fecha_creacion.isnot(None), evento >= Ticket.fecha_creacion]
+    if desde:
+        condiciones.append(evento >= desde)
+    if hasta:
+        condiciones.append(evento < hasta)
+    return db.session.execute(
+        select(dia, valor, indice, func.count()).where(*condiciones).group_by(dia, valor, indice)
+    ).all()
+
+
+def calcular_histogramas(desde=None, hasta=None):
+    """
+    Recalcula los histogramas de los días en [desde, hasta); sin fechas,
+    toda la historia. Una consulta agrupada por métrica y dimensión.
+    Devuelve la cantidad de filas escritas.
+    """
+    conteo = Counter()
+    for metrica in METRICAS:
+        for dimension in DIMENSIONES:
+            for dia, valor, indice, cantidad in contar_eventos(metrica, dimension, desde, hasta):
+                if isinstance(dia, str):
+                    dia = date.fromisoformat(dia)  # SQLite devuelve date() como texto
+                conteo[(dia, metrica, dimension, _valor(valor), int(indice))] += cantidad
+
+    tabla = HistogramaSLA.__table__
+    borrado = tabla.delete()
+    if desde:
+        borrado = borrado.where(tabla.c.fecha >= desde)
+    if hasta:
+        borrado = borrado.where(tabla.c.fecha < hasta)
+    db.session.execute(borrado)
+    if conteo:
+        db.session.execute(tabla.insert(), [{
+            'fecha': fecha, 'metrica': metrica, 'dimension': dimension,
+            'valor': valor, 'cubeta': indice, 'cantidad': cantidad
+        } for (fecha, metrica, dimension, valor, indice), cantidad in sorted(conteo.items())])
+    db.session.commit()
+    return len(conteo)
+
+
+# 🔹 Lectura de percentiles
+def percentiles(cubetas):
+    """Percentiles (en horas) de un histograma {cubeta: cantidad}"""
+    total = sum(cubetas.values())
+    resultado = {"cantidad": total, **{f"p{p}_horas": None for p in PERCENTILES}}
+    ordenadas = sorted(cubetas.items())
+    for percentil in PERCENTILES:
+        objetivo = percentil / 100 * total
+        acumulado = 0
+        for indice, cantidad in ordenadas:
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                resultado[f"p{percentil}_horas"] = round(valor_cubeta(indice) / 60, 2)
+                break
+    return resultado
+
+
+def _leer_dia(valor):
+    return leer_fecha(valor).date() if valor else None
+
+
+def obtener_sla(args):
+    """
+    Percentiles p50, p90 y p99 de tiempo hasta la primera asignación y hasta
+    el cierre, por departamento, categoría y agente, para los eventos con
+    día en [desde, hasta] (por defecto, los últimos DIAS_POR_DEFECTO días).
+    """
+    hasta = _leer_dia(args.get('hasta')) or datetime.now(CHILE_TZ).date()
+    desde = _leer_dia(args.get('desde')) or hasta - timedelta(days=DIAS_POR_DEFECTO)
+    if desde > hasta:
+        raise ParametroInvalido('desde debe ser anterior a hasta')
+    dimensiones = [d.strip() for d in args.get('dimension', '').split(',') if d.strip()] or list(DIMENSIONES)
+    for dimension in dimensiones:
+        if dimension not in DIMENSIONES:
+            raise ParametroInvalido(f"Dimensión no disponible: {dimension}. Opciones: {', '.join(DIMENSIONES)}")
+
+    filas = db.session.execute(
+        select(HistogramaSLA.dimension, HistogramaSLA.valor, HistogramaSLA.metrica,
+               HistogramaSLA.cubeta, func.sum(HistogramaSLA.cantidad))
+        .where(HistogramaSLA.fecha >= desde, HistogramaSLA.fecha <= hasta,
+               HistogramaSLA.dimension.in_(dimensiones))
+        .group_by(HistogramaSLA.dimension, HistogramaSLA.valor, HistogramaSLA.metrica, HistogramaSLA.cubeta)
+    ).all()
+
+    histogramas = {dimension: {} for dimension in dimensiones}
+    for dimension, valor, metrica, indice, cantidad in filas:
+        por_metrica = histogramas[dimension].setdefault(valor, {m: {} for m in METRICAS})
+        por_metrica[metrica][indice] = int(cantidad)
+
+    resultado = {"desde": desde.isoformat(), "hasta": hasta.isoformat()}
+    for dimension, por_valor in histogramas.items():
+        nombres = nombres_dimension(dimension, por_valor)
+        tipo_id = NOMBRES[dimension][0].type.python_type
+        resultado[dimension] = [{
+            "id": None if valor == SIN_VALOR else tipo_id(valor),
+            "nombre": "Sin asignar" if valor == SIN_VALOR else nombres.get(valor),
+            **{metrica: percentiles(cubetas) for metrica, cubetas in por_metrica.items()}
+        } for valor, por_metrica in sorted(por_valor.items())]
+    return resultado
@@ -0,0 +1,213 @@
+"""
+Estadísticas de tickets con resúmenes mantenidos de forma incremental
+
+ResumenTicket guarda cuántos tickets hay por estado, departamento, agente,
+sucursal y prioridad, en dos tipos de ámbito: por departamento y por
+creador del ticket (los mismos de la visibilidad, ver change_versions.py).
+Cada alta, cambio o eliminación de un ticket ajusta esos contadores con
+eventos del ORM, dentro de la misma transacción que la escritura, así que
+/tickets/stats lee una fila por grupo en vez de recorrer los tickets.
+Los ajustes se ejecutan en after_flush sobre la conexión de la sesión: si la
+petición se revierte después del flush, se revierten con ella. Esto supone
+que la conexión no usa autocommit (ver cloud_sql_config.py); lo mismo vale
+para las cargas de ticket_assignment.py y las versiones de change_versions.py.
+
+reconstruir_resumen() los recalcula desde cero (ver rebuild_ticket_stats.py).
+"""
+from collections import Counter
+from sqlalchemy import event, inspect, select, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, object_session
+from models import (db, Ticket, TicketEstado, TicketPrioridad, Departamento, Sucursal, Categoria,
+                    Usuario, ResumenTicket)
+from change_versions import ambito_departamento, ambito_usuario
+
+# Dimensiones del resumen: nombre -> atributo de Ticket
+DIMENSIONES = {
+    'estado': 'id_estado',
+    'departamento': 'id_departamento',
+    'agente': 'id_agente',
+    'sucursal': 'id_sucursal',
+    'prioridad': 'id_prioridad',
+}
+
+# Ámbitos en los que se cuenta cada ticket: atributo de Ticket -> nombre del ámbito
+AMBITOS = {
+    'id_departamento': ambito_departamento,
+    'id_usuario': ambito_usuario,
+}
+
+CLAVE_SESION = 'resumen_tickets'
+
+# Valor guardado para las dimensiones vacías (ticket sin agente)
+SIN_VALOR = ''
+
+
+def _valor(valor):
+    return SIN_VALOR if valor is None else str(valor)
+
+
+def _valores_ticket(ticket, anteriores=False):
+    """Valores actuales (o anteriores al flush) de los atributos que usa el resumen"""
+    estado = inspect(ticket)
+    valores = {}
+    for atributo in set(DIMENSIONES.values()) | set(AMBITOS):
+        historial = estado.attrs[atributo].history
+        if anteriores and historial.deleted:
+            valores[atributo] = historial.deleted[0]
+        else:
+            valores[atributo] = getattr(ticket, atributo)
+    return valores
+
+
+def _contar(cambios, valores, signo):
+    for atributo_ambito, nombre_ambito in AMBITOS.items():
+        ambito = nombre_ambito(valores[atributo_ambito])
+        for dimension, atributo in DIMENSIONES.items():
+            cambios[(ambito, dimension, _valor(valores[atributo]))] += signo
+
+
+def _cambios_sesion(ticket):
+    sesion = object_session(ticket)
+    return sesion.info.setdefault(CLAVE_SESION, Counter()) if sesion is not None else Counter()
+
+
+@event.listens_for(Ticket, 'after_insert')
+def _ticket_creado(mapper, connection, ticket):
+    _contar(_cambios_sesion(ticket), _valores_ticket(ticket), 1)
+
+
+@event.listens_for(Ticket, 'after_update')
+def _ticket_actualizado(mapper, connection, ticket):
+    anteriores = _valores_ticket(ticket, anteriores=True)
+    actuales = _valores_ticket(ticket)
+    if anteriores != actuales:
+        cambios = _cambios_sesion(ticket)
+        _contar(cambios, anteriores, -1)
+        _contar(cambios, actuales, 1)
+
+
+@event.listens_for(Ticket, 'after_delete')
+def _ticket_eliminado(mapper, connection, ticket):
+    _contar(_cambios_sesion(ticket), _valores_ticket(ticket, anteriores=True), -1)
+
+
+def sentencia_suma(dialecto, cambios):
+    """INSERT ... que suma cada cambio a su contador, creándolo si no existe"""
+    tabla = ResumenTicket.__table__
+    valores = [
+        {'ambito': ambito, 'dimension': dimension, 'valor': valor, 'cantidad': cantidad}
+        for (ambito, dimension, valor), cantidad in sorted(cambios.items())
+    ]
+    if dialecto == 'mysql':
+        sentencia = mysql_insert(tabla).values(valores)
+        return sentencia.on_duplicate_key_update(cantidad=tabla.c.cantidad + sentencia.inserted.cantidad)
+    sentencia = sqlite_insert(tabla).values(valores)
+    return sentencia.on_conflict_do_update(
+        index_elements=[tabla.c.ambito, tabla.c.dimension, tabla.c.valor],
+        set_={'cantidad': tabla.c.cantidad + sentencia.excluded.cantidad}
+    )
+
+
+@event.listens_for(Session, 'after_flush')
+def _aplicar_cambios(session, flush_context):
+    cambios = session.info.pop(CLAVE_SESION, None)
+    cambios = {clave: cantidad for clave, cantidad in (cambios or {}).items() if cantidad}
+    if cambios:
+        conexion = session.connection()
+        conexion.execute(sentencia_suma(conexion.dialect.name, cambios))
+
+
+def sumar_insertados(conexion, filas):
+    """Suma a los contadores tickets insertados sin pasar por el ORM (importación masiva)"""
+    cambios = Counter()
+    for fila in filas:
+        _contar(cambios, fila, 1)
+    cambios = {clave: cantidad for clave, cantidad in cambios.items() if cantidad}
+    if cambios:
+        conexion.execute(sentencia_suma(conexion.dialect.name, cambios))
+
+
+# 🔹 Lectura
+# Catálogo con el nombre de cada dimensión: dimension -> (columna id, columnas del nombre)
+# (también lo usan las métricas de SLA, que agregan la categoría)
+NOMBRES = {
+    'estado': (TicketEstado.id, [TicketEstado.nombre]),
+    'departamento': (Departamento.id, [Departamento.nombre]),
+    'agente': (Usuario.id, [Usuario.nombre, Usuario.apellido_paterno, Usuario.apellido_materno]),
+    'sucursal': (Sucursal.id, [Sucursal.nombre]),
+    'prioridad': (TicketPrioridad.id, [TicketPrioridad.nombre]),
+    'categoria': (Categoria.id, [Categoria.nombre]),
+}
+
+
+def nombres_dimension(dimension, valores):
+    """Nombre de cada id de la dimensión, en una consulta"""
+    columna_id, columnas_nombre = NOMBRES[dimension]
+    ids = [columna_id.type.python_type(v) for v in valores if v != SIN_VALOR]
+    if not ids:
+        return {}
+    filas = db.session.execute(select(columna_id, *columnas_nombre).where(columna_id.in_(ids)))
+    if dimension == 'agente':
+        return {str(fila[0]): Usuario.formatear_nombre(*fila[1:]) for fila in filas}
+    return {str(fila[0]): fila[1] for fila in filas}
+
+
+def obtener_estadisticas(principal):
+    """
+    Cantidad de tickets visibles para el usuario por estado, departamento,
+    agente, sucursal y prioridad.
+
+    Administradores suman todos los ámbitos de departamento, agentes los de
+    sus departamentos y los demás usuarios el de los tickets que crearon.
+    """
+    if principal.es_administrador:
+        filtro = ResumenTicket.ambito.like(ambito_departamento('%'))
+    elif principal.es_agente:
+        filtro = ResumenTicket.ambito.in_([ambito_departamento(d) for d in principal.departamentos])
+    else:
+        filtro = ResumenTicket.ambito == ambito_usuario(principal.id)
+
+    filas = db.session.execute(
+        select(ResumenTicket.dimension, ResumenTicket.valor, func.sum(ResumenTicket.cantidad))
+        .where(filtro)
+        .group_by(ResumenTicket.dimension, ResumenTicket.valor)
+    ).all()
+
+    por_dimension = {dimension: {} for dimension in DIMENSIONES}
+    for dimension, valor, cantidad in filas:
+        if cantidad:
+            por_dimension[dimension][valor] = int(cantidad)
+
+    resultado = {"total": sum(por_dimension['estado'].values())}
+    for dimension, cantidades in por_dimension.items():
+        nombres = nombres_dimension(dimension, cantidades)
+        tipo_id = NOMBRES[dimension][0].type.python_type
+        resultado[f"por_{dimension}"] = sorted([{
+            "id": None if valor == SIN_VALOR else tipo_id(valor),
+            "nombre": "Sin asignar" if valor == SIN_VALOR else nombres.get(valor),
+            "cantidad": cantidad
+        } for valor, cantidad in cantidades.items()], key=lambda g: -g["cantidad"])
+    return resultado
+
+
+# 🔹 Reconstrucción
+def reconstruir_resumen():
+    """Recalcula todos los contadores desde ticket_fact_registro"""
+    db.session.execute(ResumenTicket.__table__.delete())
+    for atributo_ambito, nombre_ambito in AMBITOS.items():
+        columna_ambito = getattr(Ticket, atributo_ambito)
+        for dimension, atributo in DIMENSIONES.items():
+            columna = getattr(Ticket, atributo)
+            filas = db.session.execute(
+                select(columna_ambito, columna, func.count()).group_by(columna_ambito, columna)
+            ).all()
+            if filas:
+                db.session.execute(ResumenTicket.__table__.insert(), [{
+                    'ambito': nombre_ambito(valor_ambito),
+                    'dimension': dimension,
+                    'valor': _valor(valor),
+                    'cantidad': cantidad
+                } for valor_ambito, valor, cantidad in filas])
+    db.session.commit()
@@ -7,7 +7,6 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
-import threading
 import logging
 from datetime import datetime
 from pathlib import Path
@@ -45,6 +44,16 @@ SMTP_CLAVE = os.getenv("SMTP_CLAVE")
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SMTP_DISPLAY_NAME = os.getenv("SMTP_DISPLAY_NAME", "Sistema de Tickets")
+# Solo el servidor local de pruebas (smtp_local.py) se usa sin STARTTLS
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+
+def construir_mensaje(destinatario, asunto, cuerpo):
+    msg = MIMEMultipart()
+    msg['From'] = f"{SMTP_DISPLAY_NAME} <{SMTP_USUARIO}>"
+    msg['To'] = destinatario
+    msg['Subject'] = asunto
+    msg.attach(MIMEText(cuerpo, 'html'))
+    return msg
 
 def enviar_correo(destinatario, asunto, cuerpo):
     try:
@@ -54,11 +63,7 @@ def enviar_correo(destinatario, asunto, cuerpo):
             return False
 
         # Crear mensaje
-        msg = MIMEMultipart()
-        msg['From'] = f"{SMTP_DISPLAY_NAME} <{SMTP_USUARIO}>"
-        msg['To'] = destinatario
-        msg['Subject'] = asunto
-        msg.attach(MIMEText(cuerpo, 'html'))
+        msg = construir_mensaje(destinatario, asunto, cuerpo)
 
         # Conectar al servidor SMTP usando TLS (STARTTLS)
         try:
@@ -118,13 +123,14 @@ def enviar_correo(destinatario, asunto, cuerpo):
         logging.error(traceback.format_exc())
         return False
 
-def enviar_correo_async(destinatario, asunto, cuerpo):
-    thread = threading.Thread(
-        target=enviar_correo,
-        args=(destinatario, asunto, cuerpo)
-    )
-    thread.daemon = True
-    thread.start()
+def enviar_correo_async(destinatario, asunto, cuerpo, agrupacion=None):
+    """
+    Deja el correo en la bandeja de salida dentro de la transacción actual:
+    se envía después del commit (y no se envía si se revierte). Los correos
+    con la misma agrupacion se combinan en uno. Ver email_outbox.py
+    """
+    from email_outbox import encolar_correo  # email_outbox importa este módulo
+    encolar_correo(destinatario, asunto, cuerpo, agrupacion=agrupacion)
 
 def role_required(required_role):
     def decorator(func):